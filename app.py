@@ -1,22 +1,35 @@
+from core import startup  # first, so startup timings include the imports below
 import streamlit as st
-from core.database import init_db
+from core.database import init_db, set_tenant
+from core import balances, maintenance, profiling, stats
 from ui.sidebar import sidebar_user_section
 from ui.admin import admin_dashboard_button
 from ui.accounts_view import show_accounts_view
 from ui.balances_view import show_balances_view
 from ui.transactions_view import show_transactions_view
 
+startup.mark("imported")
+
 st.set_page_config(page_title="💰 Money Magic", layout="wide")
+profiling.start_rerun()
 st.title("💰 Money Magic")
 st.caption("Lite Version for handling finance transactions v2.0")
-# Initialize DB
-init_db()
+# Initialize DB (checked once per process; later reruns return at once)
+with startup.phase("init_db"):
+    init_db()
+stats.start_reconciler()
+maintenance.start_scheduler()
+balances.start_rollover()
 
 # Sidebar handles authentication
+set_tenant(None)
 user = sidebar_user_section()
 if not user:
     st.info("Please login or register from the sidebar.")
+    startup.mark("first_render")
     st.stop()
+# Reads and writes below go to this user's database when sharding is on
+set_tenant(user["id"])
 
 # Admin button (if admin)
 admin_dashboard_button(user)
@@ -29,3 +42,5 @@ with left_col:
 
 with main_col:
     show_transactions_view(user)
+
+startup.mark("first_render")
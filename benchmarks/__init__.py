@@ -0,0 +1,6 @@
+"""
+Synthetic data generation and timing harness for the core data paths.
+
+    python -m benchmarks.generate --db /tmp/bench.db --transactions 100000
+    python -m benchmarks.run --db /tmp/bench.db --out results.json
+"""
@@ -0,0 +1,134 @@
+"""
+Seeded generator that fills a fresh database (schema from init_db) with
+users, accounts, opening balances and transactions.
+
+    python -m benchmarks.generate --db /tmp/bench.db --transactions 1000000 --users 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from passlib.hash import pbkdf2_sha256
+import core.database as database
+from core.transactions import date_fields
+from core.balances import previous_month
+
+PASSWORD = "benchmark"
+
+CATEGORIES = [
+    "Food", "Transport", "Bills", "Shopping", "Rent", "Salary",
+    "Payment", "Investment", "Entertainment", "Health", "Education", "Other",
+]
+MERCHANTS = [
+    "Amazon", "Swiggy", "Zomato", "Uber", "Ola", "BigBasket", "Flipkart", "Airtel",
+    "Jio", "BESCOM", "Netflix", "Apollo Pharmacy", "Shell", "IRCTC", "Myntra", "DMart",
+]
+
+CHUNK_SIZE = 10000
+
+
+def _last_months(n):
+    # YYYYMM for this month and the n - 1 before it
+    today = date.today()
+    months = [today.year * 100 + today.month]
+    while len(months) < n:
+        months.append(previous_month(months[-1]))
+    return months
+
+
+def generate(path, transactions=1000, users=10, accounts_per_user=4, years=3, seed=42, progress=None):
+    """
+    Create `path` and fill it. Transactions are spread evenly over users and
+    uniformly over the last `years` years. Returns counts of what was written.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists; generate into a new file")
+    rng = random.Random(seed)
+    database.DB_PATH = path
+    database.init_db()
+    conn = database.get_conn()
+    password_hash = pbkdf2_sha256.hash(PASSWORD)
+    now = datetime.utcnow().isoformat()
+
+    with database.transaction() as c:
+        c.executemany(
+            "INSERT INTO users (id, username, password_hash, display_name, email, is_admin, created_at) "
+            "VALUES (?,?,?,?,?,?,?)",
+            [(u, f"user{u}", password_hash, f"User {u}", f"user{u}@example.com", int(u == 1), now)
+             for u in range(1, users + 1)],
+        )
+        accounts = []
+        for u in range(1, users + 1):
+            for i in range(accounts_per_user):
+                accounts.append((len(accounts) + 1, f"Account {i + 1}", "Credit" if i % 3 == 2 else "Debit", "", u))
+        c.executemany("INSERT INTO accounts (id, name, type, notes, user_id) VALUES (?,?,?,?,?)", accounts)
+        c.executemany(
+            "INSERT INTO balances (year_month, account_id, opening_cents, user_id) VALUES (?,?,?,?)",
+            [(ym, a[0], rng.randrange(0, 50_000_00), a[4]) for a in accounts for ym in _last_months(12)],
+        )
+        c.executemany(
+            "INSERT INTO categories (id, user_id, name) VALUES (?,?,?)",
+            [((u - 1) * len(CATEGORIES) + i + 1, u, name)
+             for u in range(1, users + 1) for i, name in enumerate(CATEGORIES)],
+        )
+
+    by_user = {}
+    for a in accounts:
+        by_user.setdefault(a[4], []).append(a[0])
+    end = date.today()
+    span = years * 365
+    written = 0
+    while written < transactions:
+        n = min(CHUNK_SIZE, transactions - written)
+        rows = []
+        for k in range(n):
+            user_id = (written + k) % users + 1
+            tx_date = end - timedelta(days=rng.randrange(span))
+            raw_date, day, year_month = date_fields(tx_date)
+            income = rng.random() < 0.1
+            category = "Salary" if income else rng.choice(CATEGORIES)
+            amount_cents = rng.randrange(20_000_00, 150_000_00) if income else int(rng.lognormvariate(6.5, 1.2) * 100)
+            rows.append((
+                str(uuid.UUID(int=rng.getrandbits(128), version=4)), raw_date, day, year_month,
+                rng.choice(by_user[user_id]), category,
+                (user_id - 1) * len(CATEGORIES) + CATEGORIES.index(category) + 1,
+                f"{rng.choice(MERCHANTS)} {rng.randrange(10000)}", "Income" if income else "Expense",
+                amount_cents, user_id, now,
+            ))
+        with database.transaction() as c:
+            c.executemany(
+                "INSERT INTO transactions (tx_uuid, date, tx_date, year_month, account_id, category, category_id, "
+                "description, type, amount_cents, user_id, created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                rows,
+            )
+        written += n
+        if progress:
+            progress(written, transactions)
+    conn.execute("ANALYZE")
+    return {"users": users, "accounts": len(accounts), "transactions": written}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.generate", description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--db", required=True, help="database file to create")
+    ap.add_argument("--transactions", type=int, default=1000)
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--accounts-per-user", type=int, default=4)
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    started = time.perf_counter()
+    counts = generate(
+        args.db, args.transactions, args.users, args.accounts_per_user, args.years, args.seed,
+        progress=lambda done, total: print(f"\r{done:,}/{total:,} transactions", end="", file=sys.stderr),
+    )
+    print(file=sys.stderr)
+    print(f"{counts} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
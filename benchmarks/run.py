@@ -0,0 +1,199 @@
+"""
+Time the core data paths against a generated database and write the
+results as JSON.
+
+    python -m benchmarks.run --db /tmp/bench.db --out results.json
+
+Reads are timed through each function's `.uncached` variant (the cost of a
+cold rerun) and once more through the cache (a warm rerun). Writes commit
+for real (that is part of their cost) and are undone after timing, so a run
+leaves the data as it found it and results stay comparable across runs.
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import threading
+import time
+from datetime import date, datetime
+import core.database as database
+from core import cache
+from core.accounts import get_accounts
+from core.auth import verify_user
+from core.balances import get_opening, set_opening, set_openings
+from core.reports import account_summary
+from core.transactions import (
+    apply_changes, count_transactions, fetch_transactions, fetch_transactions_page,
+)
+from core.utils import MONTHS
+from benchmarks.generate import PASSWORD
+
+
+def timed(fn, repeat=5, warmup=1):
+    """Run fn() warmup + repeat times; returns timing stats in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def _pick_user(conn):
+    """The user with the most transactions, so per-user timings are worst-case."""
+    row = conn.execute(
+        "SELECT user_id, COUNT(*) FROM transactions GROUP BY user_id ORDER BY 2 DESC LIMIT 1"
+    ).fetchone()
+    return row[0] if row else 1
+
+
+def filter_cases(user_id, account_ids, category_ids=()):
+    """The filter combinations the transactions view can send."""
+    today = date.today()
+    this_month = MONTHS[today.month - 1]
+    start = date(today.year, 1, 1)
+    return {
+        "all": {},
+        "month": {"month_filter": this_month, "year": today.year},
+        "date_range": {"start_date": start, "end_date": today},
+        "accounts": {"account_ids": account_ids[:2]},
+        "types": {"types": ["Expense"]},
+        "month_accounts_types": {
+            "month_filter": this_month, "year": today.year,
+            "account_ids": account_ids[:2], "types": ["Income", "Expense"],
+        },
+        "range_accounts": {"start_date": start, "end_date": today, "account_ids": account_ids[:1]},
+        "categories": {"category_ids": list(category_ids[:2])},
+    }
+
+
+def run(path, repeat=5):
+    database.DB_PATH = path
+    conn = database.get_conn()
+    user_id = _pick_user(conn)
+    username = conn.execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    account_ids = [r[0] for r in conn.execute("SELECT id FROM accounts WHERE user_id = ? ORDER BY id", (user_id,))]
+    category_ids = [r[0] for r in conn.execute("SELECT id FROM categories WHERE user_id = ? ORDER BY id", (user_id,))]
+    today = date.today()
+    month = MONTHS[today.month - 1]
+    period = today.year * 100 + today.month
+    results = {}
+
+    for name, filters in filter_cases(user_id, account_ids, category_ids).items():
+        results[f"fetch_transactions[{name}]"] = dict(
+            timed(lambda: fetch_transactions.uncached(user_id=user_id, **filters), repeat),
+            rows=len(fetch_transactions.uncached(user_id=user_id, **filters)),
+        )
+        results[f"fetch_transactions_page[{name}]"] = timed(
+            lambda: fetch_transactions_page.uncached(user_id=user_id, **filters), repeat
+        )
+        results[f"count_transactions[{name}]"] = timed(
+            lambda: count_transactions.uncached(user_id=user_id, **filters), repeat
+        )
+    results["fetch_transactions[all, admin]"] = timed(
+        lambda: fetch_transactions.uncached(user_id=user_id, is_admin=True, month_filter=month, year=today.year),
+        repeat,
+    )
+    cache.clear()
+    before = cache.stats()
+    results["fetch_transactions[all, cached]"] = timed(lambda: fetch_transactions(user_id=user_id), repeat)
+    after = cache.stats()
+    results["fetch_transactions[all, cached]"].update(
+        cache_hits=after["hits"] - before["hits"], cache_misses=after["misses"] - before["misses"],
+    )
+
+    results["get_accounts"] = timed(lambda: get_accounts.uncached(user_id), repeat)
+    results["get_accounts[admin]"] = timed(lambda: get_accounts.uncached(user_id, is_admin=True), repeat)
+    results["get_opening"] = timed(lambda: get_opening.uncached(period, account_ids[0], user_id), repeat)
+    originals = {a: get_opening.uncached(period, a, user_id) for a in account_ids}
+    results["set_opening"] = timed(lambda: set_opening(period, account_ids[0], 1234.5, user_id), repeat)
+    results["set_openings"] = timed(
+        lambda: set_openings(period, {a: 1234.5 for a in account_ids}, user_id), repeat
+    )
+    set_openings(period, originals, user_id)
+    results["account_summary"] = timed(lambda: account_summary.uncached(user_id, period), repeat)
+    results["account_summary[admin]"] = timed(lambda: account_summary.uncached(user_id, period, is_admin=True), repeat)
+
+    # the editor's save path: one page of rows edited at once
+    page, _ = fetch_transactions_page.uncached(user_id=user_id)
+    updates = [(u, {"description": f"edited {i}", "amount": 99.99}) for i, u in enumerate(page["Transaction_ID"])]
+    results[f"apply_changes[{len(updates)} updates]"] = timed(lambda: apply_changes(updates=updates, user_id=user_id), repeat)
+    apply_changes(updates=[
+        (u, {"description": d, "amount": a})
+        for u, d, a in zip(page["Transaction_ID"], page["Description"], page["Amount"])
+    ], user_id=user_id)
+
+    # many sessions saving at once: each thread adds rows, then they are removed again
+    def concurrent_writes(sessions=50, per_session=10):
+        added = [[] for _ in range(sessions)]
+
+        def session(i):
+            for k in range(per_session):
+                added[i] += apply_changes(inserts=[{
+                    "date": today, "account_id": account_ids[0], "category": "Other",
+                    "description": f"bench {i}-{k}", "type": "Expense", "amount": 1, "user_id": user_id,
+                }], user_id=user_id)
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        apply_changes(deletes=[u for part in added for u in part], user_id=user_id)
+        return elapsed, sessions * per_session
+
+    elapsed, writes = concurrent_writes()
+    results["concurrent_writes[50 sessions]"] = {
+        "writes": writes, "total_ms": round(elapsed * 1000, 3), "writes_per_s": round(writes / elapsed, 1),
+    }
+
+    results["verify_user"] = timed(lambda: verify_user(username, PASSWORD), repeat)
+
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ("users", "accounts", "balances", "transactions")}
+    return {
+        "meta": {
+            "database": path,
+            "counts": counts,
+            "user_id": user_id,
+            "repeat": repeat,
+            "sqlite_version": sqlite3.sqlite_version,
+            "python": platform.python_version(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--db", required=True, help="database made by benchmarks.generate")
+    ap.add_argument("--out", help="write results JSON here (default: stdout)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    report = run(args.db, args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        for name, r in report["results"].items():
+            print(f"{name:50s} {r.get('median_ms', r.get('total_ms')):10.2f} ms")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,15 @@
-from core.database import query
+from core.database import query, routed, scatter, owner
+from core.writer import queued
+from core.cache import cached, bump
 
+
+def _merge_accounts(func, call):
+    rows = [r for part in scatter(lambda _: func(**call)) for r in part]
+    return sorted(rows, key=lambda r: r["name"])
+
+
+@cached
+@routed(merge=_merge_accounts)
 def get_accounts(user_id, is_admin=False):
     """
     Fetch all accounts for a specific user.
@@ -16,6 +26,8 @@ def get_accounts(user_id, is_admin=False):
     return [dict(r) for r in rows] if rows else []
 
 
+@routed()
+@queued
 def add_account(name, atype, notes='', user_id=None):
     """
     Add a new account for this user.
@@ -25,11 +37,15 @@ def add_account(name, atype, notes='', user_id=None):
         (name, atype, notes, user_id),
         commit=True
     )
+    bump(user_id)
 
 
-def update_account(account_id, name=None, atype=None, notes=None, user_id=None, is_admin=False):
+@routed()
+@queued
+def update_account(account_id, name=None, atype=None, notes=None, user_id=None, is_admin=False, owner_id=None):
     """
-    Update an account if owned by this user (or any user if admin).
+    Update an account if owned by this user. Admins may update another
+    user's account by passing its user_id as owner_id.
     """
     parts = []
     params = []
@@ -44,27 +60,26 @@ def update_account(account_id, name=None, atype=None, notes=None, user_id=None,
     if not parts:
         return  # nothing to update
 
-    if is_admin:
-        q = "UPDATE accounts SET " + ", ".join(parts) + " WHERE id = ?"
-        params.append(account_id)
-    else:
-        q = "UPDATE accounts SET " + ", ".join(parts) + " WHERE id = ? AND user_id = ?"
-        params.extend([account_id, user_id])
+    uid = owner(user_id, is_admin, owner_id)
+    q = "UPDATE accounts SET " + ", ".join(parts) + " WHERE id = ? AND user_id = ?"
+    params.extend([account_id, uid])
 
     query(q, tuple(params), commit=True)
+    bump(uid)
 
 
-def delete_account(account_id, user_id=None, is_admin=False):
+@routed()
+@queued
+def delete_account(account_id, user_id=None, is_admin=False, owner_id=None):
     """
-    Delete account if owned by user (unless admin).
+    Delete account if owned by user (admins: by owner_id, as for update_account).
     Prevent deletion if linked transactions exist.
     """
+    uid = owner(user_id, is_admin, owner_id)
     # Check for existing transactions
     r = query("SELECT COUNT(*) as c FROM transactions WHERE account_id = ?", (account_id,), fetchone=True)
     if r and r["c"] > 0:
         raise Exception("Cannot delete account with existing transactions.")
 
-    if is_admin:
-        query("DELETE FROM accounts WHERE id = ?", (account_id,), commit=True)
-    else:
-        query("DELETE FROM accounts WHERE id = ? AND user_id = ?", (account_id, user_id), commit=True)
+    query("DELETE FROM accounts WHERE id = ? AND user_id = ?", (account_id, uid), commit=True)
+    bump(uid)
@@ -0,0 +1,197 @@
+"""
+Multi-year category analytics from a per-user cube.
+
+The cube holds integer cents and counts for every month x category x account
+x type of a user's history, as dense NumPy arrays over a contiguous month
+range. It is built with one grouped scan and kept in memory. When only new
+transactions have arrived since, just the rows past the cube's high-water id
+are folded in. Edits or deletes (user_stats.edits, migration 10) make it
+start over.
+
+Trend helpers (monthly, rolling_average, year_over_year, top_movers) slice
+the cube with array arithmetic and return rupee DataFrames.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from core.database import current_db, query, routed
+
+TYPES = ("Expense", "Income")
+NO_CATEGORY = "(none)"
+MAX_CUBES = 64
+
+_lock = threading.Lock()
+_cubes = OrderedDict()  # (database, user_id) -> cube
+
+
+def _month_index(year_month):
+    year_month = np.asarray(year_month, dtype="int64")
+    return year_month // 100 * 12 + year_month % 100 - 1
+
+
+def _empty():
+    return {
+        "start": None,  # month index (year * 12 + month - 1) of the first row
+        "categories": [],  # category ids, 0 for uncategorised rows
+        "names": {},  # category id -> name
+        "accounts": [],
+        "cents": np.zeros((len(TYPES), 0, 0, 0), dtype="int64"),
+        "counts": np.zeros((len(TYPES), 0, 0, 0), dtype="int64"),
+        "high_id": 0,
+        "edits": 0,
+        "rows": 0,
+    }
+
+
+def _fold(cube, groups):
+    """Add grouped rows (year_month, category, account_id, type, cents, count) into the cube."""
+    if not groups:
+        return
+    ym, cat, acc, typ, cents, counts = zip(*groups)
+    months = _month_index(ym)
+    start = int(months.min()) if cube["start"] is None else min(cube["start"], int(months.min()))
+    for name, values in (("categories", cat), ("accounts", acc)):
+        known = set(cube[name])
+        cube[name].extend(v for v in dict.fromkeys(values) if v not in known)
+
+    # grow the arrays to cover new months (either end), categories and accounts
+    old_start = start if cube["start"] is None else cube["start"]
+    old_m = cube["cents"].shape[1]
+    end = max(old_start + old_m, int(months.max()) + 1)
+    shape = (len(TYPES), end - start, len(cube["categories"]), len(cube["accounts"]))
+    for key in ("cents", "counts"):
+        grown = np.zeros(shape, dtype="int64")
+        old = cube[key]
+        offset = old_start - start
+        grown[:, offset:offset + old.shape[1], :old.shape[2], :old.shape[3]] = old
+        cube[key] = grown
+    cube["start"] = start
+
+    ci = {c: i for i, c in enumerate(cube["categories"])}
+    ai = {a: i for i, a in enumerate(cube["accounts"])}
+    index = (
+        np.fromiter((TYPES.index(t) for t in typ), dtype="int64", count=len(typ)),
+        months - start,
+        np.fromiter((ci[c] for c in cat), dtype="int64", count=len(cat)),
+        np.fromiter((ai[a] for a in acc), dtype="int64", count=len(acc)),
+    )
+    np.add.at(cube["cents"], index, np.asarray(cents, dtype="int64"))
+    np.add.at(cube["counts"], index, np.asarray(counts, dtype="int64"))
+    cube["rows"] += int(sum(counts))
+
+
+def _load(cube, user_id, after_id):
+    high = query(
+        "SELECT IFNULL(MAX(id), 0) AS high FROM transactions WHERE user_id = ?", (user_id,), fetchone=True
+    )["high"]
+    if high > after_id:
+        rows = query(
+            f"""
+            SELECT year_month, IFNULL(category_id, 0) AS category_id,
+                   IFNULL(account_id, 0) AS account_id, type,
+                   SUM(amount_cents) AS cents, COUNT(*) AS n
+            FROM transactions
+            WHERE user_id = ? AND id > ? AND id <= ?
+            GROUP BY 1, 2, 3, 4
+            """,
+            (user_id, after_id, high),
+            fetchall=True,
+        )
+        _fold(cube, [tuple(r.values()) for r in rows])
+        if set(cube["categories"]) - set(cube["names"]) - {0}:
+            cube["names"] = {
+                r["id"]: r["name"]
+                for r in query("SELECT id, name FROM categories WHERE user_id = ?", (user_id,), fetchall=True)
+            }
+    cube["high_id"] = high
+
+
+@routed()
+def cube(user_id):
+    """The user's cube, refreshed incrementally; treat it as read-only."""
+    stats = query("SELECT tx_count, edits FROM user_stats WHERE user_id = ?", (user_id,), fetchone=True)
+    edits = stats["edits"] if stats else 0
+    key = (current_db(), user_id)
+    with _lock:
+        current = _cubes.get(key)
+        if current is not None:
+            _cubes.move_to_end(key)
+    if current is not None and current["edits"] == edits:
+        c = dict(current, categories=list(current["categories"]), accounts=list(current["accounts"]))
+        _load(c, user_id, current["high_id"])
+        # a row count that does not add up means something other than appends happened
+        if not stats or c["rows"] == stats["tx_count"]:
+            current = c
+        else:
+            current = None
+    else:
+        current = None
+    if current is None:
+        current = _empty()
+        _load(current, user_id, 0)
+    current["edits"] = edits
+    with _lock:
+        _cubes[key] = current
+        while len(_cubes) > MAX_CUBES:
+            _cubes.popitem(last=False)
+    return current
+
+
+def _months(c):
+    return pd.PeriodIndex(
+        [pd.Period(year=m // 12, month=m % 12 + 1, freq="M") for m in range(c["start"], c["start"] + c["cents"].shape[1])]
+    ).to_timestamp() if c["start"] is not None else pd.DatetimeIndex([])
+
+
+def monthly(user_id, tx_type="Expense", by="category"):
+    """Rupees per month (rows, every month in the history) by category or account (columns)."""
+    c = cube(user_id)
+    cents = c["cents"][TYPES.index(tx_type)]
+    if by == "category":
+        axis, labels = 2, [c["names"].get(i, NO_CATEGORY) for i in c["categories"]]
+    else:
+        axis, labels = 1, c["accounts"]
+    values = cents.sum(axis=axis) if cents.size else np.zeros((cents.shape[0], len(labels)), dtype="int64")
+    return pd.DataFrame(values / 100, index=_months(c), columns=labels)
+
+
+def rolling_average(user_id, window=3, tx_type="Expense", by="category"):
+    """Trailing `window`-month mean of monthly()."""
+    return monthly(user_id, tx_type, by).rolling(window, min_periods=1).mean()
+
+
+def year_over_year(user_id, period=None, tx_type="Expense", by="category"):
+    """
+    For a YYYYMM period (default: the latest month), each category's total
+    against the same month a year earlier, with the change in rupees and %.
+    """
+    df = monthly(user_id, tx_type, by)
+    if df.empty:
+        return pd.DataFrame(columns=["This year", "Last year", "Change", "Change %"])
+    when = df.index[-1] if period is None else pd.Timestamp(year=period // 100, month=period % 100, day=1)
+    current = df.loc[when] if when in df.index else pd.Series(0.0, index=df.columns)
+    before = when - pd.DateOffset(years=1)
+    previous = df.loc[before] if before in df.index else pd.Series(0.0, index=df.columns)
+    out = pd.DataFrame({"This year": current, "Last year": previous})
+    out["Change"] = out["This year"] - out["Last year"]
+    out["Change %"] = (out["Change"] / out["Last year"].where(out["Last year"] != 0) * 100).round(1)
+    return out.sort_values("This year", ascending=False)
+
+
+def top_movers(user_id, period=None, n=5, window=3, tx_type="Expense", by="category"):
+    """
+    The n categories whose total for a period (default: the latest month)
+    moved furthest from their average over the `window` months before it.
+    """
+    df = monthly(user_id, tx_type, by)
+    if df.empty:
+        return pd.DataFrame(columns=["This month", "Average", "Change"])
+    when = df.index[-1] if period is None else pd.Timestamp(year=period // 100, month=period % 100, day=1)
+    pos = df.index.get_indexer([when])[0]
+    if pos < 0:
+        return pd.DataFrame(columns=["This month", "Average", "Change"])
+    average = df.iloc[max(pos - window, 0):pos].mean() if pos else pd.Series(0.0, index=df.columns)
+    out = pd.DataFrame({"This month": df.iloc[pos], "Average": average.round(2)})
+    out["Change"] = out["This month"] - out["Average"]
+    return out.reindex(out["Change"].abs().sort_values(ascending=False).index).head(n)
@@ -1,41 +1,176 @@
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
 from passlib.hash import pbkdf2_sha256
 from datetime import datetime
-from core.database import query
+from core.database import query, on_catalog
+from core.writer import queued
+from core.cache import bump
 
+# PBKDF2 cost. Hashes made with other rounds still verify and are upgraded on
+# the next successful login.
+HASH_ROUNDS = int(os.environ.get("MONEY_MAGIC_HASH_ROUNDS") or pbkdf2_sha256.default_rounds)
+# At most this many hashes run at once; other logins queue instead of
+# starving every session's script thread of CPU.
+HASH_WORKERS = int(os.environ.get("MONEY_MAGIC_HASH_WORKERS") or 2)
+SESSION_TTL = 14 * 24 * 3600  # seconds
+
+_hasher = pbkdf2_sha256.using(rounds=HASH_ROUNDS)
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="auth")
+_secret = None
+
+
+def hash_password(password):
+    return _pool.submit(_hasher.hash, password).result()
+
+
+def _verify(password, password_hash):
+    """(matches, needs_rehash), computed on the hashing pool."""
+    def check():
+        ok = _hasher.verify(password, password_hash)
+        return ok, ok and _hasher.needs_update(password_hash)
+    return _pool.submit(check).result()
+
+
+@on_catalog
 def create_user(username, password, display_name='', email=''):
-    count_row = query("SELECT COUNT(*) as c FROM users", fetchone=True)
-    count = count_row["c"] if count_row else 0
-    is_admin = 1 if count == 0 else 0
-    password_hash = pbkdf2_sha256.hash(password)
+    # hash before queueing so the writer thread never waits on PBKDF2
+    return _insert_user(username, hash_password(password), display_name, email)
+
+@queued
+def _insert_user(username, password_hash, display_name, email):
     created_at = datetime.utcnow().isoformat()
     try:
-        query(
-            "INSERT INTO users (username,password_hash,display_name,email,is_admin,created_at) VALUES (?,?,?,?,?,?)",
-            (username, password_hash, display_name, email, is_admin, created_at),
+        # the first user becomes admin; NOT EXISTS stops at the first row instead of counting
+        row = query(
+            "INSERT INTO users (username,password_hash,display_name,email,is_admin,created_at) "
+            "SELECT ?,?,?,?, NOT EXISTS (SELECT 1 FROM users), ? RETURNING id, is_admin",
+            (username, password_hash, display_name, email, created_at),
+            fetchone=True,
             commit=True
         )
-        return True, is_admin
+        bump(row["id"])
+        return True, row["is_admin"]
     except Exception as e:
         return False, str(e)
 
+@on_catalog
 def verify_user(username, password):
     row = query("SELECT * FROM users WHERE username = ?", (username,), fetchone=True)
     if not row:
         return False, "Invalid username or password"
-    if pbkdf2_sha256.verify(password, row["password_hash"]):
-        return True, dict(row)
-    else:
+    ok, rehash = _verify(password, row["password_hash"])
+    if not ok:
         return False, "Invalid username or password"
+    if rehash:
+        row["password_hash"] = hash_password(password)
+        _rehash(row["id"], row["password_hash"])
+    return True, row
+
+@on_catalog
+@queued
+def _rehash(user_id, pw_hash):
+    query("UPDATE users SET password_hash = ? WHERE id = ?", (pw_hash, user_id), commit=True)
 
+@on_catalog
 def get_user_by_id(user_id):
     row = query("SELECT * FROM users WHERE id = ?", (user_id,), fetchone=True)
     return dict(row) if row else None
 
+@on_catalog
 def update_user_details(user_id, display_name=None, email=None, new_password=None):
-    if new_password:
-        pw_hash = pbkdf2_sha256.hash(new_password)
+    pw_hash = hash_password(new_password) if new_password else None
+    _update_user(user_id, display_name, email, pw_hash)
+
+@queued
+def _update_user(user_id, display_name, email, pw_hash):
+    if pw_hash:
         query("UPDATE users SET password_hash = ? WHERE id = ?", (pw_hash, user_id), commit=True)
+        # a password change signs out every other browser
+        query("DELETE FROM sessions WHERE user_id = ?", (user_id,), commit=True)
     if display_name is not None:
         query("UPDATE users SET display_name = ? WHERE id = ?", (display_name, user_id), commit=True)
     if email is not None:
         query("UPDATE users SET email = ? WHERE id = ?", (email, user_id), commit=True)
+
+
+def _signing_key():
+    """MONEY_MAGIC_SECRET, else a random key generated once and kept in app_settings."""
+    global _secret
+    if _secret is None:
+        env = os.environ.get("MONEY_MAGIC_SECRET")
+        if env:
+            _secret = env.encode()
+        else:
+            _store_secret(secrets.token_hex(32))
+            row = query("SELECT value FROM app_settings WHERE key = 'session_secret'", fetchone=True)
+            _secret = row["value"].encode()
+    return _secret
+
+
+@on_catalog
+@queued
+def _store_secret(value):
+    # the first key written wins; a racing process reads that one back
+    query("INSERT OR IGNORE INTO app_settings (key, value) VALUES ('session_secret', ?)", (value,), commit=True)
+
+
+def _sign(payload):
+    return hmac.new(_signing_key(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+@on_catalog
+@queued
+def create_session(user_id, ttl=SESSION_TTL):
+    """Issue a signed token for user_id that user_from_session() accepts until it expires."""
+    purge_expired_sessions()
+    now = int(time.time())
+    payload = f"{user_id}.{now + ttl}.{secrets.token_urlsafe(16)}"
+    token = f"{payload}.{_sign(payload)}"
+    query(
+        "INSERT INTO sessions (token_hash, user_id, created_at, expires_at) VALUES (?,?,?,?)",
+        (_token_hash(token), user_id, now, now + ttl),
+        commit=True,
+    )
+    return token
+
+
+@on_catalog
+def user_from_session(token):
+    """
+    The user a session token belongs to, or None if it is malformed, forged,
+    expired or signed out. Costs one HMAC and one indexed lookup, no PBKDF2.
+    """
+    try:
+        user_id, expires, nonce, sig = token.split(".")
+        expires = int(expires)
+    except (AttributeError, ValueError):
+        return None
+    if expires < time.time() or not hmac.compare_digest(sig, _sign(f"{user_id}.{expires}.{nonce}")):
+        return None
+    row = query(
+        "SELECT u.* FROM sessions s JOIN users u ON u.id = s.user_id "
+        "WHERE s.token_hash = ? AND s.expires_at > ?",
+        (_token_hash(token), int(time.time())),
+        fetchone=True,
+    )
+    return row
+
+
+@on_catalog
+@queued
+def end_session(token):
+    query("DELETE FROM sessions WHERE token_hash = ?", (_token_hash(token),), commit=True)
+
+
+@on_catalog
+@queued
+def purge_expired_sessions():
+    query("DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),), commit=True)
@@ -1,35 +1,172 @@
-from core.database import query
-
-def get_opening(month, account_id, user_id, is_admin=False):
-    if is_admin:
-        row = query(
-            "SELECT opening FROM balances WHERE month = ? AND account_id = ? ORDER BY id DESC LIMIT 1",
-            (month, account_id),
-            fetchone=True,
-        )
-    else:
-        row = query(
-            "SELECT opening FROM balances WHERE month = ? AND account_id = ? AND user_id = ?",
-            (month, account_id, user_id),
-            fetchone=True,
-        )
-    return float(row["opening"]) if row else 0.0
+"""
+Opening balances, one per account and YYYYMM month.
+
+    python -m core.balances rollover [YYYYMM] [--overwrite]   # carry every account's closing into the next month
+"""
+import sys
+import threading
+import time
+from datetime import date
+from core.database import init_db, query, transaction, routed, scatter, owner
+from core.writer import queued
+from core.cache import cached, bump
+from core.money import to_cents, from_cents
+from core.networth import refresh
+
+ROLLOVER_INTERVAL = 6 * 3600  # seconds between scheduled roll-overs
+
+_rollover = None
+_rollover_lock = threading.Lock()
+
+# Only an account of the given owner gets a row; an opening set here is manual
+_UPSERT = """
+    INSERT INTO balances (user_id, account_id, year_month, opening_cents, manual)
+    SELECT user_id, id, ?, ?, 1 FROM accounts WHERE id = ? AND user_id = ?
+    ON CONFLICT (user_id, account_id, year_month) DO UPDATE SET opening_cents = excluded.opening_cents, manual = 1
+"""
+
+
+def next_month(year_month):
+    year, m = divmod(year_month, 100)
+    return (year + 1) * 100 + 1 if m == 12 else year_month + 1
 
-def set_opening(month, account_id, opening, user_id):
+
+def previous_month(year_month):
+    year, m = divmod(year_month, 100)
+    return (year - 1) * 100 + 12 if m == 1 else year_month - 1
+
+
+@cached
+@routed()
+def get_opening(year_month, account_id, user_id, is_admin=False, owner_id=None):
+    # admins read another user's opening by passing the account's user_id as owner_id
     row = query(
-        "SELECT id FROM balances WHERE month = ? AND account_id = ? AND user_id = ?",
-        (month, account_id, user_id),
+        "SELECT opening_cents FROM balances WHERE user_id = ? AND account_id = ? AND year_month = ?",
+        (owner(user_id, is_admin, owner_id), account_id, year_month),
         fetchone=True,
     )
-    if row:
-        query(
-            "UPDATE balances SET opening = ? WHERE month = ? AND account_id = ? AND user_id = ?",
-            (float(opening), month, account_id, user_id),
-            commit=True,
+    return from_cents(row["opening_cents"]) if row else 0.0
+
+
+@routed()
+@queued
+def set_opening(year_month, account_id, opening, user_id, is_admin=False, owner_id=None):
+    uid = owner(user_id, is_admin, owner_id)
+    query(_UPSERT, (year_month, to_cents(opening), account_id, uid), commit=True)
+    bump(uid)
+
+
+@routed()
+@queued
+def set_openings(year_month, openings, user_id, is_admin=False, owner_id=None):
+    """
+    Set several accounts' openings ({account_id: rupees}) for one month in
+    one transaction. The accounts all belong to one user (owner_id for admins).
+    """
+    uid = owner(user_id, is_admin, owner_id)
+    with transaction() as conn:
+        conn.executemany(
+            _UPSERT, [(year_month, to_cents(opening), account_id, uid) for account_id, opening in openings.items()]
         )
-    else:
-        query(
-            "INSERT INTO balances (month, account_id, opening, user_id) VALUES (?, ?, ?, ?)",
-            (month, account_id, float(opening), user_id),
-            commit=True,
+    bump(uid)
+
+
+def _roll_shard(year_month, user_id, overwrite):
+    users = [user_id] if user_id is not None else [
+        r["user_id"] for r in query("SELECT user_id FROM networth_dirty", fetchall=True)
+    ]
+    for uid in users:
+        refresh(uid)
+    return _carry(year_month, user_id, overwrite)
+
+
+@queued
+def _carry(year_month, user_id, overwrite):
+    only = "" if user_id is None else "AND s.user_id = ?"
+    # a rolled opening follows its closing when that changes; one set by hand
+    # is replaced only with overwrite
+    conflict = (
+        "DO UPDATE SET opening_cents = excluded.opening_cents, manual = 0 "
+        "WHERE balances.manual = 1 OR balances.opening_cents <> excluded.opening_cents"
+        if overwrite else
+        "DO UPDATE SET opening_cents = excluded.opening_cents "
+        "WHERE balances.manual = 0 AND balances.opening_cents <> excluded.opening_cents"
+    )
+    with transaction() as conn:
+        # each account's latest closing up to the month, from the net-worth series
+        conn.execute(
+            f"""
+            INSERT INTO balances (user_id, account_id, year_month, opening_cents, manual)
+            SELECT s.user_id, s.account_id, ?, s.closing_cents, 0
+            FROM networth_series s JOIN accounts a ON a.id = s.account_id AND a.user_id = s.user_id
+            WHERE s.year_month = (
+                SELECT MAX(year_month) FROM networth_series
+                WHERE user_id = s.user_id AND account_id = s.account_id AND year_month <= ?
+            ) {only}
+            ON CONFLICT (user_id, account_id, year_month) {conflict}
+            """,
+            (next_month(year_month), year_month) + (() if user_id is None else (user_id,)),
         )
+        written = conn.execute("SELECT changes()").fetchone()[0]
+    return written
+
+
+def roll_forward(year_month=None, user_id=None, overwrite=False):
+    """
+    Write each account's closing for `year_month` (default: last month) as
+    its opening for the month after, for every user (or just `user_id`) in
+    one statement per database. Openings an earlier roll-over wrote are
+    updated when that closing has since changed; openings set by hand are
+    kept unless `overwrite`. Returns the number of openings written.
+    """
+    if year_month is None:
+        today = date.today()
+        year_month = previous_month(today.year * 100 + today.month)
+    if user_id is not None:
+        return _roll_one(year_month, user_id, overwrite)
+    written = sum(scatter(lambda _: _roll_shard(year_month, None, overwrite)))
+    bump(None)
+    return written
+
+
+@routed()
+def _roll_one(year_month, user_id, overwrite):
+    written = _roll_shard(year_month, user_id, overwrite)
+    bump(user_id)
+    return written
+
+
+def start_rollover(interval=ROLLOVER_INTERVAL):
+    """Run roll_forward() every `interval` seconds on a daemon thread (once per process)."""
+    global _rollover
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                roll_forward()
+            except Exception as e:
+                print(f"balance roll-over failed: {e}", file=sys.stderr)
+
+    with _rollover_lock:
+        if _rollover is None:
+            _rollover = threading.Thread(target=loop, name="balance-rollover", daemon=True)
+            _rollover.start()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "rollover":
+        print(__doc__)
+        return 2
+    init_db()
+    args = [a for a in argv[1:] if a != "--overwrite"]
+    year_month = int(args[0]) if args else None
+    started = time.perf_counter()
+    written = roll_forward(year_month, overwrite="--overwrite" in argv)
+    print(f"{written} openings written in {time.perf_counter() - started:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
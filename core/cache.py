@@ -0,0 +1,151 @@
+"""
+Process-wide read-through cache for core reads.
+
+Entries are keyed on a per-user data version that every write function
+bumps, so a write from one session (or browser tab) is seen by every other
+session of the same user on its next read. Reads that span all users
+(admin views) key on a global version bumped by every write. Eviction is
+LRU, bounded by entry count and approximate size in bytes.
+
+Versions live in this process; instances sharing one database file do not
+see each other's bumps.
+"""
+import copy
+import inspect
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+import pandas as pd
+
+MAX_ENTRIES = 512
+MAX_BYTES = 64 * 1024 * 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (value, size)
+_bytes = 0
+_user_versions = {}
+_global_version = 0
+_epoch = 0  # bumped by writes whose owner is unknown; invalidates everything
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_held = threading.local()
+
+
+def bump(user_id=None):
+    """Invalidate cached reads for a user (or for everyone if user_id is None)."""
+    global _global_version, _epoch
+    held = getattr(_held, "bumps", None)
+    if held is not None:
+        held.append(user_id)
+        return
+    with _lock:
+        _global_version += 1
+        if user_id is None:
+            _epoch += 1
+        else:
+            _user_versions[user_id] = _user_versions.get(user_id, 0) + 1
+
+
+def hold_bumps():
+    """
+    Queue this thread's bumps until release_bumps(). A writer calls this
+    around a transaction so readers cannot cache pre-commit data under the
+    new version.
+    """
+    _held.bumps = []
+
+
+def release_bumps():
+    held, _held.bumps = getattr(_held, "bumps", None) or [], None
+    for user_id in dict.fromkeys(held):
+        bump(user_id)
+
+
+def clear():
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+
+def stats():
+    """Hit/miss/eviction counters plus current entry count and size."""
+    with _lock:
+        return dict(_stats, entries=len(_entries), bytes=_bytes)
+
+
+def _sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + _sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    # Callers are free to mutate what they get back (views add columns to frames)
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, (int, float, str, bool, type(None))):
+        return value
+    return copy.deepcopy(value)
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _store(key, value):
+    global _bytes
+    size = _sizeof(value)
+    if size > MAX_BYTES:
+        return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old:
+            _bytes -= old[1]
+        _entries[key] = (value, size)
+        _bytes += size
+        while len(_entries) > MAX_ENTRIES or _bytes > MAX_BYTES:
+            _, (_, evicted) = _entries.popitem(last=False)
+            _bytes -= evicted
+            _stats["evictions"] += 1
+
+
+def cached(func):
+    """
+    Cache a read function that takes `user_id` and optionally `is_admin`
+    arguments. Results are copied on the way out.
+    """
+    sig = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        call = bound.arguments
+        user_id = call.get("user_id")
+        all_users = bool(call.get("is_admin")) or user_id is None
+        with _lock:
+            version = _global_version if all_users else _user_versions.get(user_id, 0)
+            key = (func.__qualname__, all_users, version, _epoch, _freeze(call))
+            hit = _entries.get(key)
+            if hit is not None:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+            else:
+                _stats["misses"] += 1
+        if hit is not None:
+            return _copy(hit[0])
+        value = func(*args, **kwargs)
+        _store(key, value)
+        return _copy(value)
+
+    wrapper.uncached = func
+    return wrapper
@@ -0,0 +1,116 @@
+"""
+Per-user categories. Transactions keep the category name (shown in lists
+and indexed for search) alongside an integer category_id into this table;
+grouping and filtering by category use the id.
+"""
+from core.database import query, routed
+from core.writer import queued
+from core.cache import cached, bump
+
+# Offered to every user, whether or not they have used them yet
+DEFAULT_CATEGORIES = [
+    "Food", "Transport", "Bills", "Shopping", "Rent", "Salary",
+    "Payment", "Investment", "Entertainment", "Health",
+    "Education", "Other",
+]
+
+
+def ids_for(conn, user_id, names):
+    """
+    {name: id} for a user's category names, creating the missing ones.
+    Runs on the caller's connection, inside its transaction.
+    """
+    names = list({n for n in names if n})
+    if not names:
+        return {}
+    conn.executemany(
+        "INSERT INTO categories (user_id, name) VALUES (?, ?) ON CONFLICT (user_id, name) DO NOTHING",
+        [(user_id, n) for n in names],
+    )
+    found = {}
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        found.update(conn.execute(
+            f"SELECT name, id FROM categories WHERE user_id = ? AND name IN ({','.join('?' * len(chunk))})",
+            (user_id, *chunk),
+        ).fetchall())
+    return found
+
+
+def relink(conn, tx_uuids):
+    """Point category_id at the current category name of edited transactions."""
+    rows = [(u,) for u in tx_uuids]
+    conn.executemany(
+        "INSERT INTO categories (user_id, name) SELECT user_id, category FROM transactions "
+        "WHERE tx_uuid = ? AND category <> '' ON CONFLICT (user_id, name) DO NOTHING",
+        rows,
+    )
+    conn.executemany(
+        "UPDATE transactions SET category_id = (SELECT c.id FROM categories c "
+        "WHERE c.user_id = transactions.user_id AND c.name = transactions.category) WHERE tx_uuid = ?",
+        rows,
+    )
+
+
+@cached
+@routed()
+def get_categories(user_id):
+    """The user's categories (id, name, parent_id, parent), parents before their children."""
+    rows = query(
+        """
+        SELECT c.id, c.name, c.parent_id, p.name AS parent
+        FROM categories c LEFT JOIN categories p ON p.id = c.parent_id
+        WHERE c.user_id = ?
+        ORDER BY IFNULL(p.name, c.name), c.parent_id IS NOT NULL, c.name
+        """,
+        (user_id,),
+        fetchall=True,
+    )
+    return [dict(r) for r in rows] if rows else []
+
+
+def category_names(user_id):
+    """Names to offer when entering a transaction: the defaults, then the user's own."""
+    names = list(DEFAULT_CATEGORIES)
+    names += [c["name"] for c in get_categories(user_id) if c["name"] not in DEFAULT_CATEGORIES]
+    return names
+
+
+@routed()
+@queued
+def add_category(user_id, name, parent=None):
+    """
+    Add a category, or move an existing one, under `parent` (a name; None
+    for top level). Categories nest one level deep.
+    """
+    name = name.strip()
+    if not name:
+        raise ValueError("Category name is required.")
+    parent_id = None
+    if parent:
+        if parent == name:
+            raise ValueError("A category cannot be its own parent.")
+        if query(
+            "SELECT 1 FROM categories c JOIN categories k ON k.parent_id = c.id WHERE c.user_id = ? AND c.name = ?",
+            (user_id, name),
+            fetchone=True,
+        ):
+            raise ValueError(f"'{name}' has sub-categories of its own.")
+        row = query(
+            "SELECT parent_id FROM categories WHERE user_id = ? AND name = ?", (user_id, parent), fetchone=True
+        )
+        if row and row["parent_id"] is not None:
+            raise ValueError(f"'{parent}' is itself a sub-category.")
+        parent_id = query(
+            "INSERT INTO categories (user_id, name) VALUES (?, ?) "
+            "ON CONFLICT (user_id, name) DO UPDATE SET name = excluded.name RETURNING id",
+            (user_id, parent),
+            fetchone=True,
+        )["id"]
+    query(
+        "INSERT INTO categories (user_id, name, parent_id) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id, name) DO UPDATE SET parent_id = excluded.parent_id",
+        (user_id, name, parent_id),
+        commit=True,
+    )
+    bump(user_id)
@@ -1,16 +1,257 @@
+import inspect
 import sqlite3
 from datetime import datetime
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+import numpy as np
+import pandas as pd
+from core import profiling
+from core.utils import MONTHS, latest_year_month
 
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "money_magic.db")
+# MONEY_MAGIC_DB points the app (or a benchmark run) at another database file
+DB_PATH = os.environ.get("MONEY_MAGIC_DB") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "money_magic.db"
+)
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# Applied once when a connection is opened. WAL lets readers run alongside the
+# writer and NORMAL sync is safe under WAL; the rest trade memory for fewer reads.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -32000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# sqlite3 keeps an LRU of compiled statements per connection; size it so every
+# statement the app issues stays prepared for the life of the connection.
+STATEMENT_CACHE_SIZE = 256
+
+# Optional sharding. With MONEY_MAGIC_SHARDS=N each user's accounts, balances
+# and transactions live in one of N files (user_id % N) under SHARD_DIR, so
+# tenants in different files do not share a writer lock. DB_PATH remains the
+# catalog holding users, sessions and settings. 0 keeps everything in DB_PATH.
+SHARDS = int(os.environ.get("MONEY_MAGIC_SHARDS") or 0)
+SHARD_DIR = os.environ.get("MONEY_MAGIC_SHARD_DIR") or os.path.splitext(DB_PATH)[0] + "_shards"
+SCATTER_WORKERS = 8
+
+# Idle connections kept per database file for the next thread that needs one
+POOL_SIZE = 8
+
+_local = threading.local()
+_pool = {}  # path -> idle connections handed back by finished threads
+_pool_lock = threading.Lock()
+_scatter_pool = None
+_scatter_lock = threading.Lock()
+_ready = set()  # database files init_db() has brought up to date in this process
+_init_lock = threading.Lock()
+
+
+def _open(path):
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    conn = get_conn()
+
+def _release(conns):
+    # Hand a thread's connections back to the pool, closing any beyond POOL_SIZE
+    for path, conn in list(conns.items()):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with _pool_lock:
+                idle = _pool.setdefault(path, [])
+                if len(idle) < POOL_SIZE:
+                    idle.append(conn)
+                    continue
+            conn.close()
+        except sqlite3.Error:
+            conn.close()
+    conns.clear()
+
+
+class _Conns(dict):
+    """A thread's connections by path; back to the pool when the thread ends."""
+
+    def __del__(self):
+        _release(self)
+
+
+def get_conn():
+    """
+    Return this thread's connection to the current database (see use_db()),
+    so a connection is never shared between concurrent callers. Streamlit
+    runs every rerun on a new thread: a thread's first call takes an idle
+    connection from a process-wide pool (opening one if none is free), and
+    its connections go back to the pool when the thread ends.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = _Conns()
+    path = current_db()
+    conn = conns.get(path)
+    if conn is None:
+        with _pool_lock:
+            idle = _pool.get(path)
+            conn = idle.pop() if idle else None
+        conn = conns[path] = conn or _open(path)
+    return conn
+
+
+def current_db():
+    """Path of the database get_conn() currently points at."""
+    return getattr(_local, "path", None) or DB_PATH
+
+
+def shard_for(user_id):
+    return os.path.join(SHARD_DIR, f"shard_{int(user_id) % SHARDS:04d}.db")
+
+
+def shard_paths():
+    return [os.path.join(SHARD_DIR, f"shard_{i:04d}.db") for i in range(SHARDS)]
+
+
+@contextmanager
+def use_db(path):
+    """Point this thread's get_conn() at `path` (None: the catalog, DB_PATH) for a block."""
+    previous = getattr(_local, "path", None)
+    _local.path = path
+    try:
+        yield
+    finally:
+        _local.path = previous
+
+
+def tenant(user_id):
+    """Context manager selecting user_id's shard; a no-op when not sharded."""
+    if not SHARDS or user_id is None:
+        return use_db(getattr(_local, "path", None))
+    return use_db(shard_for(user_id))
+
+
+def set_tenant(user_id):
+    """Select user_id's shard for the rest of this thread's work (None: the catalog)."""
+    _local.path = shard_for(user_id) if SHARDS and user_id is not None else None
+
+
+def scatter(fn, include_catalog=False):
+    """
+    Call fn(shard_no) once per shard, in parallel, each with that shard as
+    the current database; returns the results in shard order. Unsharded,
+    it is a single fn(0) call on DB_PATH. include_catalog adds a call for
+    the catalog (shard_no None) first.
+    """
+    global _scatter_pool
+    if not SHARDS:
+        return [fn(0)]
+    targets = ([(None, DB_PATH)] if include_catalog else []) + list(enumerate(shard_paths()))
+
+    def run(target):
+        shard_no, path = target
+        with use_db(path):
+            _local.scattering = True
+            try:
+                return fn(shard_no)
+            finally:
+                _local.scattering = False
+
+    with _scatter_lock:
+        if _scatter_pool is None:
+            _scatter_pool = ThreadPoolExecutor(max_workers=SCATTER_WORKERS, thread_name_prefix="scatter")
+    return list(_scatter_pool.map(run, targets))
+
+
+def owner(user_id, is_admin=False, owner_id=None):
+    """
+    The user whose rows a call works on: owner_id when an admin acts on
+    another user's rows (every row an admin reads carries its user_id),
+    otherwise user_id itself.
+    """
+    return owner_id if is_admin and owner_id is not None else user_id
+
+
+def routed(merge=None):
+    """
+    Run a function taking user_id (and optionally is_admin and owner_id) on
+    the shard of owner(user_id, is_admin, owner_id). If `merge` is given,
+    admin calls instead run on every shard via merge(func, arguments), which
+    scatters and combines the results. Without sharding the function is
+    called as is.
+
+    Rows in different shards can share ids, so an admin write on another
+    user's row must pass that row's user_id as owner_id to reach its shard.
+    """
+    def decorate(func):
+        sig = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not SHARDS or getattr(_local, "scattering", False):
+                return func(*args, **kwargs)
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            call = dict(bound.arguments)
+            if merge is not None and call.get("is_admin"):
+                return merge(func, call)
+            with tenant(owner(call.get("user_id"), call.get("is_admin"), call.get("owner_id"))):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorate
+
+
+def on_catalog(func):
+    """Run func against the catalog database whatever shard is selected."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_db(None):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def close_conn():
+    """Close every connection held by the calling thread, and every idle pooled one."""
+    conns = getattr(_local, "conns", None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+    with _pool_lock:
+        idle = [conn for conns in _pool.values() for conn in conns]
+        _pool.clear()
+    for conn in idle:
+        conn.close()
+
+
+def init_db(force=False):
+    """
+    Create or migrate the catalog and, when sharded, every shard. Each file
+    is checked once per process: one already at SCHEMA_VERSION costs a
+    single PRAGMA read, and later calls (every Streamlit rerun) return
+    straight away. force=True checks again.
+    """
+    paths = [DB_PATH] + shard_paths()
+    if not force and _ready.issuperset(paths):
+        return
+    with _init_lock:
+        if SHARDS:
+            os.makedirs(SHARD_DIR, exist_ok=True)
+        for path in paths:
+            if path in _ready and not force:
+                continue
+            with use_db(path):
+                conn = get_conn()
+                if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    _create_schema(conn)
+            _ready.add(path)
+
+
+def _create_schema(conn):
     cur = conn.cursor()
     cur.executescript("""
     CREATE TABLE IF NOT EXISTS users (
@@ -62,20 +303,681 @@ def init_db():
     );
     """)
     conn.commit()
-    conn.close()
+    migrate(conn)
+
+
+# monthly_account_totals rows as recomputed from transactions (migration 6, core.reports)
+MONTHLY_TOTALS_SQL = """
+    SELECT user_id, IFNULL(account_id, 0) AS account_id, year_month, type,
+           SUM(amount_cents) AS total_cents, COUNT(*) AS count
+    FROM transactions
+    GROUP BY user_id, IFNULL(account_id, 0), year_month, type
+"""
+
+def fts5_available(conn):
+    return any(row[0] == "ENABLE_FTS5" for row in conn.execute("PRAGMA compile_options"))
+
+
+# Contentless FTS5 table keyed by transactions.id. The owner column holds a
+# "u<user_id>" token so a user's search intersects with their own rows
+# inside the index instead of filtering every match afterwards.
+SEARCH_INDEX = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        owner, description, category,
+        content = '', prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transactions_fts (rowid, owner, description, category)
+        VALUES (NEW.id, 'u' || NEW.user_id, IFNULL(NEW.description, ''), IFNULL(NEW.category, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, owner, description, category)
+        VALUES ('delete', OLD.id, 'u' || OLD.user_id, IFNULL(OLD.description, ''), IFNULL(OLD.category, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_fts_update
+    AFTER UPDATE OF user_id, description, category ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, owner, description, category)
+        VALUES ('delete', OLD.id, 'u' || OLD.user_id, IFNULL(OLD.description, ''), IFNULL(OLD.category, ''));
+        INSERT INTO transactions_fts (rowid, owner, description, category)
+        VALUES (NEW.id, 'u' || NEW.user_id, IFNULL(NEW.description, ''), IFNULL(NEW.category, ''));
+    END
+    """,
+    """
+    INSERT INTO transactions_fts (rowid, owner, description, category)
+    SELECT id, 'u' || user_id, IFNULL(description, ''), IFNULL(category, '') FROM transactions
+    """,
+)
+
+
+def _create_search_index(conn):
+    if fts5_available(conn):
+        for stmt in SEARCH_INDEX:
+            conn.execute(stmt)
+
+
+# Fills the admin counters from scratch; also used by core.stats.reconcile().
+STATS_BACKFILL = (
+    "DELETE FROM counters",
+    "DELETE FROM user_stats",
+    "DELETE FROM signups_by_month",
+    """
+    INSERT INTO counters (name, value)
+    SELECT 'users', COUNT(*) FROM users
+    UNION ALL SELECT 'transactions', COUNT(*) FROM transactions
+    UNION ALL SELECT 'volume_cents', IFNULL(SUM(amount_cents), 0) FROM transactions
+    """,
+    """
+    INSERT INTO user_stats (user_id, tx_count, volume_cents, last_activity)
+    SELECT user_id, COUNT(*), SUM(amount_cents), MAX(created_at) FROM transactions GROUP BY user_id
+    """,
+    """
+    INSERT INTO signups_by_month (year_month, count)
+    SELECT CAST(strftime('%Y%m', IFNULL(created_at, 'now')) AS INTEGER), COUNT(*) FROM users GROUP BY 1
+    """,
+)
+
+def _backfill_category_ids(conn):
+    # trg_stats_tx_update fires on any UPDATE and would stamp every user's
+    # last_activity; set it aside while existing rows are linked
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_stats_tx_update'"
+    ).fetchone()
+    if sql:
+        conn.execute("DROP TRIGGER trg_stats_tx_update")
+    conn.execute(
+        "UPDATE transactions SET category_id = "
+        "(SELECT c.id FROM categories c WHERE c.user_id = transactions.user_id AND c.name = transactions.category) "
+        "WHERE category <> ''"
+    )
+    if sql:
+        conn.execute(sql[0])
+
+
+def _rekey_balances(conn):
+    # Month names are placed at their latest occurrence, as net worth already
+    # read them; of duplicate rows the newest wins. Rows with an unreadable
+    # month were never used and are not carried over.
+    rows = conn.execute("SELECT user_id, account_id, month, opening_cents FROM balances ORDER BY id").fetchall()
+    conn.execute(
+        """
+        CREATE TABLE balances_new (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            year_month INTEGER NOT NULL,
+            opening_cents INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (user_id, account_id, year_month),
+            FOREIGN KEY(account_id) REFERENCES accounts(id),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """
+    )
+    conn.executemany(
+        "INSERT INTO balances_new (user_id, account_id, year_month, opening_cents) VALUES (?,?,?,?) "
+        "ON CONFLICT (user_id, account_id, year_month) DO UPDATE SET opening_cents = excluded.opening_cents",
+        [(r[0], r[1], latest_year_month(r[2]), r[3]) for r in rows if r[2] in MONTHS],
+    )
+    # dropping the table also drops its old triggers and index
+    conn.execute("DROP TABLE balances")
+    conn.execute("ALTER TABLE balances_new RENAME TO balances")
+
+
+# Each entry upgrades the schema by one version; the version reached is kept in
+# PRAGMA user_version so a migration runs exactly once per database file.
+MIGRATIONS = [
+    # 1: sargable date columns and indexes for the transaction list
+    (
+        "ALTER TABLE transactions ADD COLUMN tx_date TEXT",
+        "ALTER TABLE transactions ADD COLUMN year_month INTEGER",
+        "UPDATE transactions SET tx_date = date(date), "
+        "year_month = CAST(strftime('%Y%m', date) AS INTEGER)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, tx_date)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_account_date "
+        "ON transactions(user_id, account_id, tx_date)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions(account_id)",
+        "CREATE INDEX IF NOT EXISTS idx_balances_user_account_month ON balances(user_id, account_id, month)",
+    ),
+    # 2: content fingerprints so statement imports can skip rows already loaded
+    (
+        "ALTER TABLE transactions ADD COLUMN fingerprint TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_user_fingerprint "
+        "ON transactions(user_id, fingerprint) WHERE fingerprint IS NOT NULL",
+    ),
+    # 3: per account/month/type totals kept current by triggers on transactions
+    (
+        """
+        CREATE TABLE IF NOT EXISTS monthly_account_totals (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            year_month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, account_id, year_month, type)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_monthly_totals_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total, count)
+            VALUES (NEW.user_id, IFNULL(NEW.account_id, 0),
+                    IFNULL(NEW.year_month, CAST(strftime('%Y%m', NEW.date) AS INTEGER)),
+                    NEW.type, NEW.amount, 1)
+            ON CONFLICT (user_id, account_id, year_month, type)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_monthly_totals_delete AFTER DELETE ON transactions BEGIN
+            UPDATE monthly_account_totals SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type;
+            DELETE FROM monthly_account_totals
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type AND count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_monthly_totals_update
+        AFTER UPDATE OF user_id, account_id, date, year_month, type, amount ON transactions BEGIN
+            UPDATE monthly_account_totals SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type;
+            DELETE FROM monthly_account_totals
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type AND count <= 0;
+            INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total, count)
+            VALUES (NEW.user_id, IFNULL(NEW.account_id, 0),
+                    IFNULL(NEW.year_month, CAST(strftime('%Y%m', NEW.date) AS INTEGER)),
+                    NEW.type, NEW.amount, 1)
+            ON CONFLICT (user_id, account_id, year_month, type)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+        """,
+        "INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total, count) "
+        "SELECT user_id, IFNULL(account_id, 0), year_month, type, SUM(amount), COUNT(*) "
+        "FROM transactions GROUP BY user_id, IFNULL(account_id, 0), year_month, type",
+    ),
+    # 4: cached running balances per account/month and the month each user's
+    # cache is valid up to; writes only mark the cache dirty from their month
+    (
+        """
+        CREATE TABLE IF NOT EXISTS networth_series (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            year_month INTEGER NOT NULL,
+            opening REAL NOT NULL,
+            closing REAL NOT NULL,
+            PRIMARY KEY (user_id, account_id, year_month)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS networth_dirty (
+            user_id INTEGER PRIMARY KEY,
+            from_month INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_totals_insert AFTER INSERT ON monthly_account_totals BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, NEW.year_month)
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_totals_update AFTER UPDATE ON monthly_account_totals BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, MIN(OLD.year_month, NEW.year_month))
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_totals_delete AFTER DELETE ON monthly_account_totals BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (OLD.user_id, OLD.year_month)
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        # Openings and account types are rare edits; they invalidate the user's whole series
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_balances_insert AFTER INSERT ON balances BEGIN
+            INSERT OR REPLACE INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_balances_update AFTER UPDATE ON balances BEGIN
+            INSERT OR REPLACE INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_balances_delete AFTER DELETE ON balances BEGIN
+            INSERT OR REPLACE INTO networth_dirty (user_id, from_month) VALUES (OLD.user_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_accounts_update AFTER UPDATE OF type ON accounts BEGIN
+            INSERT OR REPLACE INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_accounts_delete AFTER DELETE ON accounts BEGIN
+            INSERT OR REPLACE INTO networth_dirty (user_id, from_month) VALUES (OLD.user_id, 0);
+        END
+        """,
+        "INSERT OR REPLACE INTO networth_dirty (user_id, from_month) SELECT DISTINCT user_id, 0 FROM accounts",
+    ),
+    # 5: keyset pagination over all users (admin listing) in (tx_date, id) order
+    (
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(tx_date)",
+    ),
+    # 6: money as integer cents. REAL amount/opening columns are converted and
+    # dropped; the derived totals and net-worth tables are rebuilt in cents.
+    (
+        "DROP TRIGGER IF EXISTS trg_monthly_totals_insert",
+        "DROP TRIGGER IF EXISTS trg_monthly_totals_delete",
+        "DROP TRIGGER IF EXISTS trg_monthly_totals_update",
+        "ALTER TABLE transactions ADD COLUMN amount_cents INTEGER NOT NULL DEFAULT 0",
+        "UPDATE transactions SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER)",
+        "ALTER TABLE transactions DROP COLUMN amount",
+        "ALTER TABLE balances ADD COLUMN opening_cents INTEGER NOT NULL DEFAULT 0",
+        "UPDATE balances SET opening_cents = CAST(ROUND(IFNULL(opening, 0) * 100) AS INTEGER)",
+        "ALTER TABLE balances DROP COLUMN opening",
+        "DROP TABLE IF EXISTS monthly_account_totals",
+        """
+        CREATE TABLE monthly_account_totals (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            year_month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, account_id, year_month, type)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER trg_monthly_totals_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total_cents, count)
+            VALUES (NEW.user_id, IFNULL(NEW.account_id, 0),
+                    IFNULL(NEW.year_month, CAST(strftime('%Y%m', NEW.date) AS INTEGER)),
+                    NEW.type, NEW.amount_cents, 1)
+            ON CONFLICT (user_id, account_id, year_month, type)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_monthly_totals_delete AFTER DELETE ON transactions BEGIN
+            UPDATE monthly_account_totals SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type;
+            DELETE FROM monthly_account_totals
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type AND count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_monthly_totals_update
+        AFTER UPDATE OF user_id, account_id, date, year_month, type, amount_cents ON transactions BEGIN
+            UPDATE monthly_account_totals SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type;
+            DELETE FROM monthly_account_totals
+            WHERE user_id = OLD.user_id AND account_id = IFNULL(OLD.account_id, 0)
+              AND year_month = IFNULL(OLD.year_month, CAST(strftime('%Y%m', OLD.date) AS INTEGER))
+              AND type = OLD.type AND count <= 0;
+            INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total_cents, count)
+            VALUES (NEW.user_id, IFNULL(NEW.account_id, 0),
+                    IFNULL(NEW.year_month, CAST(strftime('%Y%m', NEW.date) AS INTEGER)),
+                    NEW.type, NEW.amount_cents, 1)
+            ON CONFLICT (user_id, account_id, year_month, type)
+            DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_networth_totals_insert AFTER INSERT ON monthly_account_totals BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, NEW.year_month)
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        """
+        CREATE TRIGGER trg_networth_totals_update AFTER UPDATE ON monthly_account_totals BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, MIN(OLD.year_month, NEW.year_month))
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        """
+        CREATE TRIGGER trg_networth_totals_delete AFTER DELETE ON monthly_account_totals BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (OLD.user_id, OLD.year_month)
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        "INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total_cents, count) "
+        + MONTHLY_TOTALS_SQL,
+        "DROP TABLE IF EXISTS networth_series",
+        """
+        CREATE TABLE networth_series (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            year_month INTEGER NOT NULL,
+            opening_cents INTEGER NOT NULL,
+            closing_cents INTEGER NOT NULL,
+            PRIMARY KEY (user_id, account_id, year_month)
+        ) WITHOUT ROWID
+        """,
+        "INSERT OR REPLACE INTO networth_dirty (user_id, from_month) SELECT DISTINCT user_id, 0 FROM accounts",
+    ),
+    # 7: login sessions (only a hash of each token is stored) and app-wide
+    # settings such as the session signing key
+    (
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+        """
+        CREATE TABLE IF NOT EXISTS app_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+        """,
+    ),
+    # 8: counters for the admin dashboard, kept current by triggers so it
+    # never scans users or transactions (core.stats reconciles them)
+    (
+        "CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            volume_cents INTEGER NOT NULL DEFAULT 0,
+            last_activity TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS signups_by_month (
+            year_month INTEGER PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_tx_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO user_stats (user_id, tx_count, volume_cents, last_activity)
+            VALUES (NEW.user_id, 1, NEW.amount_cents, strftime('%Y-%m-%dT%H:%M:%S', 'now'))
+            ON CONFLICT (user_id) DO UPDATE SET tx_count = tx_count + 1,
+                volume_cents = volume_cents + excluded.volume_cents, last_activity = excluded.last_activity;
+            UPDATE counters SET value = value + 1 WHERE name = 'transactions';
+            UPDATE counters SET value = value + NEW.amount_cents WHERE name = 'volume_cents';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_tx_delete AFTER DELETE ON transactions BEGIN
+            UPDATE user_stats SET tx_count = tx_count - 1, volume_cents = volume_cents - OLD.amount_cents,
+                last_activity = strftime('%Y-%m-%dT%H:%M:%S', 'now')
+            WHERE user_id = OLD.user_id;
+            UPDATE counters SET value = value - 1 WHERE name = 'transactions';
+            UPDATE counters SET value = value - OLD.amount_cents WHERE name = 'volume_cents';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_tx_update AFTER UPDATE ON transactions BEGIN
+            UPDATE user_stats SET tx_count = tx_count - 1, volume_cents = volume_cents - OLD.amount_cents
+            WHERE user_id = OLD.user_id;
+            INSERT INTO user_stats (user_id, tx_count, volume_cents, last_activity)
+            VALUES (NEW.user_id, 1, NEW.amount_cents, strftime('%Y-%m-%dT%H:%M:%S', 'now'))
+            ON CONFLICT (user_id) DO UPDATE SET tx_count = tx_count + 1,
+                volume_cents = volume_cents + excluded.volume_cents, last_activity = excluded.last_activity;
+            UPDATE counters SET value = value - OLD.amount_cents + NEW.amount_cents WHERE name = 'volume_cents';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'users';
+            INSERT INTO signups_by_month (year_month, count)
+            VALUES (CAST(strftime('%Y%m', IFNULL(NEW.created_at, 'now')) AS INTEGER), 1)
+            ON CONFLICT (year_month) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'users';
+            UPDATE signups_by_month SET count = count - 1
+            WHERE year_month = CAST(strftime('%Y%m', IFNULL(OLD.created_at, 'now')) AS INTEGER);
+            DELETE FROM user_stats WHERE user_id = OLD.user_id;
+        END
+        """,
+        *STATS_BACKFILL,
+    ),
+    # 9: full-text index over descriptions and categories (skipped where
+    # SQLite lacks FTS5; search then falls back to LIKE)
+    (_create_search_index,),
+    # 10: per-user count of edits and deletes, so caches built from appended
+    # rows (core.analytics) can tell when they have to start over
+    (
+        "ALTER TABLE user_stats ADD COLUMN edits INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_tx_edit
+        AFTER UPDATE OF user_id, account_id, category, type, amount_cents, year_month ON transactions BEGIN
+            UPDATE user_stats SET edits = edits + 1 WHERE user_id IN (OLD.user_id, NEW.user_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_tx_remove AFTER DELETE ON transactions BEGIN
+            UPDATE user_stats SET edits = edits + 1 WHERE user_id = OLD.user_id;
+        END
+        """,
+    ),
+    # 11: per-user categories (optionally nested one level under a parent);
+    # transactions keep the name for display and search and gain an integer
+    # key that category grouping and filtering use
+    (
+        """
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            parent_id INTEGER REFERENCES categories(id) ON DELETE SET NULL,
+            UNIQUE (user_id, name)
+        )
+        """,
+        "ALTER TABLE transactions ADD COLUMN category_id INTEGER REFERENCES categories(id)",
+        "INSERT OR IGNORE INTO categories (user_id, name) "
+        "SELECT DISTINCT user_id, category FROM transactions WHERE user_id IS NOT NULL AND category <> ''",
+        "CREATE INDEX IF NOT EXISTS idx_categories_parent ON categories(parent_id)",
+        _backfill_category_ids,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_category_date "
+        "ON transactions(user_id, category_id, tx_date)",
+    ),
+    # 12: migration 8 created the users delete trigger with OLD.user_id, a
+    # column users does not have, so every user delete failed
+    (
+        "DROP TRIGGER IF EXISTS trg_stats_users_delete",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'users';
+            UPDATE signups_by_month SET count = count - 1
+            WHERE year_month = CAST(strftime('%Y%m', IFNULL(OLD.created_at, 'now')) AS INTEGER);
+            DELETE FROM user_stats WHERE user_id = OLD.id;
+        END
+        """,
+    ),
+    # 13: one opening balance per account and YYYYMM month (months were bare
+    # names); balance edits now mark net worth dirty from their own month
+    (
+        _rekey_balances,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_balances_insert AFTER INSERT ON balances BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, NEW.year_month)
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_balances_update AFTER UPDATE ON balances BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (NEW.user_id, MIN(OLD.year_month, NEW.year_month))
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_networth_balances_delete AFTER DELETE ON balances BEGIN
+            INSERT INTO networth_dirty (user_id, from_month) VALUES (OLD.user_id, OLD.year_month)
+            ON CONFLICT (user_id) DO UPDATE SET from_month = MIN(from_month, excluded.from_month);
+        END
+        """,
+        "INSERT OR REPLACE INTO networth_dirty (user_id, from_month) SELECT DISTINCT user_id, 0 FROM accounts",
+    ),
+    # 14: openings the roll-over carries forward are written with manual = 0,
+    # so a later roll-over may refresh them; rows already there count as set
+    # by hand and are kept
+    (
+        "ALTER TABLE balances ADD COLUMN manual INTEGER NOT NULL DEFAULT 1",
+    ),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    """
+    Bring the database up to SCHEMA_VERSION, one migration per transaction.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        try:
+            conn.execute("BEGIN")
+            for stmt in MIGRATIONS[target - 1]:
+                if callable(stmt):
+                    stmt(conn)
+                else:
+                    conn.execute(stmt)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+@contextmanager
+def grouped():
+    """
+    Mark this thread as running inside a group commit (core.writer): the
+    caller owns the transaction, so query(commit=True) does not commit and
+    transaction() nests as a savepoint.
+    """
+    _local.grouped = True
+    try:
+        yield
+    finally:
+        _local.grouped = False
+
+
+def in_group():
+    return getattr(_local, "grouped", False)
+
+
+@contextmanager
+def transaction():
+    """
+    Run a block of writes as one transaction on this thread's connection:
+    a single commit on success, a rollback if anything raises. Inside a
+    group commit (see grouped()) the block becomes a savepoint instead.
+    """
+    conn = get_conn()
+    if in_group():
+        conn.execute("SAVEPOINT tx")
+        try:
+            yield conn
+            conn.execute("RELEASE tx")
+        except Exception:
+            conn.execute("ROLLBACK TO tx")
+            conn.execute("RELEASE tx")
+            raise
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
 def query(query, params=(), commit=False, fetchone=False, fetchall=False):
     conn = get_conn()
+    started = time.perf_counter() if profiling.enabled else None
+    try:
+        cur = conn.execute(query, params)
+        result = None
+        if fetchone:
+            row = cur.fetchone()
+            result = dict(row) if row else None
+        if fetchall:
+            rows = cur.fetchall()
+            result = [dict(r) for r in rows] if rows else []
+        if commit and not in_group():
+            conn.commit()
+        if started is not None:
+            rows = len(result) if fetchall else int(result is not None) if fetchone else max(cur.rowcount, 0)
+            profiling.record(conn, query, params, started, rows)
+        return result
+    except Exception:
+        # The connection outlives this call, so never leave a half-done write open on it
+        # (a group commit undoes just the failed item itself)
+        if conn.in_transaction and not in_group():
+            conn.rollback()
+        raise
+
+
+def _column(values, dtype):
+    if dtype == "category":
+        return pd.Categorical(values)
+    if dtype == "datetime64[ns]":
+        return pd.to_datetime(pd.Series(values, dtype=object), format="ISO8601", errors="coerce")
+    if dtype is not None:
+        return np.array(values, dtype=dtype)
+    return pd.Series(values, dtype=object)
+
+
+def query_frame(query, params=(), dtypes=None, chunk_size=10000):
+    """
+    Run a SELECT and build a DataFrame column by column from plain tuples,
+    skipping per-row dicts. `dtypes` maps column names to "category",
+    "datetime64[ns]", "float64", "int64" etc.; other columns stay object.
+    """
+    dtypes = dtypes or {}
+    conn = get_conn()
+    started = time.perf_counter() if profiling.enabled else None
     cur = conn.cursor()
+    cur.row_factory = None
     cur.execute(query, params)
-    result = None
-    if fetchone:
-        row = cur.fetchone()
-        result = dict(row) if row else None
-    if fetchall:
-        rows = cur.fetchall()
-        result = [dict(r) for r in rows] if rows else []
-    if commit:
-        conn.commit()
-    conn.close()
-    return result
+    names = [d[0] for d in cur.description]
+    columns = [[] for _ in names]
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        for col, values in zip(columns, zip(*rows)):
+            col.extend(values)
+    if started is not None:
+        profiling.record(conn, query, params, started, len(columns[0]) if columns else 0)
+    return pd.DataFrame(
+        {name: _column(values, dtypes.get(name)) for name, values in zip(names, columns)},
+        columns=names,
+    )
@@ -0,0 +1,207 @@
+"""
+Streaming transaction exports (CSV, Parquet, XLSX).
+
+Rows are read from the cursor in chunks and written straight to a temp
+file, so memory stays flat whatever the export size. Exports run on a small
+worker pool (each worker has its own connection) and are started only when
+a user asks for one.
+"""
+import csv
+import heapq
+import importlib.util
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from core.database import get_conn, shard_paths, tenant, use_db
+from core.money import to_decimal
+from core.transactions import filter_clauses
+
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "money_magic_exports")
+EXPORT_MAX_AGE = 3600  # seconds a finished export file is kept
+CHUNK_SIZE = 5000
+
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+
+# Package each format needs beyond the standard library
+REQUIRES = {"parquet": "pyarrow", "xlsx": "openpyxl"}
+
+XLSX_MAX_ROWS = 1_048_576  # rows per Excel worksheet, header included
+
+COLUMNS = ["Transaction_ID", "Date", "Account", "Category", "Description", "Type", "Amount", "User_ID"]
+
+_EXPORT_SELECT = """SELECT t.tx_uuid, t.tx_date, a.name, t.category, t.description,
+                  t.type, t.amount_cents, t.user_id
+           FROM transactions t
+           LEFT JOIN accounts a ON t.account_id = a.id"""
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+
+
+def available_formats():
+    """The FORMATS whose packages are installed, checked without importing them."""
+    return [f for f in FORMATS if f not in REQUIRES or importlib.util.find_spec(REQUIRES[f]) is not None]
+
+
+def iter_chunks(sql, params=(), chunk_size=CHUNK_SIZE):
+    """Yield lists of plain row tuples, chunk_size at a time."""
+    cur = get_conn().cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def merged_chunks(sql, params=(), chunk_size=CHUNK_SIZE):
+    """
+    Like iter_chunks() over every shard at once: one cursor per shard,
+    merged newest first on the date column (the second), so the output
+    stays sorted while only a chunk per shard is held in memory.
+    """
+    def shard_rows(path):
+        with use_db(path):
+            cur = get_conn().cursor()
+        cur.row_factory = None
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+    chunk = []
+    for row in heapq.merge(*(shard_rows(p) for p in shard_paths()), key=lambda r: r[1], reverse=True):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _rows(chunks):
+    # Amount leaves the database as exact integer cents and becomes a Decimal here
+    for chunk in chunks:
+        yield [r[:6] + (to_decimal(r[6]),) + r[7:] for r in chunk]
+
+
+def write_csv(path, chunks):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        for rows in _rows(chunks):
+            w.writerows(rows)
+
+
+def write_parquet(path, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the pyarrow package.")
+    schema = pa.schema([
+        ("Transaction_ID", pa.string()), ("Date", pa.string()), ("Account", pa.string()),
+        ("Category", pa.string()), ("Description", pa.string()), ("Type", pa.string()),
+        ("Amount", pa.decimal128(18, 2)), ("User_ID", pa.int64()),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        # one row group per chunk
+        for rows in _rows(chunks):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)],
+                schema=schema,
+            ))
+
+
+def write_xlsx(path, chunks):
+    """Rows past a worksheet's limit continue on "Transactions 2", "Transactions 3", ..."""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("XLSX export needs the openpyxl package.")
+    wb = Workbook(write_only=True)
+    sheets = 0
+    ws, room = None, 0
+    for rows in _rows(chunks):
+        for r in rows:
+            if not room:
+                sheets += 1
+                ws = wb.create_sheet("Transactions" if sheets == 1 else f"Transactions {sheets}")
+                ws.append(COLUMNS)
+                room = XLSX_MAX_ROWS - 1
+            ws.append(r)
+            room -= 1
+    if ws is None:
+        wb.create_sheet("Transactions").append(COLUMNS)
+    wb.save(path)
+
+
+_WRITERS = {"csv": write_csv, "parquet": write_parquet, "xlsx": write_xlsx}
+
+
+def export_transactions(fmt, user_id, is_admin=False, all_users=False, full_history=False,
+                        chunk_size=CHUNK_SIZE, **filters):
+    """
+    Write matching transactions to a temp file and return its path.
+
+    `filters` are fetch_transactions() filters; full_history ignores the date
+    filters. all_users (admins only) exports every user's rows.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt not in available_formats():
+        raise RuntimeError(f"{fmt.upper()} export needs the {REQUIRES[fmt]} package.")
+    if all_users and not is_admin:
+        raise PermissionError("Only admins can export all users' transactions.")
+    if full_history:
+        for key in ("month_filter", "start_date", "end_date", "year"):
+            filters.pop(key, None)
+    clauses, params = filter_clauses(user_id=user_id, is_admin=all_users, **filters)
+    sql = _EXPORT_SELECT
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY t.tx_date DESC, t.id DESC"
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(
+        prefix=f"transactions_{datetime.now():%Y%m%d_%H%M%S}_", suffix=FORMATS[fmt][1], dir=EXPORT_DIR
+    )
+    os.close(fd)
+    try:
+        if all_users and shard_paths():
+            _WRITERS[fmt](path, merged_chunks(sql, tuple(params), chunk_size))
+        else:
+            with tenant(user_id):
+                _WRITERS[fmt](path, iter_chunks(sql, tuple(params), chunk_size))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def cleanup_exports(max_age=EXPORT_MAX_AGE):
+    """Delete export files older than max_age seconds."""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def submit_export(fmt, user_id, **kwargs):
+    """Start export_transactions() on the export pool; returns a Future of the path."""
+    cleanup_exports()
+    return _pool.submit(export_transactions, fmt, user_id, **kwargs)
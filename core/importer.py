@@ -0,0 +1,304 @@
+"""
+Bulk import of bank statements (CSV or OFX/QFX).
+
+Rows are streamed from the file, mapped to accounts and categories, and
+inserted in chunked executemany batches, one transaction per chunk.
+Duplicates are skipped through the unique (user_id, fingerprint) index, so
+re-importing an overlapping statement only adds the new rows; any other
+constraint failure still raises. Identical lines are numbered within their
+date, and only the OCCURRENCE_DATES most recently seen dates are tracked,
+so memory stays bounded however long the statement is.
+
+    python -m core.importer statement.csv --user-id 1 --account "HDFC Savings"
+"""
+import argparse
+import csv
+import hashlib
+import io
+import re
+import sys
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from dateutil import parser as date_parser
+from core.database import init_db, transaction, routed
+from core.categories import ids_for
+from core.accounts import get_accounts
+from core.transactions import date_fields
+from core.cache import bump
+from core.writer import queued
+from core.money import to_cents
+
+# Normalized field -> CSV header. None means the statement has no such column.
+DEFAULT_COLUMNS = {
+    "date": "Date",
+    "description": "Description",
+    "amount": "Amount",
+    "type": "Type",
+    "category": "Category",
+    "account": "Account",
+    "reference": None,
+}
+
+CHUNK_SIZE = 1000
+# Dates whose identical-line counts are kept. Statements in either date order
+# or only locally shuffled are numbered exactly; a date that comes back after
+# this many other dates starts counting from zero again.
+OCCURRENCE_DATES = 64
+
+_TYPE_ALIASES = {
+    "income": "Income", "credit": "Income", "cr": "Income", "dep": "Income", "deposit": "Income",
+    "expense": "Expense", "debit": "Expense", "dr": "Expense", "withdrawal": "Expense",
+}
+
+
+def _parse_amount(value):
+    s = str(value or "").strip()
+    negative = s.startswith("(") and s.endswith(")")
+    s = re.sub(r"[^0-9.\-]", "", s)
+    try:
+        amount = Decimal(s)
+    except InvalidOperation:
+        return None
+    return -abs(amount) if negative else amount
+
+
+def _parse_date(value, date_format=None, dayfirst=False):
+    if date_format:
+        return datetime.strptime(value.strip(), date_format).date()
+    return date_parser.parse(value, dayfirst=dayfirst).date()
+
+
+def read_csv(fileobj, columns=None, date_format=None, dayfirst=False):
+    """
+    Yield normalized row dicts from a CSV statement, one row at a time.
+    `columns` overrides entries of DEFAULT_COLUMNS.
+    """
+    cols = dict(DEFAULT_COLUMNS, **(columns or {}))
+    for rec in csv.DictReader(fileobj):
+        get = lambda field: rec.get(cols[field]) if cols.get(field) else None
+        raw_date = get("date")
+        amount = _parse_amount(get("amount"))
+        try:
+            tx_date = _parse_date(raw_date, date_format, dayfirst) if raw_date else None
+        except (ValueError, OverflowError):
+            tx_date = None
+        if tx_date is None or amount is None:
+            yield None
+            continue
+        yield {
+            "date": tx_date,
+            "description": (get("description") or "").strip(),
+            "amount": amount,
+            "type": (get("type") or "").strip(),
+            "category": (get("category") or "").strip(),
+            "account": (get("account") or "").strip(),
+            "reference": (get("reference") or "").strip(),
+        }
+
+
+def _ofx_tags(fileobj, chunk_size=65536):
+    """Yield (TAG, value) pairs from SGML or XML OFX without loading the file."""
+    buf = ""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        buf += chunk
+        parts = buf.split("<")
+        buf = parts.pop() if chunk else ""
+        for part in parts:
+            tag, _, value = part.partition(">")
+            if tag:
+                yield tag.strip().upper(), value.strip()
+        if not chunk:
+            return
+
+
+def read_ofx(fileobj):
+    """Yield normalized row dicts from the STMTTRN blocks of an OFX/QFX statement."""
+    current = None
+    for tag, value in _ofx_tags(fileobj):
+        if tag == "STMTTRN":
+            current = {}
+        elif tag == "/STMTTRN" and current is not None:
+            amount = _parse_amount(current.get("TRNAMT"))
+            posted = current.get("DTPOSTED", "")[:8]
+            if amount is None or len(posted) != 8:
+                yield None
+            else:
+                yield {
+                    "date": datetime.strptime(posted, "%Y%m%d").date(),
+                    "description": current.get("NAME") or current.get("MEMO") or "",
+                    "amount": amount,
+                    "type": "",
+                    "category": "",
+                    "account": "",
+                    "reference": current.get("FITID", ""),
+                }
+            current = None
+        elif current is not None and not tag.startswith("/"):
+            current[tag] = value
+
+
+def fingerprint(user_id, account_id, row, occurrence=0):
+    """
+    Content hash identifying a statement line. Identical lines on the same
+    day (two equal coffees) are told apart by `occurrence`, their position
+    among the identical rows of that date in the file.
+    """
+    key = "|".join(str(v) for v in (
+        user_id, account_id, row["date"].isoformat(), f"{row['amount']:.2f}",
+        row["description"].lower(), row["reference"], occurrence,
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _categorize(row, category_rules, default_category):
+    if row["category"]:
+        return row["category"]
+    desc = row["description"].lower()
+    for keyword, category in (category_rules or {}).items():
+        if keyword.lower() in desc:
+            return category
+    return default_category
+
+
+@queued
+def _insert_batch(user_id, batch):
+    """Insert one chunk of transaction rows; returns how many were new."""
+    with transaction() as conn:
+        category_ids = ids_for(conn, user_id, {r[5] for r in batch})
+        # rowcount, unlike total_changes, leaves out rows the triggers write
+        return conn.executemany(
+            """
+            INSERT INTO transactions
+            (tx_uuid, date, tx_date, year_month, account_id, category, description, type, amount_cents,
+             user_id, created_at, fingerprint, category_id)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
+            ON CONFLICT (user_id, fingerprint) WHERE fingerprint IS NOT NULL DO NOTHING
+            """,
+            [r + (category_ids.get(r[5]),) for r in batch],
+        ).rowcount
+
+
+@routed()
+def import_rows(rows, user_id, default_account_id=None, category_rules=None,
+                default_category="Other", chunk_size=CHUNK_SIZE, on_progress=None):
+    """
+    Insert streamed rows for a user, skipping ones already imported.
+
+    Accounts are resolved by the row's account name, falling back to
+    default_account_id. on_progress(stats) is called after every chunk.
+    Returns stats: read, inserted, duplicates and skipped counts.
+    """
+    accounts = {a["name"].lower(): a["id"] for a in get_accounts(user_id)}
+    stats = {"read": 0, "inserted": 0, "duplicates": 0, "skipped": 0}
+    created_at = datetime.utcnow().isoformat()
+    occurrences = OrderedDict()  # date -> {identical-line key: count}, least recently seen first
+    batch = []
+
+    def flush():
+        inserted = _insert_batch(user_id, batch)
+        stats["inserted"] += inserted
+        if inserted:
+            bump(user_id)
+        stats["duplicates"] += len(batch) - inserted
+        batch.clear()
+        if on_progress:
+            on_progress(dict(stats))
+
+    for row in rows:
+        stats["read"] += 1
+        if row is None:
+            stats["skipped"] += 1
+            continue
+        account_id = accounts.get(row["account"].lower(), default_account_id) if row["account"] else default_account_id
+        if account_id is None:
+            stats["skipped"] += 1
+            continue
+
+        seen = occurrences.get(row["date"])
+        if seen is None:
+            seen = occurrences[row["date"]] = {}
+            if len(occurrences) > OCCURRENCE_DATES:
+                occurrences.popitem(last=False)
+        else:
+            occurrences.move_to_end(row["date"])
+        base = (account_id, row["amount"], row["description"], row["reference"])
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+
+        tx_type = _TYPE_ALIASES.get(row["type"].lower()) or ("Expense" if row["amount"] < 0 else "Income")
+        raw_date, day, year_month = date_fields(row["date"])
+        batch.append((
+            str(uuid.uuid4()), raw_date, day, year_month, account_id,
+            _categorize(row, category_rules, default_category), row["description"], tx_type,
+            to_cents(abs(row["amount"])), user_id, created_at,
+            fingerprint(user_id, account_id, row, occurrence),
+        ))
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+def detect_format(filename):
+    return "ofx" if filename.lower().endswith((".ofx", ".qfx")) else "csv"
+
+
+@routed()
+def import_file(fileobj, user_id, fmt="csv", columns=None, date_format=None, dayfirst=False, **kwargs):
+    """
+    Import an open statement file. Binary files (e.g. Streamlit uploads)
+    are decoded as UTF-8; kwargs are passed on to import_rows().
+    """
+    if isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)) or "b" in getattr(fileobj, "mode", ""):
+        fileobj = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+    if fmt == "ofx":
+        rows = read_ofx(fileobj)
+    else:
+        rows = read_csv(fileobj, columns, date_format, dayfirst)
+    return import_rows(rows, user_id, **kwargs)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m core.importer", description="Import a bank statement.")
+    ap.add_argument("path")
+    ap.add_argument("--user-id", type=int, required=True)
+    ap.add_argument("--account", help="account name used for rows without an Account column")
+    ap.add_argument("--format", choices=["csv", "ofx"])
+    ap.add_argument("--date-format", help="strptime format, e.g. %%d/%%m/%%Y")
+    ap.add_argument("--dayfirst", action="store_true")
+    ap.add_argument("--column", action="append", default=[], metavar="FIELD=HEADER",
+                    help="map a field (date, description, amount, type, category, account, reference) to a CSV header")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = ap.parse_args(argv)
+
+    init_db()
+    default_account_id = None
+    if args.account:
+        default_account_id = next(
+            (a["id"] for a in get_accounts(args.user_id) if a["name"] == args.account), None
+        )
+        if default_account_id is None:
+            ap.error(f"unknown account for user {args.user_id}: {args.account}")
+    columns = dict(c.split("=", 1) for c in args.column)
+
+    def progress(stats):
+        print(f"\rread {stats['read']:,}  inserted {stats['inserted']:,}  "
+              f"duplicates {stats['duplicates']:,}", end="", file=sys.stderr)
+
+    started = datetime.now()
+    with open(args.path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        stats = import_file(
+            f, args.user_id, args.format or detect_format(args.path), columns,
+            args.date_format, args.dayfirst, default_account_id=default_account_id,
+            chunk_size=args.chunk_size, on_progress=progress,
+        )
+    print(file=sys.stderr)
+    print(f"{stats} in {(datetime.now() - started).total_seconds():.1f}s")
+
+
+if __name__ == "__main__":
+    main()
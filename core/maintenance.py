@@ -0,0 +1,275 @@
+"""
+Online backups and housekeeping for the catalog and every shard.
+
+    python -m core.maintenance backup [--dest DIR]    # page-stepped copy via the backup API
+    python -m core.maintenance snapshot [--dest DIR]  # compacted copy via VACUUM INTO
+    python -m core.maintenance optimize [--analyze]   # PRAGMA optimize (or a full ANALYZE)
+    python -m core.maintenance checkpoint [--mode M]  # WAL checkpoint (PASSIVE, FULL, RESTART, TRUNCATE)
+    python -m core.maintenance status                 # size, free pages and WAL size
+
+Backups copy BACKUP_PAGES pages per step and sleep between steps. Writers
+only wait for one step, never for the whole copy. A write from another
+connection restarts a stepped copy. After BACKUP_MAX_RESTARTS restarts the
+rest is copied in one step; under WAL that is one read snapshot and does
+not hold writers up either. A snapshot is a single
+read transaction, which WAL readers hold without blocking writers. Freed
+pages are left out, so the copy is also the compacted file. Every command
+reports size and duration per database file.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from core import database
+from core.database import get_conn, init_db, query, shard_paths, use_db
+from core.writer import queued
+
+BACKUP_DIR = os.environ.get("MONEY_MAGIC_BACKUP_DIR") or os.path.splitext(database.DB_PATH)[0] + "_backups"
+BACKUP_PAGES = 256        # pages copied per backup step
+BACKUP_SLEEP = 0.01       # seconds between steps, when writers get the lock
+BACKUP_MAX_RESTARTS = 3   # stepped copies restarted by other writers before copying in one step
+OPTIMIZE_INTERVAL = 24 * 3600  # seconds between scheduled optimize + checkpoint runs
+BACKUP_INTERVAL = int(os.environ.get("MONEY_MAGIC_BACKUP_INTERVAL") or 0)  # seconds; 0: no scheduled backups
+ANALYSIS_LIMIT = 1000     # rows per index sampled by PRAGMA optimize
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def databases():
+    """The catalog followed by every shard file."""
+    return [database.DB_PATH] + shard_paths()
+
+
+def file_size(path):
+    """Bytes on disk for a database, counting its WAL."""
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def _target(dest_dir, path, stamp):
+    folder = os.path.join(dest_dir or BACKUP_DIR, stamp)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, os.path.basename(path))
+
+
+def _stamp(kind):
+    return datetime.now().strftime("%Y%m%d-%H%M%S-") + kind
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy(path, dest, pages, sleep):
+    # returns how often other writers restarted the stepped copy
+    seen = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if seen["remaining"] is not None and remaining > seen["remaining"]:
+            seen["restarts"] += 1
+            if seen["restarts"] >= BACKUP_MAX_RESTARTS:
+                raise _Restarted()
+        seen["remaining"] = remaining
+        # sqlite3 only sleeps when a step finds the file busy; pause after every step
+        time.sleep(sleep)
+
+    with use_db(path):
+        target = sqlite3.connect(dest)
+        try:
+            try:
+                get_conn().backup(target, pages=pages, progress=progress)
+            except _Restarted:
+                get_conn().backup(target, pages=-1)
+        finally:
+            target.close()
+    return seen["restarts"]
+
+
+def backup(dest_dir=None, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """
+    Copy every database file into dest_dir/<timestamp>-backup/ with the online
+    backup API. Returns one report per file: source, dest, bytes, restarts,
+    seconds.
+    """
+    stamp = _stamp("backup")
+    reports = []
+    for path in databases():
+        dest = _target(dest_dir, path, stamp)
+        started = time.perf_counter()
+        restarts = _copy(path, dest, pages, sleep)
+        reports.append({
+            "source": path, "dest": dest, "bytes": file_size(dest), "restarts": restarts,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+    return reports
+
+
+def snapshot(dest_dir=None):
+    """
+    Write a compacted, consistent copy of every database file into
+    dest_dir/<timestamp>-snapshot/ with VACUUM INTO. Reports include the live size
+    for comparison.
+    """
+    stamp = _stamp("snapshot")
+    reports = []
+    for path in databases():
+        dest = _target(dest_dir, path, stamp)
+        started = time.perf_counter()
+        with use_db(path):
+            get_conn().execute("VACUUM INTO ?", (dest,))
+        reports.append({
+            "source": path, "dest": dest, "source_bytes": file_size(path), "bytes": file_size(dest),
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+    return reports
+
+
+@queued
+def _analyze(analyze):
+    # on the writer: ANALYZE writes sqlite_stat1 and needs the write lock
+    if analyze:
+        query("ANALYZE", commit=True)
+    else:
+        query(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        query("PRAGMA optimize", commit=True)
+
+
+def optimize(analyze=False):
+    """
+    Refresh planner statistics on every database file: PRAGMA optimize
+    (which analyzes only tables whose stats look stale, sampling
+    ANALYSIS_LIMIT rows per index), or a full ANALYZE. Each file's run goes
+    through its writer, like any other write.
+    """
+    reports = []
+    for path in databases():
+        started = time.perf_counter()
+        with use_db(path):
+            _analyze(analyze)
+        reports.append({"source": path, "bytes": file_size(path), "seconds": round(time.perf_counter() - started, 3)})
+    return reports
+
+
+def checkpoint(mode="PASSIVE"):
+    """
+    Checkpoint every WAL. PASSIVE never waits for anyone; TRUNCATE also
+    shrinks the -wal file to zero but waits for readers and writers.
+    """
+    mode = mode.upper()
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    reports = []
+    for path in databases():
+        wal_before = os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0
+        started = time.perf_counter()
+        with use_db(path):
+            busy, log_frames, done = get_conn().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        reports.append({
+            "source": path, "busy": bool(busy), "wal_frames": log_frames, "checkpointed": done,
+            "wal_before_bytes": wal_before,
+            "wal_bytes": os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+    return reports
+
+
+def status():
+    """Size, page counts and reclaimable free pages for every database file."""
+    reports = []
+    for path in databases():
+        with use_db(path):
+            conn = get_conn()
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        reports.append({
+            "source": path, "bytes": file_size(path), "pages": pages, "free_pages": free,
+            "free_bytes": free * page_size,
+            "wal_bytes": os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0,
+        })
+    return reports
+
+
+def start_scheduler(optimize_interval=OPTIMIZE_INTERVAL, backup_interval=BACKUP_INTERVAL):
+    """
+    Run optimize() and a passive checkpoint every `optimize_interval`
+    seconds, and backup() every `backup_interval` (0: never), on a daemon
+    thread (once per process).
+    """
+    global _scheduler
+
+    def loop():
+        next_optimize = time.monotonic() + optimize_interval
+        next_backup = time.monotonic() + backup_interval if backup_interval else None
+        while True:
+            now = time.monotonic()
+            wake = min(t for t in (next_optimize, next_backup) if t is not None)
+            time.sleep(max(wake - now, 0))
+            now = time.monotonic()
+            try:
+                if now >= next_optimize:
+                    optimize()
+                    checkpoint("PASSIVE")
+                    next_optimize = now + optimize_interval
+                if next_backup is not None and now >= next_backup:
+                    backup()
+                    next_backup = now + backup_interval
+            except Exception as e:
+                print(f"maintenance failed: {e}", file=sys.stderr)
+                next_optimize = max(next_optimize, now + 60)
+                if next_backup is not None:
+                    next_backup = max(next_backup, now + 60)
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=loop, name="maintenance", daemon=True)
+            _scheduler.start()
+
+
+def _print(reports):
+    for r in reports:
+        parts = [os.path.basename(r["source"])]
+        for key, value in r.items():
+            if key == "source":
+                continue
+            if key.endswith("bytes"):
+                value = f"{value / 1024 / 1024:.2f} MB"
+            elif key == "seconds":
+                value = f"{value:.3f}s"
+            parts.append(f"{key}={value}")
+        print("  ".join(parts))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m core.maintenance", description=__doc__.strip().splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    for name in ("backup", "snapshot"):
+        p = sub.add_parser(name)
+        p.add_argument("--dest", help=f"directory for the copies (default {BACKUP_DIR})")
+    sub.add_parser("optimize").add_argument("--analyze", action="store_true", help="run a full ANALYZE")
+    sub.add_parser("checkpoint").add_argument("--mode", default="PASSIVE")
+    sub.add_parser("status")
+    args = ap.parse_args(argv)
+
+    init_db()
+    started = time.perf_counter()
+    if args.command == "backup":
+        reports = backup(args.dest)
+    elif args.command == "snapshot":
+        reports = snapshot(args.dest)
+    elif args.command == "optimize":
+        reports = optimize(args.analyze)
+    elif args.command == "checkpoint":
+        reports = checkpoint(args.mode)
+    else:
+        reports = status()
+    _print(reports)
+    print(f"{args.command}: {len(reports)} file(s) in {time.perf_counter() - started:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Money is stored and summed as integer minor units (paise/cents).
+Values are converted to and from rupees only at the edges: user input,
+imported statements, and display.
+"""
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+CENT = Decimal("0.01")
+
+
+def to_cents(value):
+    """Convert a rupee amount (number, Decimal or numeric string) to integer cents."""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, int):
+        return value * 100
+    try:
+        # str() first so a float like 0.1 converts by its shortest repr, not its binary value
+        d = Decimal(value) if isinstance(value, Decimal) else Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Not a money amount: {value!r}")
+    return int(d.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    """Rupees as a float, for display and widgets only."""
+    return (cents or 0) / 100
+
+
+def to_decimal(cents):
+    """Exact rupee amount of integer cents."""
+    return (Decimal(int(cents or 0)) / 100).quantize(CENT)
+
+
+def format_money(cents, symbol="₹"):
+    """Format integer cents as e.g. ₹1,234.50 without going through float."""
+    cents = int(cents or 0)
+    sign = "-" if cents < 0 else ""
+    whole, frac = divmod(abs(cents), 100)
+    return f"{sign}{symbol}{whole:,}.{frac:02d}"
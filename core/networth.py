@@ -0,0 +1,140 @@
+"""
+Running per-account balances and net worth across all months.
+
+Each account's closing for a month is carried forward as the next month's
+opening unless an opening balance was set by hand for that month. Openings
+the roll-over wrote (balances.manual = 0) are copies of that carry, so the
+carry is used for them rather than the possibly stale copy. Results are
+cached in networth_series; writes mark the user dirty from the month they
+touch (see migration 4), and refresh() recomputes only from that month on.
+"""
+import pandas as pd
+from core.database import query, transaction, routed
+from core.writer import queued
+
+
+def _explicit_openings(conn, user_id, from_month):
+    return {
+        (r["account_id"], r["year_month"]): r["opening_cents"]
+        for r in conn.execute(
+            "SELECT account_id, year_month, CASE WHEN manual THEN opening_cents END AS opening_cents "
+            "FROM balances WHERE user_id = ? AND year_month >= ?",
+            (user_id, from_month),
+        )
+    }
+
+
+@routed()
+def refresh(user_id):
+    """
+    Recompute the cached series for a user from their earliest dirty month.
+    Returns the month recomputed from, or None if the cache was current.
+    """
+    if not query("SELECT 1 FROM networth_dirty WHERE user_id = ?", (user_id,), fetchone=True):
+        return None
+    return _recompute(user_id)
+
+
+@queued
+def _recompute(user_id):
+    # on the writer: the read path (networth_series) only waits for it
+    with transaction() as conn:
+        row = conn.execute("SELECT from_month FROM networth_dirty WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        from_month = row["from_month"]
+
+        account_types = {
+            r["id"]: r["type"]
+            for r in conn.execute("SELECT id, type FROM accounts WHERE user_id = ?", (user_id,))
+        }
+        carry = {
+            r["account_id"]: r["closing_cents"]
+            for r in conn.execute(
+                """
+                SELECT s.account_id, s.closing_cents FROM networth_series s
+                WHERE s.user_id = ? AND s.year_month = (
+                    SELECT MAX(year_month) FROM networth_series
+                    WHERE user_id = s.user_id AND account_id = s.account_id AND year_month < ?
+                )
+                """,
+                (user_id, from_month),
+            )
+        }
+        flows = {}
+        for r in conn.execute(
+            """
+            SELECT account_id, year_month,
+                   SUM(CASE WHEN type = 'Income' THEN total_cents ELSE 0 END) AS income,
+                   SUM(CASE WHEN type = 'Expense' THEN total_cents ELSE 0 END) AS expense
+            FROM monthly_account_totals
+            WHERE user_id = ? AND year_month >= ?
+            GROUP BY account_id, year_month
+            """,
+            (user_id, from_month),
+        ):
+            flows[(r["account_id"], r["year_month"])] = (r["income"], r["expense"])
+        openings = _explicit_openings(conn, user_id, from_month)
+
+        rows = []
+        for ym in sorted({ym for _, ym in flows} | {ym for _, ym in openings}):
+            for account_id, acc_type in account_types.items():
+                key = (account_id, ym)
+                if key not in flows and key not in openings:
+                    continue
+                opening = openings.get(key)
+                if opening is None:
+                    opening = carry.get(account_id, 0)
+                income, expense = flows.get(key, (0, 0))
+                if acc_type == "Debit":
+                    closing = opening + income - expense
+                else:  # Credit: outstanding grows with spend
+                    closing = opening + expense - income
+                carry[account_id] = closing
+                rows.append((user_id, account_id, ym, opening, closing))
+
+        conn.execute("DELETE FROM networth_series WHERE user_id = ? AND year_month >= ?", (user_id, from_month))
+        conn.executemany(
+            "INSERT INTO networth_series (user_id, account_id, year_month, opening_cents, closing_cents) "
+            "VALUES (?,?,?,?,?)",
+            rows,
+        )
+        conn.execute("DELETE FROM networth_dirty WHERE user_id = ?", (user_id,))
+    return from_month
+
+
+@routed()
+def networth_series(user_id):
+    """
+    Month-by-month totals for a user, indexed by YYYYMM: Debit (sum of debit
+    closings), Credit (sum of credit outstanding) and Net Worth (Debit - Credit),
+    in rupees. Accounts without activity in a month keep their last closing;
+    sums run over int64 cents and are converted once at the end.
+    """
+    refresh(user_id)
+    rows = query(
+        """
+        SELECT s.year_month, s.account_id, s.closing_cents, a.type
+        FROM networth_series s JOIN accounts a ON a.id = s.account_id
+        WHERE s.user_id = ?
+        """,
+        (user_id,),
+        fetchall=True,
+    )
+    if not rows:
+        return pd.DataFrame(columns=["Debit", "Credit", "Net Worth"])
+    df = pd.DataFrame(rows)
+    closings = (
+        df.pivot(index="year_month", columns="account_id", values="closing_cents")
+        .sort_index().ffill().fillna(0).astype("int64")
+    )
+    types = df.drop_duplicates("account_id").set_index("account_id")["type"]
+    debit_cols = [c for c in closings.columns if types[c] == "Debit"]
+    credit_cols = [c for c in closings.columns if types[c] != "Debit"]
+    debit = closings[debit_cols].to_numpy().sum(axis=1, dtype="int64")
+    credit = closings[credit_cols].to_numpy().sum(axis=1, dtype="int64")
+    return pd.DataFrame(
+        {"Debit": debit / 100, "Credit": credit / 100, "Net Worth": (debit - credit) / 100},
+        index=closings.index,
+    )
+
@@ -0,0 +1,159 @@
+"""
+Optional instrumentation for core.database.query() and query_frame().
+
+When enabled, every statement records its latency (into a histogram),
+row count and the rerun it ran in; statements slower than SLOW_MS are kept
+in a slow log together with their EXPLAIN QUERY PLAN. Statements issued many
+times in one rerun are reported as likely N+1 patterns.
+
+Off by default: set MONEY_MAGIC_PROFILE=1 (or call enable()). While off,
+the only cost in query() is a check of `enabled`. Set
+MONEY_MAGIC_PROFILE_DUMP=path to write a JSON snapshot at exit.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+enabled = os.environ.get("MONEY_MAGIC_PROFILE", "") not in ("", "0", "false")
+SLOW_MS = float(os.environ.get("MONEY_MAGIC_SLOW_MS", "100"))
+N_PLUS_ONE_CALLS = 10  # same statement this many times in one rerun is suspicious
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+_lock = threading.Lock()
+_statements = {}
+_slow = deque(maxlen=100)
+_reruns = deque(maxlen=50)
+_local = threading.local()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _slow.clear()
+        _reruns.clear()
+
+
+def normalize(sql):
+    """Collapse whitespace and IN (?,?,...) lists so one statement is one key."""
+    sql = " ".join(sql.split())
+    return re.sub(r"\?(\s*,\s*\?)+", "?, ...", sql)
+
+
+def start_rerun(label=""):
+    """Mark the start of a script run on this thread; later queries count towards it."""
+    if not enabled:
+        return
+    rerun = {"label": label, "started_at": time.time(), "queries": 0, "ms": 0.0, "calls": {}}
+    _local.rerun = rerun
+    with _lock:
+        _reruns.append(rerun)
+
+
+def _plan(conn, sql, params):
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except Exception as e:
+        return [f"(no plan: {e})"]
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def record(conn, sql, params, started, rows):
+    """Account one finished statement; `started` is its time.perf_counter() start."""
+    ms = (time.perf_counter() - started) * 1000
+    key = normalize(sql)
+    bucket = next((i for i, bound in enumerate(BUCKETS) if ms <= bound), len(BUCKETS))
+    with _lock:
+        s = _statements.get(key)
+        if s is None:
+            s = _statements[key] = {
+                "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                "histogram": [0] * (len(BUCKETS) + 1),
+            }
+        s["calls"] += 1
+        s["total_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+        s["rows"] += rows or 0
+        s["histogram"][bucket] += 1
+        rerun = getattr(_local, "rerun", None)
+        if rerun is not None:
+            rerun["queries"] += 1
+            rerun["ms"] += ms
+            rerun["calls"][key] = rerun["calls"].get(key, 0) + 1
+    if ms >= SLOW_MS:
+        entry = {
+            "sql": key, "params": repr(params)[:200], "ms": round(ms, 3), "rows": rows,
+            "at": time.time(), "plan": _plan(conn, sql, params),
+        }
+        with _lock:
+            _slow.append(entry)
+
+
+def _bucket_labels():
+    return [f"<={b}ms" for b in BUCKETS] + [f">{BUCKETS[-1]}ms"]
+
+
+def snapshot():
+    """Everything recorded so far as plain JSON-able data."""
+    labels = _bucket_labels()
+    with _lock:
+        statements = [
+            {
+                "sql": sql,
+                "calls": s["calls"],
+                "total_ms": round(s["total_ms"], 3),
+                "mean_ms": round(s["total_ms"] / s["calls"], 3),
+                "max_ms": round(s["max_ms"], 3),
+                "rows": s["rows"],
+                "histogram": dict(zip(labels, s["histogram"])),
+            }
+            for sql, s in _statements.items()
+        ]
+        reruns = [
+            {
+                "label": r["label"],
+                "started_at": r["started_at"],
+                "queries": r["queries"],
+                "ms": round(r["ms"], 3),
+                "repeated": {sql: n for sql, n in r["calls"].items() if n >= N_PLUS_ONE_CALLS},
+            }
+            for r in _reruns
+        ]
+        slow = list(_slow)
+    statements.sort(key=lambda s: s["total_ms"], reverse=True)
+    return {"enabled": enabled, "slow_ms": SLOW_MS, "statements": statements, "reruns": reruns, "slow": slow}
+
+
+def dump(path=None):
+    """Return the snapshot as JSON, also writing it to `path` if given."""
+    text = json.dumps(snapshot(), indent=2, default=str)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
+
+
+if os.environ.get("MONEY_MAGIC_PROFILE_DUMP"):
+    atexit.register(dump, os.environ["MONEY_MAGIC_PROFILE_DUMP"])
@@ -0,0 +1,232 @@
+"""
+Monthly reporting reads, served from the monthly_account_totals table
+whenever a whole month is asked for.
+
+    python -m core.reports verify     # compare totals with transactions
+    python -m core.reports rebuild    # recompute totals from transactions
+"""
+import sys
+from datetime import date, timedelta
+import pandas as pd
+from core.database import query, transaction, init_db, routed, scatter, MONTHLY_TOTALS_SQL
+from core.writer import queued
+from core.cache import cached, bump
+from core.transactions import filter_clauses
+from core.utils import MONTHS
+
+SUMMARY_COLUMNS = [
+    "Account", "Type", "Opening Balance", "Total Incoming (Payments)",
+    "Total Spent", "Remaining Balance", "Transactions",
+]
+
+
+def _merge_summaries(func, call):
+    return pd.concat(scatter(lambda _: func(**call)), ignore_index=True).sort_values(
+        "Account", kind="stable", ignore_index=True
+    )
+
+
+def _merge_category_totals(func, call):
+    df = pd.concat(scatter(lambda _: func(**call)), ignore_index=True)
+    return df.groupby("Category", as_index=False)["Amount"].sum().sort_values(
+        "Amount", ascending=False, ignore_index=True
+    )
+
+
+@routed()
+def monthly_totals(user_id, year_month, is_admin=False):
+    """
+    Income/expense totals per account for one YYYYMM month:
+    rows of account_id, type, total_cents, count.
+    """
+    if is_admin:
+        return query(
+            "SELECT account_id, type, SUM(total_cents) AS total_cents, SUM(count) AS count "
+            "FROM monthly_account_totals WHERE year_month = ? GROUP BY account_id, type",
+            (year_month,),
+            fetchall=True,
+        )
+    return query(
+        "SELECT account_id, type, total_cents, count FROM monthly_account_totals "
+        "WHERE user_id = ? AND year_month = ?",
+        (user_id, year_month),
+        fetchall=True,
+    )
+
+
+def _account_scope(account_ids):
+    # the accounts a filtered summary lists, as filter_clauses() matches them on transactions
+    if not account_ids:
+        return [], []
+    if isinstance(account_ids[0], (tuple, list)):
+        placeholders = ",".join(["(?,?)"] * len(account_ids))
+        return [f"(a.user_id, a.id) IN (VALUES {placeholders})"], [v for pair in account_ids for v in pair]
+    return [f"a.id IN ({','.join('?' * len(account_ids))})"], list(account_ids)
+
+
+@cached
+@routed(merge=_merge_summaries)
+def account_summary(user_id, period, is_admin=False, start_date=None, end_date=None,
+                    account_ids=None, types=None, category_ids=None):
+    """
+    One row per account for a YYYYMM period: opening, income, expense,
+    remaining balance and transaction count, from a single grouped query.
+    Sums are exact in integer cents; money columns are converted to rupees
+    on the way out.
+
+    The other arguments are the fetch_transactions() filters of the listing
+    the summary sits beside. A whole, unfiltered month is read from
+    monthly_account_totals; otherwise the flows are summed from the matching
+    transactions, and an account filter also limits the accounts listed.
+    """
+    year, m = divmod(period, 100)
+    first = date(year, m, 1)
+    last = (date(year + 1, 1, 1) if m == 12 else date(year, m + 1, 1)) - timedelta(days=1)
+    whole_month = (start_date is None or start_date <= first) and (end_date is None or end_date >= last)
+    if whole_month and not (account_ids or types or category_ids):
+        flows = "SELECT user_id, account_id, type, total_cents, count FROM monthly_account_totals WHERE year_month = ?"
+        flow_params = [period]
+    else:
+        clauses, flow_params = filter_clauses(
+            MONTHS[m - 1], start_date, end_date, account_ids, types, user_id, is_admin, year, category_ids
+        )
+        flows = (
+            "SELECT t.user_id, IFNULL(t.account_id, 0) AS account_id, t.type, "
+            "SUM(t.amount_cents) AS total_cents, COUNT(*) AS count FROM transactions t "
+            f"WHERE {' AND '.join(clauses)} GROUP BY 1, 2, 3"
+        )
+    where, where_params = _account_scope(account_ids)
+    if not is_admin:
+        where.insert(0, "a.user_id = ?")
+        where_params.insert(0, user_id)
+    rows = query(
+        f"""
+        SELECT Account, Type, opening / 100.0 AS "Opening Balance",
+               income / 100.0 AS "Total Incoming (Payments)", expense / 100.0 AS "Total Spent",
+               CASE WHEN Type = 'Debit' THEN opening + income - expense
+                    ELSE opening + expense - income END / 100.0 AS "Remaining Balance",
+               tx_count AS Transactions
+        FROM (
+            SELECT a.name AS Account, a.type AS Type,
+                   IFNULL((SELECT b.opening_cents FROM balances b
+                           WHERE b.user_id = a.user_id AND b.account_id = a.id AND b.year_month = ?), 0) AS opening,
+                   IFNULL(SUM(CASE WHEN m.type = 'Income' THEN m.total_cents END), 0) AS income,
+                   IFNULL(SUM(CASE WHEN m.type = 'Expense' THEN m.total_cents END), 0) AS expense,
+                   IFNULL(SUM(m.count), 0) AS tx_count
+            FROM accounts a
+            LEFT JOIN ({flows}) m ON m.user_id = a.user_id AND m.account_id = a.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            GROUP BY a.id
+        )
+        ORDER BY Account
+        """,
+        tuple([period] + flow_params + where_params),
+        fetchall=True,
+    )
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+@cached
+@routed(merge=_merge_category_totals)
+def category_totals(user_id, period, tx_type="Expense", is_admin=False):
+    """Total per category for a YYYYMM period, largest first."""
+    year, m = divmod(period, 100)
+    low = date(year, m, 1)
+    high = date(year + 1, 1, 1) if m == 12 else date(year, m + 1, 1)
+    clauses = ["tx_date >= ?", "tx_date < ?", "type = ?"]
+    params = [low.isoformat(), high.isoformat(), tx_type]
+    if not is_admin:
+        clauses.insert(0, "user_id = ?")
+        params.insert(0, user_id)
+    # grouped on the integer key; names are looked up once per group
+    rows = query(
+        f"""
+        SELECT IFNULL(c.name, '') AS Category, s.cents / 100.0 AS Amount
+        FROM (SELECT category_id, SUM(amount_cents) AS cents FROM transactions
+              WHERE {' AND '.join(clauses)} GROUP BY category_id) s
+        LEFT JOIN categories c ON c.id = s.category_id
+        ORDER BY Amount DESC
+        """,
+        tuple(params),
+        fetchall=True,
+    )
+    df = pd.DataFrame(rows, columns=["Category", "Amount"])
+    if is_admin:
+        # every user has their own ids for the same names
+        df = df.groupby("Category", as_index=False)["Amount"].sum().sort_values(
+            "Amount", ascending=False, ignore_index=True
+        )
+    return df
+
+
+@queued
+def _rebuild_totals():
+    with transaction() as conn:
+        conn.execute("DELETE FROM monthly_account_totals")
+        conn.execute(
+            "INSERT INTO monthly_account_totals (user_id, account_id, year_month, type, total_cents, count) "
+            + MONTHLY_TOTALS_SQL
+        )
+
+
+def rebuild_monthly_totals():
+    """Recompute monthly_account_totals from transactions, one transaction per shard."""
+    scatter(lambda _: _rebuild_totals())
+    bump(None)
+
+
+def verify_monthly_totals():
+    """
+    Return the rows where the maintained totals disagree with transactions:
+    dicts of the key plus expected/actual total_cents and count.
+    """
+    def verify(_):
+        rows = query(
+            f"""
+            WITH expected AS ({MONTHLY_TOTALS_SQL})
+            SELECT e.user_id, e.account_id, e.year_month, e.type,
+                   e.total_cents AS expected_cents, m.total_cents AS actual_cents,
+                   e.count AS expected_count, m.count AS actual_count
+            FROM expected e
+            LEFT JOIN monthly_account_totals m
+              ON m.user_id = e.user_id AND m.account_id = e.account_id
+             AND m.year_month = e.year_month AND m.type = e.type
+            WHERE m.count IS NULL OR m.count != e.count OR m.total_cents != e.total_cents
+            UNION ALL
+            SELECT m.user_id, m.account_id, m.year_month, m.type,
+                   NULL, m.total_cents, NULL, m.count
+            FROM monthly_account_totals m
+            WHERE NOT EXISTS (
+                SELECT 1 FROM transactions t
+                WHERE t.user_id = m.user_id AND IFNULL(t.account_id, 0) = m.account_id
+                  AND t.year_month = m.year_month AND t.type = m.type
+            )
+            """,
+            fetchall=True,
+        )
+        return rows or []
+
+    return [r for part in scatter(verify) for r in part]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "verify"
+    init_db()
+    if command == "rebuild":
+        rebuild_monthly_totals()
+        print("monthly_account_totals rebuilt")
+    elif command == "verify":
+        mismatches = verify_monthly_totals()
+        for m in mismatches:
+            print(m)
+        print(f"{len(mismatches)} mismatched rows")
+        return 1 if mismatches else 0
+    else:
+        print(__doc__)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Cold-start timings. app.py imports this module first and marks the points
+of its first run: app imports done, schema ready, first page rendered.
+Each is kept the first time only, as ms since that import. The admin
+dashboard shows them.
+
+    python -m core.startup                      # import time per module, slowest first
+    python -m core.startup --db /tmp/x.db       # also time init_db() cold and warm
+    python -m core.startup --budget-ms 2000     # exit 1 when importing the app takes longer
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+STARTED = time.perf_counter()
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+_lock = threading.Lock()
+_marks = {}  # name -> ms since STARTED
+_phases = {}  # name -> ms the block took
+
+
+def mark(name):
+    """Record the time since startup under `name`, once per process."""
+    with _lock:
+        _marks.setdefault(name, round((time.perf_counter() - STARTED) * 1000, 3))
+
+
+@contextmanager
+def phase(name):
+    """Time a block the first time it runs in this process."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases.setdefault(name, round((time.perf_counter() - started) * 1000, 3))
+
+
+def report():
+    """{'marks': {name: ms since start}, 'phases': {name: ms}} for this process."""
+    with _lock:
+        return {"marks": dict(_marks), "phases": dict(_phases)}
+
+
+def app_imports(path=APP):
+    """Modules app.py imports at its top level."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+_IMPORTER = """
+import importlib, sys
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+    except Exception as e:
+        print(f"!! {name}: {type(e).__name__}: {e}", file=sys.stderr)
+"""
+
+
+def import_times(modules=None):
+    """
+    Import `modules` (default: app_imports()) in a fresh interpreter under
+    -X importtime. Returns {'modules': [...], 'total_ms': n, 'errors': [...]},
+    modules being every module loaded with its self and cumulative ms,
+    slowest first.
+    """
+    modules = modules or app_imports()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORTER, *modules],
+        cwd=ROOT, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))),
+    )
+    rows, errors, total = [], [], 0.0
+    for line in proc.stderr.splitlines():
+        if line.startswith("!! "):
+            errors.append(line[3:])
+            continue
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        row = {
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "depth": depth,
+        }
+        rows.append(row)
+        if depth == 0:
+            total += row["cumulative_ms"]
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return {"modules": rows, "total_ms": round(total, 3), "errors": errors}
+
+
+def time_init_db(path):
+    """ms for init_db() on `path`: the first call of a process, then a repeat call."""
+    from core import database
+    database.DB_PATH = path
+    timings = {}
+    for label in ("init_db_cold_ms", "init_db_warm_ms"):
+        started = time.perf_counter()
+        database.init_db()
+        timings[label] = round((time.perf_counter() - started) * 1000, 3)
+    return timings
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m core.startup", description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--top", type=int, default=25, help="modules to list")
+    ap.add_argument("--db", help="also time init_db() against this database file")
+    ap.add_argument("--budget-ms", type=float, help="fail when importing the app takes longer than this")
+    ap.add_argument("--json", action="store_true", help="print the full result as JSON")
+    args = ap.parse_args(argv)
+
+    result = import_times()
+    if args.db:
+        result.update(time_init_db(args.db))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for r in result["modules"][:args.top]:
+            print(f"{r['cumulative_ms']:10.1f} ms {r['self_ms']:9.1f} ms  {'  ' * r['depth']}{r['module']}")
+        print(f"app imports: {result['total_ms']:.1f} ms")
+        for key in ("init_db_cold_ms", "init_db_warm_ms"):
+            if key in result:
+                print(f"{key}: {result[key]:.3f}")
+        for e in result["errors"]:
+            print(f"failed: {e}")
+    if args.budget_ms is not None and result["total_ms"] > args.budget_ms:
+        print(f"over budget: {result['total_ms']:.1f} ms > {args.budget_ms:g} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
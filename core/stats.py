@@ -0,0 +1,212 @@
+"""
+Admin dashboard statistics, read only from the trigger-maintained counter
+tables (counters, user_stats, signups_by_month, monthly_account_totals).
+
+    python -m core.stats reconcile   # fix drift user by user, briefly locking
+    python -m core.stats rebuild     # recompute everything in one transaction
+"""
+import sys
+import threading
+import time
+import pandas as pd
+from core.database import (
+    init_db, query, query_frame, transaction, scatter, tenant, use_db, on_catalog, STATS_BACKFILL,
+)
+from core.writer import queued
+from core.cache import cached, bump
+
+RECONCILE_INTERVAL = 6 * 3600  # seconds between scheduled reconciles
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+@cached
+def totals():
+    """{'users': n, 'transactions': n, 'volume_cents': n}, summed over the catalog and shards."""
+    result = {}
+    parts = scatter(lambda _: query("SELECT name, value FROM counters", fetchall=True), include_catalog=True)
+    for rows in parts:
+        for r in rows:
+            result[r["name"]] = result.get(r["name"], 0) + r["value"]
+    return result
+
+
+@cached
+@on_catalog
+def recent_users(limit=10):
+    """Newest registrations, read through the users(created_at) index."""
+    return query_frame(
+        "SELECT username,display_name,email,is_admin,created_at "
+        "FROM users ORDER BY created_at DESC LIMIT ?",
+        (limit,),
+        dtypes={"is_admin": "int64", "created_at": "datetime64[ns]"},
+    )
+
+
+@cached
+def user_activity(limit=50):
+    """Most recently active users with their transaction count and volume."""
+    sql = (
+        "SELECT user_id, tx_count, volume_cents, last_activity FROM user_stats "
+        "ORDER BY last_activity DESC LIMIT ?"
+    )
+    rows = [r for part in scatter(lambda _: query(sql, (limit,), fetchall=True)) for r in part]
+    rows = sorted(rows, key=lambda r: r["last_activity"] or "", reverse=True)[:limit]
+    names = {}
+    if rows:
+        with use_db(None):
+            for u in query(
+                f"SELECT id, username, display_name FROM users WHERE id IN ({','.join('?' * len(rows))})",
+                tuple(r["user_id"] for r in rows),
+                fetchall=True,
+            ):
+                names[u["id"]] = u
+    df = pd.DataFrame(
+        [
+            {
+                "Username": names.get(r["user_id"], {}).get("username"),
+                "Name": names.get(r["user_id"], {}).get("display_name"),
+                "Transactions": r["tx_count"],
+                "Volume": r["volume_cents"] / 100,
+                "Last activity": r["last_activity"],
+            }
+            for r in rows
+        ],
+        columns=["Username", "Name", "Transactions", "Volume", "Last activity"],
+    )
+    df["Last activity"] = pd.to_datetime(df["Last activity"], format="ISO8601", errors="coerce")
+    return df
+
+
+@cached
+def growth():
+    """Monthly signups and transactions with running totals, indexed by month."""
+    with use_db(None):
+        signups = query_frame(
+            "SELECT year_month, count AS Signups FROM signups_by_month ORDER BY year_month",
+            dtypes={"year_month": "int64", "Signups": "int64"},
+        ).set_index("year_month")
+    tx = pd.concat(scatter(lambda _: query_frame(
+        "SELECT year_month, SUM(count) AS Transactions FROM monthly_account_totals GROUP BY year_month",
+        dtypes={"year_month": "int64", "Transactions": "int64"},
+    ))).groupby("year_month").sum()
+    df = signups.join(tx, how="outer").fillna(0).astype("int64")
+    df["Users"] = df["Signups"].cumsum()
+    df["Total transactions"] = df["Transactions"].cumsum()
+    df.index = pd.to_datetime(df.index.astype(str), format="%Y%m")
+    return df
+
+
+@queued
+def _reconcile_user(user_id):
+    with transaction() as conn:
+        count, volume, last = conn.execute(
+            "SELECT COUNT(*), IFNULL(SUM(amount_cents), 0), MAX(created_at) FROM transactions WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        current = conn.execute(
+            "SELECT tx_count, volume_cents FROM user_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if (current is None and count == 0) or (current is not None and tuple(current) == (count, volume)):
+            return False
+        conn.execute(
+            """
+            INSERT INTO user_stats (user_id, tx_count, volume_cents, last_activity) VALUES (?,?,?,?)
+            ON CONFLICT (user_id) DO UPDATE SET tx_count = excluded.tx_count,
+                volume_cents = excluded.volume_cents,
+                last_activity = MAX(IFNULL(last_activity, ''), IFNULL(excluded.last_activity, ''))
+            """,
+            (user_id, count, volume, last),
+        )
+        return True
+
+
+@queued
+def _reconcile_counters():
+    # the global counters follow from the per-user ones and the (small) users table
+    with transaction() as conn:
+        before = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        conn.execute("DELETE FROM counters")
+        conn.execute(
+            """
+            INSERT INTO counters (name, value)
+            SELECT 'users', COUNT(*) FROM users
+            UNION ALL SELECT 'transactions', IFNULL(SUM(tx_count), 0) FROM user_stats
+            UNION ALL SELECT 'volume_cents', IFNULL(SUM(volume_cents), 0) FROM user_stats
+            """
+        )
+        conn.execute("DELETE FROM signups_by_month")
+        conn.execute(
+            "INSERT INTO signups_by_month (year_month, count) "
+            "SELECT CAST(strftime('%Y%m', IFNULL(created_at, 'now')) AS INTEGER), COUNT(*) FROM users GROUP BY 1"
+        )
+        after = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+    return sum(before.get(k) != v for k, v in after.items())
+
+
+def reconcile():
+    """
+    Compare each user's counters with their transactions and fix any drift,
+    one short transaction per user so writers are never held up for long.
+    Returns the number of rows corrected.
+    """
+    fixed = 0
+    with use_db(None):
+        users = query("SELECT id FROM users", fetchall=True)
+    for row in users:
+        with tenant(row["id"]):
+            fixed += _reconcile_user(row["id"])
+    fixed += sum(scatter(lambda _: _reconcile_counters(), include_catalog=True))
+    bump(None)
+    return fixed
+
+
+@queued
+def _rebuild_counters():
+    with transaction() as conn:
+        for stmt in STATS_BACKFILL:
+            conn.execute(stmt)
+
+
+def rebuild():
+    """Recompute every counter from users and transactions, one transaction per database."""
+    scatter(lambda _: _rebuild_counters(), include_catalog=True)
+    bump(None)
+
+
+def start_reconciler(interval=RECONCILE_INTERVAL):
+    """Run reconcile() every `interval` seconds on a daemon thread (once per process)."""
+    global _reconciler
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                reconcile()
+            except Exception as e:
+                print(f"stats reconcile failed: {e}", file=sys.stderr)
+
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = threading.Thread(target=loop, name="stats-reconcile", daemon=True)
+            _reconciler.start()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "reconcile"
+    init_db()
+    if command == "reconcile":
+        print(f"{reconcile()} counter rows corrected")
+    elif command == "rebuild":
+        rebuild()
+        print("counters rebuilt")
+    else:
+        print(__doc__)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
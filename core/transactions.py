@@ -1,52 +1,208 @@
+import re
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import pandas as pd
-from core.database import query
+from core.database import get_conn, query, query_frame, transaction, routed, scatter, shard_paths, owner
+from core.categories import ids_for, relink
+from core.writer import queued
+from core.utils import MONTHS
+from core.cache import cached, bump
+from core.money import to_cents
 
+
+def date_fields(tx_date):
+    """
+    Return (date, tx_date, year_month) for a date value: the stored text as
+    before, its normalized YYYY-MM-DD form and the YYYYMM integer the
+    indexed filters range over.
+    """
+    raw = tx_date.isoformat() if hasattr(tx_date, 'isoformat') else str(tx_date)
+    day = raw[:10]
+    return raw, day, int(day[:4] + day[5:7])
+
+@routed()
+@queued
 def add_transaction(tx_date, account_id, category, description, tx_type, amount, user_id):
     tx_uuid = str(uuid.uuid4())
     created_at = datetime.utcnow().isoformat()
+    raw_date, day, year_month = date_fields(tx_date)
+    category_id = ids_for(get_conn(), user_id, [category]).get(category)
     query(
         """
         INSERT INTO transactions 
-        (tx_uuid, date, account_id, category, description, type, amount, user_id, created_at)
-        VALUES (?,?,?,?,?,?,?,?,?)
+        (tx_uuid, date, tx_date, year_month, account_id, category, category_id, description, type, amount_cents,
+         user_id, created_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
         """,
         (
             tx_uuid,
-            tx_date.isoformat() if hasattr(tx_date, 'isoformat') else str(tx_date),
+            raw_date,
+            day,
+            year_month,
             account_id,
             category,
+            category_id,
             description,
             tx_type,
-            float(amount),
+            to_cents(amount),
             user_id,
             created_at,
         ),
         commit=True,
     )
+    bump(user_id)
     return tx_uuid
 
-def update_transaction_by_uuid(tx_uuid, updates: dict):
+@routed()
+@queued
+def update_transaction_by_uuid(tx_uuid, updates: dict, user_id, is_admin=False, owner_id=None):
+    """Update one of the user's transactions (admins: owner_id's, the row's User_ID)."""
+    if "date" in updates:
+        updates = dict(updates)
+        updates["date"], updates["tx_date"], updates["year_month"] = date_fields(updates["date"])
+    if "amount" in updates:
+        updates = dict(updates)
+        updates["amount_cents"] = to_cents(updates.pop("amount"))
+    uid = owner(user_id, is_admin, owner_id)
     parts=[]; params=[]
     for k,v in updates.items():
         parts.append(f"{k} = ?"); params.append(v)
-    params.append(tx_uuid)
-    q = f"UPDATE transactions SET {', '.join(parts)} WHERE tx_uuid = ?"
-    query(q, tuple(params), commit=True)
+    params.extend([tx_uuid, uid])
+    q = f"UPDATE transactions SET {', '.join(parts)} WHERE tx_uuid = ? AND user_id = ?"
+    with transaction() as conn:
+        conn.execute(q, tuple(params))
+        if "category" in updates:
+            relink(conn, [tx_uuid])
+    bump(uid)
 
-def delete_transaction_by_uuid(tx_uuid):
-    query("DELETE FROM transactions WHERE tx_uuid = ?", (tx_uuid,), commit=True)
+@routed()
+@queued
+def delete_transaction_by_uuid(tx_uuid, user_id, is_admin=False, owner_id=None):
+    uid = owner(user_id, is_admin, owner_id)
+    query("DELETE FROM transactions WHERE tx_uuid = ? AND user_id = ?", (tx_uuid, uid), commit=True)
+    bump(uid)
 
-def fetch_transactions(
-    month_filter=None, start_date=None, end_date=None,
-    account_ids=None, types=None, user_id=None, is_admin=False
-):
-    q = """SELECT t.tx_uuid as Transaction_ID, date(t.date) as Date,
+def _date_range(month_filter=None, year=None, start_date=None, end_date=None):
+    """
+    Collapse the month and start/end filters into one half-open
+    [low, high) range of YYYY-MM-DD strings (either end may be None).
+    """
+    low = high = None
+    if month_filter:
+        if year is None:
+            year = start_date.year if start_date else datetime.now().year
+        m = MONTHS.index(month_filter) + 1
+        low = date(year, m, 1)
+        high = date(year + 1, 1, 1) if m == 12 else date(year, m + 1, 1)
+    if start_date:
+        low = start_date if low is None else max(low, start_date)
+    if end_date:
+        end_excl = end_date + timedelta(days=1)
+        high = end_excl if high is None else min(high, end_excl)
+    return (
+        low.isoformat() if low else None,
+        high.isoformat() if high else None,
+    )
+
+# Columns an edit may touch; anything else in an update dict is rejected.
+# "amount" is in rupees and is stored as amount_cents.
+EDITABLE_COLUMNS = ("date", "account_id", "category", "description", "type", "amount")
+
+@routed()
+@queued
+def apply_changes(inserts=(), updates=(), deletes=(), user_id=None, is_admin=False, owner_id=None):
+    """
+    Apply a batch of edits in one transaction with one commit.
+
+    inserts: dicts with date, account_id, category, description, type, amount, user_id
+    updates: (tx_uuid, {column: value}) pairs; rows touching the same
+             columns are grouped into a single executemany
+    deletes: tx_uuids
+    Updates and deletes only touch rows of one user: user_id, or for admins
+    owner_id (the rows' User_ID), whose shard the batch runs on. Inserts
+    must belong to that shard too. Returns the uuids of the inserted rows.
+    """
+    uid = owner(user_id, is_admin, owner_id)
+    scope = "" if uid is None else " AND user_id = ?"
+    scoped = () if uid is None else (uid,)
+    created_at = datetime.utcnow().isoformat()
+    insert_rows = []
+    new_uuids = []
+    for r in inserts:
+        tx_uuid = str(uuid.uuid4())
+        raw_date, day, year_month = date_fields(r["date"])
+        insert_rows.append((
+            tx_uuid, raw_date, day, year_month, r.get("account_id"), r.get("category", ""),
+            r.get("description", ""), r.get("type", "Expense"), to_cents(r.get("amount", 0)),
+            r["user_id"], created_at,
+        ))
+        new_uuids.append(tx_uuid)
+
+    grouped = {}
+    for tx_uuid, changes in updates:
+        unknown = set(changes) - set(EDITABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot update column(s): {', '.join(sorted(unknown))}")
+        changes = dict(changes)
+        if "date" in changes:
+            changes["date"], changes["tx_date"], changes["year_month"] = date_fields(changes["date"])
+        if "amount" in changes:
+            changes["amount_cents"] = to_cents(changes.pop("amount"))
+        cols = tuple(sorted(changes))
+        grouped.setdefault(cols, []).append(tuple(changes[c] for c in cols) + (tx_uuid,) + scoped)
+
+    owners = {r[-2] for r in insert_rows}
+    touched = [u for u, _ in updates] + list(deletes)
+    with transaction() as conn:
+        for i in range(0, len(touched), 500):
+            chunk = touched[i:i + 500]
+            owners.update(r[0] for r in conn.execute(
+                f"SELECT DISTINCT user_id FROM transactions WHERE tx_uuid IN ({','.join('?' * len(chunk))}){scope}",
+                chunk + list(scoped),
+            ))
+        if deletes:
+            conn.executemany(f"DELETE FROM transactions WHERE tx_uuid = ?{scope}", [(d,) + scoped for d in deletes])
+        for cols, rows in grouped.items():
+            sets = ", ".join(f"{c} = ?" for c in cols)
+            conn.executemany(f"UPDATE transactions SET {sets} WHERE tx_uuid = ?{scope}", rows)
+            if "category" in cols:
+                relink(conn, [r[len(cols)] for r in rows])
+        if insert_rows:
+            names = {}
+            for r in insert_rows:
+                names.setdefault(r[-2], set()).add(r[5])
+            category_ids = {u: ids_for(conn, u, n) for u, n in names.items()}
+            conn.executemany(
+                """
+                INSERT INTO transactions
+                (tx_uuid, date, tx_date, year_month, account_id, category, description, type, amount_cents, user_id,
+                 created_at, category_id)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+                """,
+                [r + (category_ids[r[-2]].get(r[5]),) for r in insert_rows],
+            )
+    for owner_id in owners:
+        bump(owner_id)
+    return new_uuids
+
+TX_SELECT = """SELECT t.tx_uuid as Transaction_ID, t.tx_date as Date,
                   a.name as Account, t.category as Category, t.description as Description,
-                  t.type as Type, t.amount as Amount, t.user_id as User_ID
+                  t.type as Type, t.amount_cents / 100.0 as Amount, t.user_id as User_ID
            FROM transactions t
            LEFT JOIN accounts a ON t.account_id = a.id"""
+
+TX_DTYPES = {
+    "Date": "datetime64[ns]",
+    "Account": "category",
+    "Category": "category",
+    "Type": "category",
+    "Amount": "float64",
+    "User_ID": "int64",
+}
+
+def filter_clauses(month_filter=None, start_date=None, end_date=None,
+                    account_ids=None, types=None, user_id=None, is_admin=False, year=None,
+                    category_ids=None):
     clauses = []
     params = []
 
@@ -56,23 +212,21 @@ def fetch_transactions(
         params.append(user_id)
 
     # Filters
-    if month_filter:
-        months = [
-            'January','February','March','April','May','June',
-            'July','August','September','October','November','December'
-        ]
-        mnum = f"{months.index(month_filter)+1:02d}"
-        clauses.append("strftime('%m', t.date) = ?")
-        params.append(mnum)
-
-    if start_date:
-        clauses.append("date(t.date) >= date(?)")
-        params.append(start_date.isoformat())
-    if end_date:
-        clauses.append("date(t.date) <= date(?)")
-        params.append(end_date.isoformat())
+    low, high = _date_range(month_filter, year, start_date, end_date)
+    if low:
+        clauses.append("t.tx_date >= ?")
+        params.append(low)
+    if high:
+        clauses.append("t.tx_date < ?")
+        params.append(high)
 
-    if account_ids:
+    if account_ids and isinstance(account_ids[0], (tuple, list)):
+        # (user_id, account_id) pairs: account ids repeat across shards, so an
+        # admin filter names each account by its owner too
+        placeholders = ','.join(['(?,?)'] * len(account_ids))
+        clauses.append(f"(t.user_id, t.account_id) IN (VALUES {placeholders})")
+        params.extend(v for pair in account_ids for v in pair)
+    elif account_ids:
         placeholders = ','.join(['?'] * len(account_ids))
         clauses.append(f"t.account_id IN ({placeholders})")
         params.extend(account_ids)
@@ -80,13 +234,206 @@ def fetch_transactions(
         placeholders = ','.join(['?'] * len(types))
         clauses.append(f"t.type IN ({placeholders})")
         params.extend(types)
+    if category_ids:
+        # a parent category also selects its sub-categories
+        placeholders = ','.join(['?'] * len(category_ids))
+        clauses.append(
+            f"t.category_id IN (SELECT id FROM categories WHERE id IN ({placeholders}) "
+            f"UNION ALL SELECT id FROM categories WHERE parent_id IN ({placeholders}))"
+        )
+        params.extend(list(category_ids) * 2)
+    return clauses, params
+
+def _merge_frames(func, call):
+    # admin reads across shards: each shard's rows, newest first overall
+    frames = scatter(lambda _: func(**call))
+    return pd.concat(frames, ignore_index=True).sort_values(
+        "Date", ascending=False, kind="stable", ignore_index=True
+    )
+
+def _merge_counts(func, call):
+    return sum(scatter(lambda _: func(**call)))
+
+@cached
+@routed(merge=_merge_frames)
+def fetch_transactions(
+    month_filter=None, start_date=None, end_date=None,
+    account_ids=None, types=None, user_id=None, is_admin=False, year=None, category_ids=None
+):
+    """
+    month_filter is a month name within `year` (defaults to the start date's
+    year, else the current one). Every date filter becomes a range on
+    tx_date so it is served by the (user_id, [account_id,] tx_date) indexes.
+    account_ids are ids of the user's own accounts, or (user_id, account_id)
+    pairs, which admin reads need because ids repeat across shards.
+    """
+    clauses, params = filter_clauses(
+        month_filter, start_date, end_date, account_ids, types, user_id, is_admin, year, category_ids
+    )
+    q = TX_SELECT
+    if clauses:
+        q += " WHERE " + " AND ".join(clauses)
+
+    q += " ORDER BY t.tx_date DESC, t.id DESC"
 
+    return query_frame(q, tuple(params), TX_DTYPES)
+
+@cached
+@routed(merge=_merge_counts)
+def count_transactions(
+    month_filter=None, start_date=None, end_date=None,
+    account_ids=None, types=None, user_id=None, is_admin=False, year=None, category_ids=None
+):
+    """Number of rows fetch_transactions() would return, counted from the index."""
+    clauses, params = filter_clauses(
+        month_filter, start_date, end_date, account_ids, types, user_id, is_admin, year, category_ids
+    )
+    q = "SELECT COUNT(*) as c FROM transactions t"
     if clauses:
         q += " WHERE " + " AND ".join(clauses)
+    return query(q, tuple(params), fetchone=True)["c"]
+
+def _page_rows(
+    month_filter=None, start_date=None, end_date=None,
+    account_ids=None, types=None, user_id=None, is_admin=False, year=None,
+    after=None, page_size=100, category_ids=None
+):
+    # up to page_size + 1 rows (the extra one tells whether more follow), with their ids
+    clauses, params = filter_clauses(
+        month_filter, start_date, end_date, account_ids, types, user_id, is_admin, year, category_ids
+    )
+    if after is not None:
+        clauses.append("(t.tx_date, t.id) < (?, ?)")
+        params.extend(after)
+    q = TX_SELECT.replace("SELECT ", "SELECT t.id as _id, ", 1)
+    if clauses:
+        q += " WHERE " + " AND ".join(clauses)
+    q += " ORDER BY t.tx_date DESC, t.id DESC LIMIT ?"
+    params.append(page_size + 1)
+    return query_frame(q, tuple(params), TX_DTYPES)
+
+def _cursor(row):
+    return (row["Date"].date().isoformat(), int(row["_id"]))
+
+def _merge_pages(func, call):
+    """
+    Admin paging across shards. The cursor keeps one position per shard
+    (None: not started, (): exhausted) and each page is the newest page_size
+    rows over all shards, ordered by (date, shard, id).
+    """
+    page_size = call.pop("page_size")
+    positions = call.pop("after") or (None,) * len(shard_paths())
+
+    def shard_rows(i):
+        if positions[i] == ():
+            return None
+        return _page_rows(**call, after=positions[i], page_size=page_size).assign(_shard=i)
+
+    frames = scatter(shard_rows)
+    merged = pd.concat([f for f in frames if f is not None], ignore_index=True).sort_values(
+        ["Date", "_shard", "_id"], ascending=[False, True, False], ignore_index=True
+    )
+    page = merged.iloc[:page_size]
+    next_positions = list(positions)
+    for i, df in enumerate(frames):
+        if df is None:
+            continue
+        taken = page[page["_shard"] == i]
+        if len(taken) == len(df):
+            next_positions[i] = ()
+        elif len(taken):
+            next_positions[i] = _cursor(taken.iloc[-1])
+    next_cursor = tuple(next_positions) if any(p != () for p in next_positions) else None
+    return page.drop(columns=["_id", "_shard"]), next_cursor
+
+@cached
+@routed(merge=_merge_pages)
+def fetch_transactions_page(
+    month_filter=None, start_date=None, end_date=None,
+    account_ids=None, types=None, user_id=None, is_admin=False, year=None,
+    after=None, page_size=100, category_ids=None
+):
+    """
+    One page of fetch_transactions() results, newest first.
+
+    Pages are keyed on (tx_date, id) rather than OFFSET: pass the returned
+    cursor as `after` to get the next page. Returns (df, next_cursor), where
+    next_cursor is None on the last page.
+    """
+    df = _page_rows(
+        month_filter, start_date, end_date, account_ids, types, user_id, is_admin, year, after, page_size,
+        category_ids
+    )
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        next_cursor = _cursor(df.iloc[-1])
+    return df.drop(columns="_id"), next_cursor
+
+def _search_terms(text):
+    """Words of the search box, lower-cased; punctuation is ignored."""
+    return re.findall(r"\w+", (text or "").lower())
+
+def _fts_query(terms, user_id, is_admin):
+    # every word must match, as a prefix ("amaz" finds "Amazon")
+    match = " AND ".join(f'"{t}"*' for t in terms)
+    match = f"{{description category}} : ({match})"
+    if not is_admin:
+        match = f"owner : u{int(user_id)} AND {match}"
+    return match
+
+def _search_rows(user_id, text, filters, is_admin, offset, limit):
+    # matching rows with their bm25 score in _rank (NULL on the LIKE fallback)
+    terms = _search_terms(text)
+    clauses, params = filter_clauses(**dict(filters or {}, user_id=user_id, is_admin=is_admin))
+    has_index = query(
+        "SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'", fetchone=True
+    ) is not None
+    if not terms:
+        q = TX_SELECT.replace("SELECT ", "SELECT NULL as _rank, ", 1)
+        clauses = ["0"]
+        order = "t.id"
+    elif has_index:
+        q = TX_SELECT.replace(
+            "SELECT ", "SELECT bm25(transactions_fts, 0.0, 1.0, 0.5) as _rank, ", 1
+        ).replace(
+            "FROM transactions t",
+            "FROM transactions_fts f JOIN transactions t ON t.id = f.rowid",
+        )
+        clauses.insert(0, "transactions_fts MATCH ?")
+        params.insert(0, _fts_query(terms, user_id, is_admin))
+        order = "_rank, t.tx_date DESC"
+    else:
+        q = TX_SELECT.replace("SELECT ", "SELECT NULL as _rank, ", 1)
+        for t in terms:
+            clauses.append("(t.description LIKE ? OR t.category LIKE ?)")
+            params.extend([f"%{t}%"] * 2)
+        order = "t.tx_date DESC, t.id DESC"
+    q += " WHERE " + " AND ".join(clauses) + f" ORDER BY {order} LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    return query_frame(q, tuple(params), dict(TX_DTYPES, _rank="float64"))
+
+def _merge_search(func, call):
+    # each shard's best (page + 1) pages, merged on score; bm25 statistics are per shard
+    end = (call["page"] + 1) * call["page_size"]
+    frames = scatter(lambda _: _search_rows(
+        call["user_id"], call["text"], call["filters"], True, 0, end + 1
+    ))
+    merged = pd.concat(frames, ignore_index=True).sort_values(
+        ["_rank", "Date"], ascending=[True, False], kind="stable", ignore_index=True
+    )
+    return merged.iloc[end - call["page_size"]:end].drop(columns="_rank"), len(merged) > end
 
-    q += " ORDER BY date(t.date) DESC"
+@cached
+@routed(merge=_merge_search)
+def search(user_id, text, filters=None, is_admin=False, page=0, page_size=50):
+    """
+    Transactions whose description or category contain every word of `text`,
+    best matches first. `filters` are fetch_transactions() filters. Returns
+    (df, has_more) for the zero-based `page`.
 
-    rows = query(q, tuple(params), fetchall=True)
-    if not rows:
-        return pd.DataFrame(columns=["Transaction_ID", "Date", "Account", "Category", "Description", "Type", "Amount"])
-    return pd.DataFrame(rows)
\ No newline at end of file
+    Uses the transactions_fts index; where SQLite was built without FTS5 it
+    falls back to a LIKE scan ordered by date.
+    """
+    df = _search_rows(user_id, text, filters, is_admin, page * page_size, page_size + 1)
+    return df.drop(columns="_rank").iloc[:page_size], len(df) > page_size
@@ -9,6 +9,16 @@ MONTHS = [
 def month_name_from_index(i):
     return MONTHS[i-1]
 
+def latest_year_month(month_name, today=None):
+    """
+    YYYYMM of the most recent occurrence (up to this month) of a bare month
+    name, which is how month-only balance entries are placed on the calendar.
+    """
+    today = today or datetime.now()
+    m = MONTHS.index(month_name) + 1
+    year = today.year if m <= today.month else today.year - 1
+    return year * 100 + m
+
 def today_iso():
     return datetime.utcnow().isoformat()
 
@@ -0,0 +1,179 @@
+"""
+Single-writer queue with group commit.
+
+Write helpers decorated with @queued do not commit from the calling session
+thread. Calls are handed to one writer thread per database file (per shard
+when sharded) through a bounded queue. The writer takes everything pending,
+waiting at most GROUP_WINDOW for more, and runs it as one transaction, each
+call in its own savepoint. One failing call is rolled back alone and does
+not take its neighbours with it. One commit (and fsync) then covers the
+whole group.
+
+Callers get the call's return value or exception as before; `.submit()`
+returns the Future instead. Set MONEY_MAGIC_WRITER=0 to run writes inline.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import wraps
+from core import cache
+from core.database import current_db, get_conn, grouped, in_group, use_db
+
+ENABLED = os.environ.get("MONEY_MAGIC_WRITER", "1") not in ("0", "false")
+QUEUE_SIZE = 1024       # pending calls per database before submitters block
+MAX_GROUP = 256         # calls per transaction
+GROUP_WINDOW = 0.002    # seconds to wait for more calls once one arrives
+SUBMIT_TIMEOUT = 30     # seconds a full queue may block a submitter
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.latencies = deque(maxlen=1000)  # ms per group commit
+        self.groups = 0
+        self.calls = 0
+        self.failed = 0
+        self.largest_group = 0
+        self.thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        with use_db(self.path):
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                group = [item]
+                deadline = time.perf_counter() + GROUP_WINDOW
+                while len(group) < MAX_GROUP:
+                    try:
+                        item = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._commit(group)
+                        return
+                    group.append(item)
+                self._commit(group)
+
+    def _commit(self, group):
+        started = time.perf_counter()
+        conn = get_conn()
+        outcomes = []
+        cache.hold_bumps()
+        try:
+            with grouped():
+                conn.execute("BEGIN IMMEDIATE")
+                for future, fn, args, kwargs in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT call")
+                    try:
+                        outcomes.append((future, fn(*args, **kwargs), None))
+                        conn.execute("RELEASE call")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO call")
+                        conn.execute("RELEASE call")
+                        outcomes.append((future, None, e))
+                conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            cache.release_bumps()
+            for future, _, _, _ in group:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            self.failed += len(group)
+            return
+        # results are published only once they are durable and visible to readers
+        cache.release_bumps()
+        for future, value, error in outcomes:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        self.groups += 1
+        self.calls += len(group)
+        self.failed += sum(error is not None for _, _, error in outcomes)
+        self.largest_group = max(self.largest_group, len(group))
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 3) if latencies else None
+        return {
+            "queue_depth": self.queue.qsize(),
+            "groups": self.groups,
+            "calls": self.calls,
+            "failed": self.failed,
+            "mean_group": round(self.calls / self.groups, 2) if self.groups else None,
+            "largest_group": self.largest_group,
+            "commit_ms_p50": pick(0.5),
+            "commit_ms_p95": pick(0.95),
+            "commit_ms_max": round(latencies[-1], 3) if latencies else None,
+        }
+
+
+def _writer():
+    path = current_db()
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = _Writer(path)
+    return writer
+
+
+def submit(fn, *args, **kwargs):
+    """Queue fn(*args, **kwargs) on the current database's writer; returns a Future."""
+    future = Future()
+    try:
+        _writer().queue.put((future, fn, args, kwargs), timeout=SUBMIT_TIMEOUT)
+    except queue.Full:
+        raise RuntimeError("Write queue is full; the database is not keeping up.")
+    return future
+
+
+def queued(func):
+    """
+    Run a write helper on the writer thread and wait for it. Calls made from
+    inside a group (a helper calling another) run inline.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ENABLED or in_group():
+            return func(*args, **kwargs)
+        return submit(func, *args, **kwargs).result()
+
+    wrapper.submit = lambda *args, **kwargs: submit(func, *args, **kwargs)
+    return wrapper
+
+
+def metrics():
+    """Queue depth and commit latency per database file."""
+    with _writers_lock:
+        writers = dict(_writers)
+    return {path: w.metrics() for path, w in writers.items()}
+
+
+def shutdown():
+    """Let every writer finish what is queued, then stop it."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for w in writers:
+        w.queue.put(None)
+    for w in writers:
+        w.thread.join()
+
+
+atexit.register(shutdown)
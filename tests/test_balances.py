@@ -0,0 +1,37 @@
+from datetime import date
+import pytest
+from core import auth, database
+from core.accounts import add_account, get_accounts
+from core.balances import get_opening, set_opening, roll_forward, main
+from core.transactions import add_transaction
+
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    assert auth.create_user("alice", "pw")[0]
+    add_account("Bank", "Debit", user_id=1)
+    add_transaction(date(2026, 3, 5), get_accounts(1)[0]["id"], "Salary", "salary", "Income", 40, 1)
+    yield get_accounts(1)[0]["id"]
+    database.close_conn()
+
+
+def test_roll_forward_follows_later_edits(account):
+    assert roll_forward(202603, user_id=1) == 1
+    assert get_opening.uncached(202604, account, 1) == 40.0
+
+    add_transaction(date(2026, 3, 20), account, "Salary", "bonus", "Income", 50, 1)
+    assert roll_forward(202603, user_id=1) == 1
+    assert get_opening.uncached(202604, account, 1) == 90.0
+    assert roll_forward(202603, user_id=1) == 0
+
+
+def test_roll_forward_keeps_manual_openings(account):
+    set_opening(202604, account, 500, 1)
+    assert roll_forward(202603, user_id=1) == 0
+    assert get_opening.uncached(202604, account, 1) == 500.0
+
+    assert main(["rollover", "202603", "--overwrite"]) == 0
+    assert get_opening.uncached(202604, account, 1) == 40.0
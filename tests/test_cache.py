@@ -0,0 +1,61 @@
+import pytest
+from core import auth, cache, database
+from core.accounts import add_account, get_accounts
+
+calls = []
+
+
+@cache.cached
+def read(user_id, is_admin=False):
+    calls.append((user_id, is_admin))
+    return len(calls)
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+    cache.clear()
+    calls.clear()
+
+
+def test_write_invalidates_only_its_user():
+    read(1), read(2)
+    read(1), read(2)
+    assert len(calls) == 2
+
+    cache.bump(1)
+    read(1), read(2)
+    assert calls[2:] == [(1, False)]
+
+
+def test_admin_reads_follow_every_users_writes():
+    read(1, is_admin=True)
+    read(1, is_admin=True)
+    assert len(calls) == 1
+
+    cache.bump(2)
+    read(1, is_admin=True)
+    assert len(calls) == 2
+
+
+def test_unowned_write_invalidates_everything():
+    read(1), read(2, is_admin=True)
+    cache.bump(None)
+    read(1), read(2, is_admin=True)
+    assert len(calls) == 4
+
+
+def test_admin_sees_another_users_new_account(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    for name in ("admin", "bob"):
+        assert auth.create_user(name, "pw")[0]
+    add_account("Bank", "Debit", user_id=1)
+    assert [a["name"] for a in get_accounts(1, True)] == ["Bank"]
+    own = get_accounts(1)
+
+    add_account("Cash", "Debit", user_id=2)
+    assert sorted(a["name"] for a in get_accounts(1, True)) == ["Bank", "Cash"]
+    assert get_accounts(1) == own
+    assert cache.stats()["hits"] >= 1
+    database.close_conn()
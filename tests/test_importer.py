@@ -0,0 +1,47 @@
+import io
+import pytest
+from core import auth, database, importer
+from core.accounts import add_account
+
+HEADER = "Date,Description,Amount,Account\n"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    assert auth.create_user("alice", "pw")[0]
+    add_account("Bank", "Debit", user_id=1)
+    yield
+    database.close_conn()
+
+
+def _import(lines, **kwargs):
+    return importer.import_file(io.BytesIO((HEADER + "".join(lines)).encode()), 1, **kwargs)
+
+
+def test_reimport_overlapping_statement(db):
+    march = ["2026-03-01,coffee,-3,Bank\n", "2026-03-01,coffee,-3,Bank\n", "2026-03-02,rent,-500,Bank\n"]
+    stats = _import(march)
+    assert (stats["inserted"], stats["duplicates"]) == (3, 0)
+
+    # the next statement repeats both coffees and the rent, and adds a third coffee and a new day
+    stats = _import(march[:2] + ["2026-03-01,coffee,-3,Bank\n"] + march[2:] + ["2026-03-03,salary,900,Bank\n"])
+    assert (stats["inserted"], stats["duplicates"]) == (2, 3)
+
+
+def test_identical_lines_out_of_date_order(db):
+    lines = ["2026-03-01,coffee,-3,Bank\n", "2026-03-02,rent,-500,Bank\n", "2026-03-01,coffee,-3,Bank\n"]
+    assert _import(lines)["inserted"] == 3
+    assert _import(lines[::-1])["duplicates"] == 3
+
+
+def test_occurrence_window_is_bounded(db, monkeypatch):
+    # only the last OCCURRENCE_DATES dates are remembered: a date coming back
+    # after that starts counting again, so its repeat reads as a duplicate
+    monkeypatch.setattr(importer, "OCCURRENCE_DATES", 2)
+    lines = ["2026-03-01,coffee,-3,Bank\n", "2026-03-02,rent,-500,Bank\n",
+             "2026-03-03,tea,-2,Bank\n", "2026-03-01,coffee,-3,Bank\n"]
+    stats = _import(lines)
+    assert (stats["inserted"], stats["duplicates"]) == (3, 1)
@@ -0,0 +1,74 @@
+import sqlite3
+import pytest
+from core import database
+from core.database import query
+from core.utils import latest_year_month
+
+# The schema as it was before versioned migrations (PRAGMA user_version 0)
+BASELINE = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL,
+    display_name TEXT, email TEXT, is_admin INTEGER DEFAULT 0, created_at TEXT
+);
+CREATE TABLE accounts (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL, type TEXT NOT NULL, notes TEXT,
+    user_id INTEGER NOT NULL, UNIQUE(name, user_id), FOREIGN KEY(user_id) REFERENCES users(id)
+);
+CREATE TABLE balances (
+    id INTEGER PRIMARY KEY, month TEXT NOT NULL, account_id INTEGER NOT NULL, opening REAL DEFAULT 0,
+    user_id INTEGER NOT NULL,
+    FOREIGN KEY(account_id) REFERENCES accounts(id), FOREIGN KEY(user_id) REFERENCES users(id)
+);
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY, tx_uuid TEXT UNIQUE NOT NULL, date TEXT NOT NULL, account_id INTEGER,
+    category TEXT, description TEXT,
+    type TEXT CHECK(type IN ('Expense','Income')) NOT NULL DEFAULT 'Expense',
+    amount REAL NOT NULL DEFAULT 0, user_id INTEGER NOT NULL, created_at TEXT,
+    FOREIGN KEY(account_id) REFERENCES accounts(id), FOREIGN KEY(user_id) REFERENCES users(id)
+);
+INSERT INTO users (id, username, password_hash, created_at) VALUES (1, 'alice', 'x', '2026-01-05T10:00:00');
+INSERT INTO accounts (id, name, type, user_id) VALUES (1, 'Bank', 'Debit', 1), (2, 'Card', 'Credit', 1);
+INSERT INTO transactions (tx_uuid, date, account_id, category, description, type, amount, user_id) VALUES
+    ('t1', '2026-03-02', 1, 'Salary', 'pay', 'Income', 1999.99, 1),
+    ('t2', '2026-03-05', 1, 'Food', 'lunch', 'Expense', 12.34, 1),
+    ('t3', '2026-03-06T18:30:00', 2, 'Food', 'dinner', 'Expense', 0.1, 1);
+INSERT INTO balances (month, account_id, opening, user_id) VALUES
+    ('March', 1, 100.5, 1), ('March', 1, 250.25, 1), ('April', 2, 40, 1), ('Smarch', 2, 5, 1);
+"""
+
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    path = str(tmp_path / "money_magic.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE)
+    conn.close()
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db(force=True)
+    yield
+    database.close_conn()
+
+
+def test_baseline_reaches_schema_version(baseline):
+    assert query("PRAGMA user_version", fetchone=True)["user_version"] == database.SCHEMA_VERSION
+
+
+def test_amounts_become_cents(baseline):
+    rows = query("SELECT tx_uuid, amount_cents, tx_date, year_month FROM transactions ORDER BY tx_uuid", fetchall=True)
+    assert [(r["tx_uuid"], r["amount_cents"]) for r in rows] == [("t1", 199999), ("t2", 1234), ("t3", 10)]
+    assert rows[2]["tx_date"] == "2026-03-06" and rows[2]["year_month"] == 202603
+    columns = {r["name"] for r in query("PRAGMA table_info(transactions)", fetchall=True)}
+    assert "amount" not in columns
+    assert query("SELECT value FROM counters WHERE name = 'volume_cents'", fetchone=True)["value"] == 201243
+
+
+def test_balances_are_rekeyed(baseline):
+    rows = query(
+        "SELECT account_id, year_month, opening_cents, manual FROM balances ORDER BY account_id", fetchall=True
+    )
+    # the newer of two rows for a month wins; an unreadable month is dropped
+    assert rows == [
+        {"account_id": 1, "year_month": latest_year_month("March"), "opening_cents": 25025, "manual": 1},
+        {"account_id": 2, "year_month": latest_year_month("April"), "opening_cents": 4000, "manual": 1},
+    ]
@@ -0,0 +1,37 @@
+from decimal import Decimal
+import pytest
+from core.money import format_money, from_cents, to_cents, to_decimal
+
+
+@pytest.mark.parametrize("value, cents", [
+    (0.1 + 0.2, 30),            # float noise does not leak into the cents
+    (99.995, 10000),            # half-up, not the binary value 99.99499...
+    (-99.995, -10000),          # halves round away from zero for negatives too
+    (-0.005, -1),
+    (1.005, 101),
+    ("12.345", 1235),
+    (Decimal("19.999"), 2000),
+    (-42, -4200),
+    (0, 0),
+    (None, 0),
+    ("", 0),
+])
+def test_to_cents_rounds_half_up(value, cents):
+    assert to_cents(value) == cents
+
+
+def test_to_cents_rejects_text():
+    with pytest.raises(ValueError):
+        to_cents("twelve")
+
+
+def test_back_to_rupees():
+    assert from_cents(-1234) == -12.34
+    assert from_cents(None) == 0
+    assert to_decimal(-5) == Decimal("-0.05")
+    assert to_cents(to_decimal(123456789)) == 123456789
+
+
+@pytest.mark.parametrize("cents, text", [(123456, "₹1,234.56"), (-123456, "-₹1,234.56"), (5, "₹0.05"), (-5, "-₹0.05")])
+def test_format_money(cents, text):
+    assert format_money(cents) == text
@@ -0,0 +1,55 @@
+from datetime import date
+import pytest
+from core import auth, cache, database
+from core.accounts import add_account, get_accounts
+from core.reports import account_summary
+from core.transactions import add_transaction, fetch_transactions
+
+
+@pytest.fixture
+def accounts(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    cache.clear()
+    assert auth.create_user("alice", "pw")[0]
+    add_account("Bank", "Debit", user_id=1)
+    add_account("Card", "Credit", user_id=1)
+    bank, card = (a["id"] for a in sorted(get_accounts(1), key=lambda a: a["name"]))
+    add_transaction(date(2026, 3, 2), bank, "Salary", "pay", "Income", 1000, 1)
+    add_transaction(date(2026, 3, 5), bank, "Food", "lunch", "Expense", 15, 1)
+    add_transaction(date(2026, 3, 20), card, "Food", "dinner", "Expense", 40, 1)
+    yield bank, card
+    database.close_conn()
+
+
+def _flows(df):
+    return df.set_index("Account")[["Total Incoming (Payments)", "Total Spent", "Transactions"]].to_dict("index")
+
+
+@pytest.mark.parametrize("make_filters", [
+    lambda bank, card: {},
+    lambda bank, card: {"end_date": date(2026, 3, 10)},
+    lambda bank, card: {"start_date": date(2026, 3, 3), "types": ["Expense"]},
+    lambda bank, card: {"account_ids": [card]},
+])
+def test_summary_agrees_with_the_listing(accounts, make_filters):
+    filters = make_filters(*accounts)
+    summary = account_summary(1, 202603, **filters)
+    listing = fetch_transactions(user_id=1, month_filter="March", year=2026, **filters)
+    for account, row in _flows(summary).items():
+        rows = listing[listing["Account"] == account]
+        assert row["Total Incoming (Payments)"] == rows.loc[rows["Type"] == "Income", "Amount"].sum()
+        assert row["Total Spent"] == rows.loc[rows["Type"] == "Expense", "Amount"].sum()
+        assert row["Transactions"] == len(rows)
+    if "account_ids" in filters:
+        assert summary["Account"].tolist() == ["Card"]
+
+
+def test_whole_month_matches_the_totals_table(accounts):
+    whole = account_summary(1, 202603, start_date=date(2026, 3, 1), end_date=date(2026, 3, 31))
+    summed = account_summary(1, 202603, start_date=date(2026, 3, 1), end_date=date(2026, 3, 31), types=["Income", "Expense"])
+    assert _flows(whole) == _flows(summed) == {
+        "Bank": {"Total Incoming (Payments)": 1000.0, "Total Spent": 15.0, "Transactions": 2},
+        "Card": {"Total Incoming (Payments)": 0.0, "Total Spent": 40.0, "Transactions": 1},
+    }
@@ -0,0 +1,130 @@
+import csv
+import sqlite3
+from datetime import date
+import pytest
+from core import auth, cache, database
+from core.accounts import add_account, get_accounts
+from core.export import export_transactions
+from core.transactions import (
+    add_transaction, apply_changes, count_transactions, fetch_transactions, fetch_transactions_page, search,
+)
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    # three users, one per shard, each with a "Bank" account whose id is 1 in its own shard
+    monkeypatch.setattr(database, "SHARDS", 3)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    monkeypatch.setattr(database, "SHARD_DIR", str(tmp_path / "shards"))
+    database.init_db()
+    cache.clear()
+    for uid in (1, 2, 3):
+        assert auth.create_user(f"user{uid}", "pw")[0]
+        add_account(f"Bank{uid}", "Debit", user_id=uid)
+        add_transaction(date(2026, 3, uid), get_accounts(uid)[0]["id"], "Food", f"coffee {uid}", "Expense", 10, uid)
+    yield
+    database.close_conn()
+
+
+def test_admin_account_filter_stays_with_its_owner(shards, tmp_path, monkeypatch):
+    bank1 = get_accounts(1)[0]
+    assert [get_accounts(uid)[0]["id"] for uid in (1, 2, 3)] == [bank1["id"]] * 3
+    admin = dict(user_id=1, is_admin=True, account_ids=[(1, bank1["id"])])
+
+    assert fetch_transactions(**admin)["Description"].tolist() == ["coffee 1"]
+    assert count_transactions(**admin) == 1
+    df, _ = fetch_transactions_page(**admin)
+    assert df["Description"].tolist() == ["coffee 1"]
+    found, _ = search(1, "coffee", {"account_ids": admin["account_ids"]}, is_admin=True)
+    assert found["Description"].tolist() == ["coffee 1"]
+
+    monkeypatch.setattr("core.export.EXPORT_DIR", str(tmp_path / "exports"))
+    path = export_transactions("csv", 1, is_admin=True, all_users=True, account_ids=admin["account_ids"])
+    with open(path, newline="") as f:
+        assert [r["Description"] for r in csv.DictReader(f)] == ["coffee 1"]
+
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    cache.clear()
+    assert auth.create_user("alice", "pw")[0]
+    add_account("Bank", "Debit", user_id=1)
+    yield get_accounts(1)[0]["id"]
+    database.close_conn()
+
+
+def _walk(page_size, **filters):
+    pages, cursor = [], None
+    while True:
+        df, cursor = fetch_transactions_page(**filters, after=cursor, page_size=page_size)
+        pages.append(df["Description"].tolist())
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("rows, page_size, sizes", [(7, 3, [3, 3, 1]), (6, 3, [3, 3])])
+def test_pages_cover_ties_once(account, rows, page_size, sizes):
+    # most rows share a date, so the id half of the (tx_date, id) key decides
+    for i in range(rows):
+        add_transaction(date(2026, 3, 1 + i // 4), account, "Food", f"tx {i}", "Expense", 1, 1)
+    pages = _walk(page_size, user_id=1)
+    assert [len(p) for p in pages] == sizes
+    assert sum(pages, []) == fetch_transactions(user_id=1)["Description"].tolist()
+
+
+def test_admin_pages_merge_shards(shards):
+    for uid in (1, 2, 3):
+        for i in range(3):
+            add_transaction(date(2026, 3, 1 + i % 2), get_accounts(uid)[0]["id"], "Food", f"u{uid} {i}", "Expense", 1, uid)
+    pages = _walk(4, user_id=1, is_admin=True)
+    seen = sum(pages, [])
+    assert len(seen) == len(set(seen)) == count_transactions(user_id=1, is_admin=True) == 12
+    assert [len(p) for p in pages] == [4, 4, 4]
+    dates = fetch_transactions(user_id=1, is_admin=True).set_index("Description")["Date"]
+    assert dates[seen].is_monotonic_decreasing
+
+
+def _rows(user_id):
+    return fetch_transactions.uncached(user_id=user_id).set_index("Transaction_ID")[["Description", "Amount", "Type"]]
+
+
+@pytest.fixture
+def two_users(account):
+    assert auth.create_user("bob", "pw")[0]
+    add_account("Cash", "Debit", user_id=2)
+    add_transaction(date(2026, 3, 1), account, "Food", "alice lunch", "Expense", 10, 1)
+    add_transaction(date(2026, 3, 1), get_accounts(2)[0]["id"], "Food", "bob lunch", "Expense", 20, 2)
+    return _rows(1).index[0], _rows(2).index[0]
+
+
+def test_apply_changes_rejects_columns_outside_whitelist(two_users):
+    alice_tx, _ = two_users
+    with pytest.raises(ValueError, match="user_id"):
+        apply_changes(updates=[(alice_tx, {"description": "moved", "user_id": 2})], user_id=1)
+    assert _rows(1).loc[alice_tx, "Description"] == "alice lunch"
+
+
+def test_apply_changes_leaves_other_users_rows_alone(two_users, account):
+    alice_tx, bob_tx = two_users
+    apply_changes(updates=[(bob_tx, {"amount": 99})], deletes=[bob_tx], user_id=1)
+    assert _rows(2).loc[bob_tx, "Amount"] == 20
+
+    # an admin reaches the row by naming its owner
+    apply_changes(updates=[(bob_tx, {"amount": 99})], user_id=1, is_admin=True, owner_id=2)
+    assert _rows(2).loc[bob_tx, "Amount"] == 99
+
+
+def test_apply_changes_rolls_back_the_whole_batch(two_users, account):
+    alice_tx, _ = two_users
+    add_transaction(date(2026, 3, 2), account, "Food", "alice dinner", "Expense", 30, 1)
+    other_tx = _rows(1).index.difference([alice_tx])[0]
+    before = _rows(1)
+    bad = dict(date=date(2026, 3, 3), account_id=account, category="Food", description="new",
+               type="Refund", amount=5, user_id=1)
+    with pytest.raises(sqlite3.IntegrityError):
+        # inserts run last: the delete and the update are already done when the type CHECK fails
+        apply_changes(inserts=[bad], updates=[(alice_tx, {"description": "changed"})], deletes=[other_tx], user_id=1)
+    assert _rows(1).equals(before)
@@ -0,0 +1,58 @@
+import pytest
+from core import auth, database
+from core.database import query
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    yield
+    database.close_conn()
+
+
+def _counter(name):
+    return query("SELECT value FROM counters WHERE name = ?", (name,), fetchone=True)["value"]
+
+
+def _add_user(name):
+    assert auth.create_user(name, "pw")[0]
+    user_id = query("SELECT id FROM users WHERE username = ?", (name,), fetchone=True)["id"]
+    # the stats triggers keep a user_stats row once the user has activity
+    query(
+        "INSERT INTO transactions (tx_uuid, date, tx_date, year_month, type, amount_cents, user_id) "
+        "VALUES (?, '2026-03-01', '2026-03-01', 202603, 'Expense', 100, ?)",
+        (f"tx-{name}", user_id),
+        commit=True,
+    )
+    return user_id
+
+
+def test_delete_user_updates_counters(db):
+    _add_user("alice")
+    bob = _add_user("bob")
+    assert _counter("users") == 2
+
+    query("DELETE FROM transactions WHERE user_id = ?", (bob,), commit=True)
+    query("DELETE FROM users WHERE id = ?", (bob,), commit=True)
+
+    assert _counter("users") == 1
+    assert query("SELECT 1 FROM user_stats WHERE user_id = ?", (bob,), fetchone=True) is None
+
+
+def test_migration_repairs_released_trigger(db):
+    # a database migrated by the released migration 8 still has the broken trigger
+    conn = database.get_conn()
+    conn.execute("DROP TRIGGER trg_stats_users_delete")
+    conn.execute(
+        "CREATE TRIGGER trg_stats_users_delete AFTER DELETE ON users BEGIN "
+        "DELETE FROM user_stats WHERE user_id = OLD.user_id; END"
+    )
+    for stmt in database.MIGRATIONS[11]:  # migration 12
+        conn.execute(stmt)
+    conn.commit()
+
+    user_id = _add_user("carol")
+    query("DELETE FROM users WHERE id = ?", (user_id,), commit=True)
+    assert _counter("users") == 0
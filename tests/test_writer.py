@@ -0,0 +1,58 @@
+import threading
+import pytest
+from core import cache, database, writer
+from core.database import query
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SHARDS", 0)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "money_magic.db"))
+    database.init_db()
+    yield
+    database.close_conn()
+
+
+def _setting(key):
+    row = query("SELECT value FROM app_settings WHERE key = ?", (key,), fetchone=True)
+    return row and row["value"]
+
+
+def _put(key, fail=False):
+    query("INSERT INTO app_settings (key, value) VALUES (?, 'x')", (key,), commit=True)
+    if fail:
+        raise ValueError(key)
+    return key
+
+
+def test_failing_call_rolls_back_alone(db):
+    # hold the writer so the next three calls are queued together and share one group
+    started, release = threading.Event(), threading.Event()
+    blocker = writer.submit(lambda: started.set() or release.wait(5))
+    assert started.wait(5)
+    futures = [writer.submit(_put, "a"), writer.submit(_put, "b", fail=True), writer.submit(_put, "c")]
+    release.set()
+    blocker.result(5)
+
+    assert futures[0].result(5) == "a" and futures[2].result(5) == "c"
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert (_setting("a"), _setting("b"), _setting("c")) == ("x", None, "x")
+    assert writer.metrics()[database.DB_PATH]["largest_group"] >= 3
+
+
+def test_cache_is_invalidated_after_commit(db):
+    before = cache._user_versions.get(7, 0)
+    seen = []
+
+    @writer.queued
+    def write():
+        _put("k")
+        cache.bump(7)
+        # held until the group commits: readers must not cache pre-commit data under the new version
+        seen.append(cache._user_versions.get(7, 0))
+
+    write()
+    assert seen == [before]
+    assert cache._user_versions[7] == before + 1
+    assert _setting("k") == "x"
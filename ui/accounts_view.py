@@ -24,21 +24,24 @@ def show_accounts_view(user):
     st.markdown("**Existing accounts**")
     if accounts:
         for a in accounts:
+            # ids repeat across shards; the owner and id together name one account
+            key = f"{a['user_id']}_{a['id']}"
+            owner_args = dict(user_id=user["id"], is_admin=user.get("is_admin", 0), owner_id=a["user_id"])
             with st.expander(f"{a['name']} ({a['type']})"):
                 st.write(a.get('notes',''))
                 c1,c2,c3 = st.columns([2,1,1])
                 with c1:
-                    new_name = st.text_input(f"name_{a['id']}", value=a['name'])
+                    new_name = st.text_input(f"name_{a['id']}", value=a['name'], key=f"name_acc_{key}")
                 with c2:
-                    new_type = st.selectbox(f"type_{a['id']}", ["Debit","Credit"], index=0 if a['type']=="Debit" else 1)
+                    new_type = st.selectbox(f"type_{a['id']}", ["Debit","Credit"], index=0 if a['type']=="Debit" else 1, key=f"type_acc_{key}")
                 with c3:
-                    if st.button("Save", key=f"save_acc_{a['id']}"):
-                        update_account(a['id'], name=new_name.strip(), atype=new_type)
+                    if st.button("Save", key=f"save_acc_{key}"):
+                        update_account(a['id'], name=new_name.strip(), atype=new_type, **owner_args)
                         st.success("Saved")
                         st.rerun()
-                if st.button("Delete account", key=f"del_acc_{a['id']}"):
+                if st.button("Delete account", key=f"del_acc_{key}"):
                     try:
-                        delete_account(a['id'])
+                        delete_account(a['id'], **owner_args)
                         st.success("Deleted")
                         st.rerun()
                     except Exception as e:
@@ -1,6 +1,36 @@
-import streamlit as st
-from core.database import query
 import pandas as pd
+import streamlit as st
+from core import cache, profiling, startup, stats, writer
+from core.money import format_money
+
+
+def show_query_profile():
+    st.markdown("**Query profile**")
+    if not profiling.enabled:
+        st.caption("Profiling is off. Start the app with MONEY_MAGIC_PROFILE=1 to record query timings.")
+        return
+    snap = profiling.snapshot()
+    if snap["statements"]:
+        st.dataframe(
+            pd.DataFrame(snap["statements"]).drop(columns="histogram"),
+            use_container_width=True,
+        )
+    repeated = [r for r in snap["reruns"] if r["repeated"]]
+    if repeated:
+        st.markdown(f"Statements run {profiling.N_PLUS_ONE_CALLS}+ times in one rerun (likely N+1)")
+        st.dataframe(
+            pd.DataFrame([
+                {"rerun_started": pd.to_datetime(r["started_at"], unit="s"), "sql": sql, "calls": n}
+                for r in repeated for sql, n in r["repeated"].items()
+            ]),
+            use_container_width=True,
+        )
+    if snap["slow"]:
+        st.markdown(f"Slow queries (≥ {snap['slow_ms']:g} ms)")
+        for entry in reversed(snap["slow"]):
+            st.text(f"{entry['ms']:.1f} ms, {entry['rows']} rows: {entry['sql']}\n" + "\n".join(entry["plan"]))
+    st.download_button("Download profile (JSON)", profiling.dump(), "query_profile.json", "application/json")
+
 
 def admin_dashboard_button(user):
     cols = st.columns([1, 0.12])
@@ -9,14 +39,42 @@ def admin_dashboard_button(user):
             if st.button("⚙️ Admin Dashboard"):
                 # fallback to expander/modal hybrid for older versions
                 with st.expander("🧭 Admin Dashboard", expanded=True):
-                    users_count = query("SELECT COUNT(*) as c FROM users", fetchone=True)["c"]
-                    tx_count = query("SELECT COUNT(*) as c FROM transactions", fetchone=True)["c"]
-                    st.metric("Total users", users_count)
-                    st.metric("Total transactions", tx_count)
+                    counts = stats.totals()
+                    c1, c2, c3 = st.columns(3)
+                    c1.metric("Total users", counts.get("users", 0))
+                    c2.metric("Total transactions", counts.get("transactions", 0))
+                    c3.metric("Total volume", format_money(counts.get("volume_cents", 0)))
                     st.markdown("**Recent users**")
-                    recent = query(
-                        "SELECT username,display_name,email,is_admin,created_at "
-                        "FROM users ORDER BY created_at DESC LIMIT 10", fetchall=True)
-                    df = pd.DataFrame(recent) if recent else pd.DataFrame(
-                        columns=["username","display_name","email","is_admin","created_at"])
-                    st.dataframe(df, use_container_width=True)
+                    st.dataframe(stats.recent_users(), use_container_width=True)
+                    st.markdown("**User activity**")
+                    st.dataframe(stats.user_activity(), use_container_width=True)
+                    growth = stats.growth()
+                    if not growth.empty:
+                        st.markdown("**Growth**")
+                        g1, g2 = st.columns(2)
+                        g1.line_chart(growth[["Users"]])
+                        g2.bar_chart(growth[["Transactions"]])
+                    show_query_profile()
+                    st.markdown("**Startup**")
+                    timings = startup.report()
+                    st.dataframe(
+                        pd.DataFrame(
+                            [("since start", k, v) for k, v in timings["marks"].items()]
+                            + [("duration", k, v) for k, v in timings["phases"].items()],
+                            columns=["Kind", "Step", "ms"],
+                        ),
+                        use_container_width=True, hide_index=True,
+                    )
+                    st.markdown("**Read cache**")
+                    cache_stats = cache.stats()
+                    lookups = cache_stats["hits"] + cache_stats["misses"]
+                    k1, k2, k3, k4 = st.columns(4)
+                    k1.metric("Hits", cache_stats["hits"])
+                    k2.metric("Misses", cache_stats["misses"])
+                    k3.metric("Hit rate", f"{cache_stats['hits'] / lookups:.0%}" if lookups else "–")
+                    k4.metric("Entries", f"{cache_stats['entries']} ({cache_stats['bytes'] / 1024 / 1024:.1f} MB)")
+                    st.caption(f"{cache_stats['evictions']} evictions")
+                    write_metrics = writer.metrics()
+                    if write_metrics:
+                        st.markdown("**Write queue**")
+                        st.dataframe(pd.DataFrame(write_metrics).T, use_container_width=True)
@@ -1,7 +1,7 @@
 import streamlit as st
 from datetime import datetime
 from core.accounts import get_accounts
-from core.balances import get_opening, set_opening
+from core.balances import get_opening, set_opening, set_openings, roll_forward, previous_month
 from core.utils import MONTHS
 
 def show_balances_view(user):
@@ -10,14 +10,55 @@ def show_balances_view(user):
     if not accounts:
         st.info("Add accounts first.")
         return
+    now = datetime.now()
+    col1, col2 = st.columns(2)
+    sel_year = col1.selectbox("Year", list(range(now.year + 1, now.year - 10, -1)), index=1, key="balance_year")
+    sel_month = col2.selectbox("Select month", MONTHS, index=now.month-1, key="balance_month")
+    period = sel_year * 100 + MONTHS.index(sel_month) + 1
+    label = f"{sel_month} {sel_year}"
+
+    is_admin = user.get("is_admin", 0)
+    # ids repeat across shards, so an account is named by its owner and id
+    owned = lambda a: dict(user_id=user["id"], is_admin=is_admin, owner_id=a["user_id"])
+
     with st.expander("Show Balance Form"):
         with st.form("balance_form"):
-            sel_month = st.selectbox("Select month", MONTHS, index=datetime.now().month-1)
-            sel_account = st.selectbox("Select account", [a['name'] for a in accounts])
-            aid = next((a['id'] for a in accounts if a['name']==sel_account), None)
-            current = get_opening(sel_month, aid, user["id"], user.get("is_admin", 0))
-            new_opening = st.number_input(f"Opening for {sel_account} in {sel_month}", value=current, min_value=0.0, step=100.0, format="%.2f")
+            acc = st.selectbox("Select account", accounts, format_func=lambda a: a['name'])
+            current = get_opening(period, acc["id"], **owned(acc))
+            new_opening = st.number_input(f"Opening for {acc['name']} in {label}", value=current, step=100.0, format="%.2f")
             if st.form_submit_button("Save opening"):
-                set_opening(sel_month, aid, new_opening, user["id"])
+                set_opening(period, acc["id"], new_opening, **owned(acc))
                 st.success("Saved opening balance")
                 st.rerun()
+
+    with st.expander("All accounts for the month"):
+        with st.form("balance_bulk_form"):
+            loaded = {(a["user_id"], a["id"]): get_opening(period, a["id"], **owned(a)) for a in accounts}
+            openings = {
+                (a["user_id"], a["id"]): st.number_input(
+                    a["name"], value=loaded[(a["user_id"], a["id"])],
+                    step=100.0, format="%.2f", key=f"opening_{a['user_id']}_{a['id']}",
+                )
+                for a in accounts
+            }
+            if st.form_submit_button(f"Save openings for {label}"):
+                # only edited fields: an untouched one would pin its shown value
+                # (0 when unset, or a rolled opening) as set by hand
+                by_owner = {}
+                for (owner_id, account_id), opening in openings.items():
+                    if opening != loaded[(owner_id, account_id)]:
+                        by_owner.setdefault(owner_id, {})[account_id] = opening
+                for owner_id, owner_openings in by_owner.items():
+                    set_openings(period, owner_openings, user["id"], is_admin, owner_id)
+                changed = sum(len(o) for o in by_owner.values())
+                if changed:
+                    st.success(f"Saved {changed} opening balances")
+                    st.rerun()
+                else:
+                    st.info("No openings were changed")
+
+    prev = previous_month(period)
+    if st.button(f"Carry forward closings from {MONTHS[prev % 100 - 1]} {prev // 100}"):
+        written = roll_forward(prev, user_id=user["id"])
+        st.success(f"Carried forward {written} account balances (openings set by hand were kept)")
+        st.rerun()
@@ -0,0 +1,109 @@
+"""
+Chart building and PNG export shared by every session in the process.
+
+Figures are memoized on a fingerprint of their data and options, so a rerun
+with unchanged data reuses the figure already built. PNGs are rendered with
+kaleido only when asked for and kept in a bounded LRU keyed by the same
+fingerprint. Whether kaleido works is probed once per process.
+
+plotly is imported on the first chart rather than with this module, so
+sessions that never draw one do not pay for it.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+MAX_FIGURES = 128
+MAX_PNG_BYTES = 32 * 1024 * 1024
+
+_lock = threading.Lock()
+_probe_lock = threading.Lock()  # held only while kaleido is probed
+_kaleido_ok = None
+_figures = OrderedDict()
+_pngs = OrderedDict()
+_png_bytes = 0
+
+_BUILDERS = ("pie", "bar", "line")  # plotly.express functions figure() may call
+
+
+def _plotly():
+    import plotly.express as px
+    import plotly.io as pio
+    return px, pio
+
+
+def kaleido_available():
+    """
+    True if static image export works. The test render runs once per process,
+    under its own lock, so chart cache lookups never wait for it.
+    """
+    global _kaleido_ok
+    if _kaleido_ok is not None:
+        return _kaleido_ok
+    with _probe_lock:
+        if _kaleido_ok is None:
+            px, pio = _plotly()
+            try:
+                pio.to_image(px.line(), format="png")
+                ok = True
+            except Exception:
+                ok = False
+            with _lock:
+                _kaleido_ok = ok
+    return _kaleido_ok
+
+
+def fingerprint(kind, df, **opts):
+    h = hashlib.sha1(kind.encode())
+    h.update(repr(sorted(opts.items())).encode())
+    h.update(repr(list(df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def figure(kind, df, **opts):
+    """
+    Return (key, fig) for a plotly express chart of `kind` over `df`,
+    building it only if this data and these options have not been seen.
+    """
+    key = fingerprint(kind, df, **opts)
+    with _lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            _figures.move_to_end(key)
+            return key, fig
+    if kind not in _BUILDERS:
+        raise ValueError(f"Unknown chart kind: {kind}")
+    fig = getattr(_plotly()[0], kind)(df, **opts)
+    with _lock:
+        _figures[key] = fig
+        while len(_figures) > MAX_FIGURES:
+            _figures.popitem(last=False)
+    return key, fig
+
+
+def cached_png(key):
+    """PNG bytes already rendered for a figure key, or None."""
+    with _lock:
+        data = _pngs.get(key)
+        if data is not None:
+            _pngs.move_to_end(key)
+        return data
+
+
+def render_png(key, fig, scale=2):
+    """Render (or reuse) the PNG for a figure key. Returns None without kaleido."""
+    global _png_bytes
+    data = cached_png(key)
+    if data is not None or not kaleido_available():
+        return data
+    data = _plotly()[1].to_image(fig, format="png", scale=scale)
+    with _lock:
+        if key not in _pngs:
+            _pngs[key] = data
+            _png_bytes += len(data)
+        while _png_bytes > MAX_PNG_BYTES and len(_pngs) > 1:
+            _, evicted = _pngs.popitem(last=False)
+            _png_bytes -= len(evicted)
+    return data
@@ -1,11 +1,58 @@
 import streamlit as st
-from core.auth import create_user, verify_user, update_user_details, get_user_by_id
+import streamlit.components.v1 as components
+from core.auth import (
+    create_user, verify_user, update_user_details, get_user_by_id,
+    create_session, user_from_session, end_session, SESSION_TTL,
+)
+
+SESSION_COOKIE = "money_magic_session"
+
+
+def _set_cookie(token):
+    # Streamlit cannot set response headers, so a zero-height component writes
+    # the cookie from the page (which rules out HttpOnly). A token is only
+    # url-safe characters, dots and hex. None deletes the cookie.
+    max_age = SESSION_TTL if token else 0
+    with st.sidebar:
+        components.html(
+            "<script>window.parent.document.cookie = "
+            f"'{SESSION_COOKIE}={token or ''}; Max-Age={max_age}; Path=/; SameSite=Strict'"
+            " + (window.parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+            height=0,
+        )
+
+
+def _start_session(user_id):
+    token = create_session(user_id)
+    st.session_state.session_token = token
+    # written on the next run: a component rendered just before st.rerun() may never reach the page
+    st.session_state.cookie_update = token
+
 
 def sidebar_user_section():
     st.sidebar.header("👤 User")
     if "user" not in st.session_state:
         st.session_state.user = None
         st.session_state.logged_in = False
+        st.session_state.session_token = None
+        # Tokens used to travel in the URL, where history and logs keep them;
+        # one still found there is revoked and removed
+        if "session" in st.query_params:
+            end_session(st.query_params["session"])
+            del st.query_params["session"]
+        # a refresh starts a new Streamlit session; the signed token in the
+        # cookie restores the login without another password check
+        token = st.context.cookies.get(SESSION_COOKIE)
+        if token:
+            user = user_from_session(token)
+            if user:
+                st.session_state.user = user
+                st.session_state.logged_in = True
+                st.session_state.session_token = token
+            else:
+                st.session_state.cookie_update = ""
+    if "cookie_update" in st.session_state:
+        _set_cookie(st.session_state.pop("cookie_update") or None)
 
     if not st.session_state.logged_in:
         mode = st.sidebar.radio("Select", ["Login", "Register"])
@@ -38,6 +85,7 @@ def sidebar_user_section():
                     if ok:
                         st.session_state.user = info
                         st.session_state.logged_in = True
+                        _start_session(info["id"])
                         st.rerun()
                     else:
                         st.error(info)
@@ -46,6 +94,10 @@ def sidebar_user_section():
         user = st.session_state.user
         st.sidebar.write(f"Logged in as **{user.get('display_name') or user.get('username')}**")
         if st.sidebar.button("Logout"):
+            if st.session_state.get("session_token"):
+                end_session(st.session_state.session_token)
+            st.session_state.session_token = None
+            st.session_state.cookie_update = ""
             st.session_state.user = None
             st.session_state.logged_in = False
             st.rerun()
@@ -57,6 +109,10 @@ def sidebar_user_section():
             new_pw = st.text_input("New password (optional)", type="password")
             if st.form_submit_button("Save"):
                 update_user_details(user["id"], name, email, new_pw or None)
+                if new_pw:
+                    # changing the password ended every session, this one included
+                    _start_session(user["id"])
+                    _set_cookie(st.session_state.pop("cookie_update"))
                 st.success("Profile updated.")
                 st.session_state.user = get_user_by_id(user["id"])
         return st.session_state.user
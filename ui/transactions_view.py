@@ -2,19 +2,81 @@ import streamlit as st
 import pandas as pd
 from datetime import date, datetime
 from core.accounts import get_accounts
-from core.transactions import add_transaction, fetch_transactions, update_transaction_by_uuid, delete_transaction_by_uuid
+from core.transactions import add_transaction, fetch_transactions_page, count_transactions, apply_changes, search
 from core.database import query
-from core.balances import get_opening
+from core.reports import account_summary, category_totals
+from core.networth import networth_series
+from core import analytics
+from core.categories import get_categories, category_names, add_category
 from core.utils import MONTHS
 import io
-import plotly.express as px
-import plotly.io as pio
+import os
+from ui import charts
+
+PAGE_SIZES = [50, 100, 250, 500]
+
+# data_editor column -> transactions column for editable fields
+EDITOR_COLUMNS = {
+    "Date": "date",
+    "Amount": "amount",
+    "Category": "category",
+    "Description": "description",
+    "Type": "type",
+}
+
+
+def _editor_changes(editor_state, tx_df, accounts, user_id):
+    """
+    Turn the data_editor's edited/added/deleted rows into apply_changes()
+    arguments, so only rows the user actually touched are written. Returns
+    {owner_id: (inserts, updates, deletes)}: an admin's edits are split by
+    the rows' User_ID, since each owner's rows may live in another shard.
+    """
+    def _value(col, v):
+        if col == "Date":
+            return pd.to_datetime(v).date().isoformat()
+        if col == "Amount":
+            return float(v or 0.0)
+        return v
+
+    ids = tx_df["Transaction_ID"].astype(str).tolist()
+    owners = tx_df["User_ID"].astype(int).tolist()
+    batches = {}
+    batch = lambda owner_id: batches.setdefault(owner_id, ([], [], []))
+    deleted_rows = set(editor_state.get("deleted_rows", []))
+    for i in deleted_rows:
+        batch(owners[i])[2].append(ids[i])
+
+    for i, changes in editor_state.get("edited_rows", {}).items():
+        i = int(i)
+        if i in deleted_rows:
+            continue
+        fields = {EDITOR_COLUMNS[c]: _value(c, v) for c, v in changes.items() if c in EDITOR_COLUMNS}
+        if fields:
+            batch(owners[i])[1].append((ids[i], fields))
+
+    # new rows are the editing user's own, in one of their own accounts
+    own_accounts = [a for a in accounts if a['user_id'] == user_id]
+    for row in editor_state.get("added_rows", []):
+        acc_name = row.get("Account")
+        batch(user_id)[0].append({
+            "date": _value("Date", row.get("Date") or date.today()),
+            "account_id": next((a['id'] for a in own_accounts if a['name'] == acc_name), None),
+            "category": row.get("Category", ""),
+            "description": row.get("Description", ""),
+            "type": row.get("Type", "Expense"),
+            "amount": _value("Amount", row.get("Amount", 0.0)),
+            "user_id": user_id,
+        })
+    return batches
 
 
 def show_transactions_view(user):
     st.header("📜 Transactions")
     accounts = get_accounts(user["id"], user.get("is_admin", 0))
     account_names = [a['name'] for a in accounts]
+    categories = get_categories(user["id"])
+    all_category_names = category_names(user["id"])
 
     # Add Transaction
     with st.expander("➕ Add Transaction", expanded=False):
@@ -25,14 +87,7 @@ def show_transactions_view(user):
             else:
                 st.warning("No accounts — add one first.")
                 acc_choice = None
-            t_category = st.selectbox(
-                "Category",
-                [
-                    "Food", "Transport", "Bills", "Shopping", "Rent", "Salary",
-                    "Payment", "Investment", "Entertainment", "Health",
-                    "Education", "Other"
-                ],
-            )
+            t_category = st.selectbox("Category", all_category_names)
             t_description = st.text_input("Description", "")
             t_type = st.radio("Type", ["Expense", "Income"], horizontal=True)
             t_amount = st.number_input("Amount (₹)", min_value=0.0, step=10.0, format="%.2f")
@@ -47,6 +102,57 @@ def show_transactions_view(user):
                     st.success("Transaction added")
                     st.rerun()
 
+    # Import bank statement
+    with st.expander("📥 Import Statement", expanded=False):
+        with st.form("import_tx"):
+            upload = st.file_uploader("CSV or OFX/QFX statement", type=["csv", "ofx", "qfx"])
+            imp_account = st.selectbox("Account for rows without one", account_names) if account_names else None
+            dayfirst = st.checkbox("Dates are day-first (DD/MM/YYYY)")
+            if st.form_submit_button("Import"):
+                if upload is None or not imp_account:
+                    st.error("Choose a file and an account.")
+                else:
+                    from core.importer import import_file, detect_format
+                    bar = st.progress(0.0, text="Importing…")
+                    # file size is the only total known up front; rows are streamed
+                    total_size = max(upload.size, 1)
+                    try:
+                        stats = import_file(
+                            upload, user['id'], detect_format(upload.name), dayfirst=dayfirst,
+                            default_account_id=next(a['id'] for a in accounts if a['name'] == imp_account),
+                            on_progress=lambda s: bar.progress(
+                                min(upload.tell() / total_size, 1.0),
+                                text=f"{s['read']:,} rows read, {s['inserted']:,} added",
+                            ),
+                        )
+                        bar.progress(1.0, text="Done")
+                        st.success(
+                            f"Imported {stats['inserted']:,} transactions "
+                            f"({stats['duplicates']:,} duplicates, {stats['skipped']:,} unreadable rows skipped)"
+                        )
+                    except Exception as e:
+                        st.error(f"Import failed: {e}")
+
+    # Categories (one level of sub-categories)
+    with st.expander("🏷️ Categories", expanded=False):
+        with st.form("add_category"):
+            c_name = st.text_input("Category name")
+            c_parent = st.selectbox(
+                "Parent", ["(none)"] + [c['name'] for c in categories if c['parent_id'] is None]
+            )
+            if st.form_submit_button("Save category"):
+                try:
+                    add_category(user['id'], c_name, None if c_parent == "(none)" else c_parent)
+                    st.success("Category saved")
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+        if categories:
+            st.dataframe(
+                pd.DataFrame(categories)[["name", "parent"]].rename(columns={"name": "Category", "parent": "Parent"}),
+                use_container_width=True, hide_index=True,
+            )
+
     # Filters and listing
     current_month_index = datetime.now().month - 1
     selected_month = st.selectbox("Select Month", MONTHS, index=current_month_index, key="global_month_select")
@@ -62,15 +168,22 @@ def show_transactions_view(user):
             account_options = ["All"] + account_names
             account_filter = st.multiselect("Account", account_options, default=["All"])
             type_filter = st.multiselect("Type", ["All", "Expense", "Income"], default=["All"])
+            # category ids belong to one user, so the filter is only offered on one's own rows
+            category_filter = [] if user.get("is_admin") else st.multiselect(
+                "Category", [c['name'] for c in categories]
+            )
 
     account_ids = None
     if account_filter and "All" not in account_filter:
-        account_ids = [a['id'] for a in accounts if a['name'] in account_filter]
+        # by owner and id: ids repeat across shards
+        account_ids = [(a['user_id'], a['id']) for a in accounts if a['name'] in account_filter]
     types = None
     if type_filter and "All" not in type_filter:
         types = [t for t in type_filter if t != "All"]
 
-    tx_df = fetch_transactions(
+    category_ids = [c['id'] for c in categories if c['name'] in category_filter] or None
+
+    filters = dict(
         month_filter=selected_month,
         start_date=min_date,
         end_date=max_date,
@@ -78,62 +191,89 @@ def show_transactions_view(user):
         types=types,
         user_id=user["id"],
         is_admin=bool(user.get("is_admin")),
+        category_ids=category_ids,
     )
 
-    st.write(f"Showing {len(tx_df)} transactions")
+    # Full-text search across all dates; the account, type and category filters still apply
+    search_text = st.text_input("🔎 Search descriptions and categories", key="tx_search")
+    if search_text.strip():
+        search_filters = dict(account_ids=account_ids, types=types, category_ids=category_ids)
+        search_sig = (search_text, repr(sorted(search_filters.items())))
+        if st.session_state.get("tx_search_sig") != search_sig:
+            st.session_state.tx_search_sig = search_sig
+            st.session_state.tx_search_page = 0
+        search_page = st.session_state.tx_search_page
+        results, has_more = search(
+            user["id"], search_text, search_filters, bool(user.get("is_admin")), page=search_page
+        )
+        if results.empty:
+            st.info("No transactions match.")
+        else:
+            st.dataframe(results, use_container_width=True, hide_index=True)
+        s_prev, s_next, _ = st.columns([1, 1, 6])
+        with s_prev:
+            if st.button("◀ Prev results", disabled=search_page == 0):
+                st.session_state.tx_search_page -= 1
+                st.rerun()
+        with s_next:
+            if st.button("More results ▶", disabled=not has_more):
+                st.session_state.tx_search_page += 1
+                st.rerun()
+
+    total_count = count_transactions(**filters)
+
+    # Keyset paging: remember the cursor that starts each page, reset when filters change
+    filter_sig = repr(sorted(filters.items()))
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key="tx_page_size")
+    if st.session_state.get("tx_page_sig") != (filter_sig, page_size):
+        st.session_state.tx_page_sig = (filter_sig, page_size)
+        st.session_state.tx_page_cursors = [None]
+    cursors = st.session_state.tx_page_cursors
+    page_no = len(cursors) - 1
+
+    tx_df, next_cursor = fetch_transactions_page(**filters, after=cursors[-1], page_size=page_size)
+
+    first_row = page_no * page_size + 1 if len(tx_df) else 0
+    st.write(f"Showing {first_row}–{page_no * page_size + len(tx_df)} of {total_count} transactions")
+    nav_prev, nav_next, _ = st.columns([1, 1, 6])
+    with nav_prev:
+        if st.button("◀ Prev", disabled=page_no == 0):
+            cursors.pop()
+            st.rerun()
+    with nav_next:
+        if st.button("Next ▶", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+    editor_key = f"tx_editor_{page_no}"
 
     if not tx_df.empty:
-        # Convert Date column to datetime.date
-        if 'Date' in tx_df.columns:
-            tx_df['Date'] = pd.to_datetime(tx_df['Date'], errors='coerce').dt.date
+        # Categorical columns would render as fixed selectboxes; the page is small enough to widen
+        editor_df = tx_df.astype({"Account": object, "Category": object, "Type": object})
 
-        edited = st.data_editor(
-            tx_df,
+        st.data_editor(
+            editor_df,
             num_rows="dynamic",
             use_container_width=True,
             column_config={
                 "Date": st.column_config.DateColumn("Date", format="YYYY-MM-DD"),
                 "Account": st.column_config.Column("Account", disabled=True),
-                "Category": st.column_config.TextColumn("Category"),
+                "Category": st.column_config.SelectboxColumn(
+                    "Category",
+                    options=list(dict.fromkeys(all_category_names + editor_df["Category"].dropna().tolist())),
+                ),
                 "Description": st.column_config.TextColumn("Description"),
                 "Type": st.column_config.SelectboxColumn("Type", options=["Expense", "Income"]),
                 "Amount": st.column_config.NumberColumn("Amount", min_value=0.0, format="%.2f"),
                 "Transaction_ID": st.column_config.Column("Transaction_ID", disabled=True),
             },
-            key="tx_editor",
+            key=editor_key,
         )
         # Save edits
         if st.button("💾 Save edits"):
             try:
-                new_ids = set(edited["Transaction_ID"].astype(str).tolist())
-                old_ids = set(tx_df["Transaction_ID"].astype(str).tolist())
-                deleted = old_ids - new_ids
-                for did in deleted:
-                    delete_transaction_by_uuid(did)
-
-                for _, row in edited.iterrows():
-                    txid = str(row.get("Transaction_ID", "") or "")
-                    if not txid:
-                        acc_name = row.get("Account")
-                        aid = next((a['id'] for a in accounts if a['name'] == acc_name), None)
-                        add_transaction(
-                            pd.to_datetime(row["Date"]).date(),
-                            aid,
-                            row.get("Category", ""),
-                            row.get("Description", ""),
-                            row.get("Type", "Expense"),
-                            float(row.get("Amount", 0.0)),
-                            user['id'],
-                        )
-                    else:
-                        updates = {
-                            "date": pd.to_datetime(row["Date"]).date().isoformat(),
-                            "amount": float(row.get("Amount", 0.0)),
-                            "category": row.get("Category", ""),
-                            "description": row.get("Description", ""),
-                            "type": row.get("Type", "Expense"),
-                        }
-                        update_transaction_by_uuid(txid, updates)
+                batches = _editor_changes(st.session_state.get(editor_key, {}), tx_df, accounts, user['id'])
+                for owner_id, (inserts, updates, deletes) in batches.items():
+                    apply_changes(inserts, updates, deletes, user['id'], bool(user.get("is_admin")), owner_id)
                 st.success("Saved changes")
                 st.rerun()
             except Exception as e:
@@ -146,47 +286,22 @@ def show_transactions_view(user):
     st.markdown("---")
     st.subheader(f"💼 Account Summary for {selected_month}")
     top_balance_viewer = st.empty()
-    # Rebuild monthly data to include balances
-    summary_rows = []
-    debit_opening, credit_opening = 0.0, 0.0
-    total_income_summary, total_spent_summary = 0.0, 0.0
-
-    # Ensure we have the right columns
-    if not tx_df.empty and "Account" in tx_df.columns and "Type" in tx_df.columns:
-        for a in accounts:
-            acc = a["name"]
-            acc_type = a["type"]
-            # opening = float(get_opening(selected_month, a["id"]) or 0.0)
-            opening = float(get_opening(selected_month, a["id"], user["id"], user.get("is_admin", 0)))
-            acc_data = tx_df[tx_df["Account"] == acc]
-
-            # Compute totals
-            income = float(acc_data[acc_data["Type"] == "Income"]["Amount"].sum()) if not acc_data.empty else 0.0
-            expense = float(acc_data[acc_data["Type"] == "Expense"]["Amount"].sum()) if not acc_data.empty else 0.0
-
-            if acc_type == "Debit":
-                remaining = opening + income - expense
-                debit_opening += opening
-            else:  # Credit
-                remaining = opening + expense - income
-                credit_opening += opening
-
-            summary_rows.append({
-                "Account": acc,
-                "Type": acc_type,
-                "Opening Balance": opening,
-                "Total Incoming (Payments)": income,
-                "Total Spent": expense,
-                "Remaining Balance": remaining
-            })
-            total_income_summary += income
-            total_spent_summary += expense
+    # Openings, flows and remaining balance per account in one grouped query,
+    # under the same filters as the listing above
+    period = min_date.year * 100 + MONTHS.index(selected_month) + 1
+    summary_df = account_summary(
+        user["id"], period, bool(user.get("is_admin")), start_date=min_date, end_date=max_date,
+        account_ids=account_ids, types=types, category_ids=category_ids,
+    )
+    debit_opening = float(summary_df.loc[summary_df["Type"] == "Debit", "Opening Balance"].sum())
+    credit_opening = float(summary_df.loc[summary_df["Type"] != "Debit", "Opening Balance"].sum())
+    total_income_summary = float(summary_df["Total Incoming (Payments)"].sum())
+    total_spent_summary = float(summary_df["Total Spent"].sum())
 
     # Totals
     total_opening = debit_opening - credit_opening
     total_remaining = total_opening + total_income_summary - total_spent_summary
     try:
-        summary_df = pd.DataFrame(summary_rows)
         debit_df = summary_df[summary_df["Type"] == "Debit"]
         credit_df = summary_df[summary_df["Type"] == "Credit"]
 
@@ -260,71 +375,44 @@ def show_transactions_view(user):
         st.info("Please Add Transactions")
     
     # 🧩 2. ALL-MONTHS TOTAL BALANCE METRICS
-    # st.markdown("---")
-    # st.subheader("📅 Cumulative Balance (All Months)")
-
-    # try:
-    #     # fetch all data directly from DB
-    #     all_tx_rows = query("""
-    #         SELECT t.date as Date, a.name as Account, a.type as Type,
-    #             t.category as Category, t.description as Description,
-    #             t.type as TxType, t.amount as Amount
-    #         FROM transactions t
-    #         LEFT JOIN accounts a ON t.account_id = a.id
-    #     """, fetchall=True)
-    #     all_df = pd.DataFrame(all_tx_rows) if all_tx_rows else pd.DataFrame(
-    #         columns=["Date","Account","Type","Category","Description","TxType","Amount"]
-    #     )
-
-    #     all_balances_rows = query("""
-    #         SELECT b.month as Month, a.name as Account, a.type as Type, b.opening as Opening
-    #         FROM balances b
-    #         LEFT JOIN accounts a ON b.account_id = a.id
-    #     """, fetchall=True)
-    #     all_balances = pd.DataFrame(all_balances_rows) if all_balances_rows else pd.DataFrame(
-    #         columns=["Month","Account","Type","Opening"]
-    #     )
-
-    #     total_rows = []
-    #     for _, row in all_balances.iterrows():
-    #         acc = row["Account"]
-    #         acc_type = row["Type"]
-    #         opening = float(row.get("Opening", 0.0))
-    #         acc_data = all_df[all_df["Account"] == acc]
-    #         income = float(acc_data[acc_data["TxType"] == "Income"]["Amount"].sum()) if not acc_data.empty else 0.0
-    #         expense = float(acc_data[acc_data["TxType"] == "Expense"]["Amount"].sum()) if not acc_data.empty else 0.0
-    #         remaining = (opening + income - expense) if acc_type == "Debit" else (opening + expense - income)
-    #         total_rows.append({"Account": acc, "Type": acc_type, "Remaining": remaining})
-
-    #     total_df = pd.DataFrame(total_rows)
-    #     total_debit = total_df[total_df["Type"] == "Debit"]["Remaining"].sum() if not total_df.empty else 0.0
-    #     total_credit = total_df[total_df["Type"] == "Credit"]["Remaining"].sum() if not total_df.empty else 0.0
-    #     total_overall = total_debit - total_credit
-
-    #     colA, colB, colC = st.columns(3)
-    #     with colA:
-    #         st.metric("💼 Total Debit Balance", f"₹{total_debit:,.2f}")
-    #     with colB:
-    #         st.metric("💳 Total Credit Outstanding", f"₹{total_credit:,.2f}")
-    #     with colC:
-    #         st.metric(
-    #             "🧾 Net Worth (All Months)",
-    #             f"₹{total_overall:,.2f}",
-    #             delta=total_overall,
-    #             delta_color="normal" if total_overall >= 0 else "inverse",
-    #         )
-    # except Exception as e:
-    #     st.warning(f"⚠️ Unable to calculate total balance across all months: {e}")
+    st.markdown("---")
+    st.subheader("📅 Cumulative Balance (All Months)")
+
+    try:
+        nw_df = networth_series(user["id"])
+        total_debit, total_credit, total_overall = (
+            (float(nw_df["Debit"].iloc[-1]), float(nw_df["Credit"].iloc[-1]), float(nw_df["Net Worth"].iloc[-1]))
+            if not nw_df.empty else (0.0, 0.0, 0.0)
+        )
+
+        colA, colB, colC = st.columns(3)
+        with colA:
+            st.metric("💼 Total Debit Balance", f"₹{total_debit:,.2f}")
+        with colB:
+            st.metric("💳 Total Credit Outstanding", f"₹{total_credit:,.2f}")
+        with colC:
+            st.metric(
+                "🧾 Net Worth (All Months)",
+                f"₹{total_overall:,.2f}",
+                delta=total_overall,
+                delta_color="normal" if total_overall >= 0 else "inverse",
+            )
+        if len(nw_df) > 1:
+            chart_df = nw_df.copy()
+            chart_df.index = pd.to_datetime(chart_df.index.astype(str), format="%Y%m")
+            st.line_chart(chart_df)
+    except Exception as e:
+        st.warning(f"⚠️ Unable to calculate total balance across all months: {e}")
 
     # 🧩 3. MONTHLY METRICS
     st.markdown("---")
     st.subheader("📈 Monthly Metrics")
 
-    if not tx_df.empty and "Type" in tx_df.columns:
-        total_income = tx_df[tx_df["Type"] == "Income"]["Amount"].sum()
-        total_expense = tx_df[tx_df["Type"] == "Expense"]["Amount"].sum()
+    total_transactions = int(summary_df["Transactions"].sum())
+    if total_transactions:
+        total_income = total_income_summary
+        total_expense = total_spent_summary
         net_flow = total_income - total_expense
-        total_transactions = int(tx_df.shape[0])
 
         col_metrics1, col_metrics2, col_metrics3, col_metrics4 = st.columns(4)
         with col_metrics1:
@@ -341,42 +429,103 @@ def show_transactions_view(user):
     st.markdown("### Charts")
 
     # ---- Safe chart section ----
-    if not tx_df.empty and 'Type' in tx_df.columns and 'Amount' in tx_df.columns:
-        exp_df = tx_df[tx_df['Type'] == 'Expense']
-        if not exp_df.empty and exp_df['Amount'].sum() > 0 and 'Category' in exp_df.columns:
-            cat_sums = exp_df.groupby('Category')['Amount'].sum().reset_index()
-            fig1 = px.pie(cat_sums, values='Amount', names='Category',
-                          title=f'Expenses by Category ({selected_month})', hole=0.4)
+    # Charts read the same grouped month results as the summary above
+    cat_sums = category_totals(user["id"], period, "Expense", user.get("is_admin", 0))
+    inc_total = total_income_summary
+    exp_total = total_spent_summary
+    pngs = []  # (label, figure key, figure, file name) offered for PNG download
+    if total_transactions:
+        if not cat_sums.empty and cat_sums['Amount'].sum() > 0:
+            key1, fig1 = charts.figure('pie', cat_sums, values='Amount', names='Category',
+                                       title=f'Expenses by Category ({selected_month})', hole=0.4)
             st.plotly_chart(fig1, use_container_width=True)
+            pngs.append(('Download Expense-by-Category (PNG)', key1, fig1,
+                         f'expenses_by_category_{selected_month}.png'))
 
-        inc_total = tx_df[tx_df['Type'] == 'Income']['Amount'].sum() if 'Income' in tx_df['Type'].values else 0
-        exp_total = tx_df[tx_df['Type'] == 'Expense']['Amount'].sum() if 'Expense' in tx_df['Type'].values else 0
-
-        fig2 = px.bar(pd.DataFrame({'Type': ['Expense', 'Income'], 'Amount': [exp_total, inc_total]}),
-                      x='Type', y='Amount', text='Amount',
-                      title=f'Income vs Expense ({selected_month})')
+        key2, fig2 = charts.figure('bar', pd.DataFrame({'Type': ['Expense', 'Income'], 'Amount': [exp_total, inc_total]}),
+                                   x='Type', y='Amount', text='Amount',
+                                   title=f'Income vs Expense ({selected_month})')
         st.plotly_chart(fig2, use_container_width=True)
+        pngs.append(('Download Income-vs-Expense (PNG)', key2, fig2,
+                     f'income_vs_expense_{selected_month}.png'))
 
         if not summary_df.empty and 'Remaining' in summary_df.columns:
-            fig3 = px.bar(summary_df, x='Account', y='Remaining', color='Type',
-                          title=f'Account balances ({selected_month})', barmode='group')
+            _, fig3 = charts.figure('bar', summary_df, x='Account', y='Remaining', color='Type',
+                                    title=f'Account balances ({selected_month})', barmode='group')
             st.plotly_chart(fig3, use_container_width=True)
     else:
         st.info("No transactions to chart.")
 
+    # Multi-year trends, from the cached analytics cube
+    st.markdown('---')
+    st.subheader('📈 Trends')
+    tcols = st.columns(3)
+    with tcols[0]:
+        trend_by = st.selectbox("Group by", ["category", "account"], key="trend_by")
+    with tcols[1]:
+        trend_type = st.selectbox("Type", ["Expense", "Income"], key="trend_type")
+    with tcols[2]:
+        trend_window = st.selectbox("Rolling window (months)", [1, 3, 6, 12], index=1, key="trend_window")
+    names = {a['id']: a['name'] for a in accounts}
+    rename = (lambda df: df.rename(columns=names, index=names)) if trend_by == "account" else (lambda df: df)
+    trend = rename(analytics.rolling_average(user["id"], trend_window, trend_type, trend_by))
+    if trend.empty:
+        st.info("No transactions to show trends for.")
+    else:
+        st.line_chart(trend)
+        yoy_col, movers_col = st.columns(2)
+        with yoy_col:
+            st.markdown(f"#### Year over year ({selected_month})")
+            st.dataframe(rename(analytics.year_over_year(user["id"], period, trend_type, trend_by)),
+                         use_container_width=True)
+        with movers_col:
+            st.markdown(f"#### Top movers vs previous {trend_window} months")
+            st.dataframe(rename(analytics.top_movers(user["id"], period, 5, trend_window, trend_type, trend_by)),
+                         use_container_width=True)
+
 
     # Downloads
     st.markdown('---')
     st.header('⬇️ Downloads')
     try:
-        csv_buf = io.StringIO()
-        tx_df.to_csv(csv_buf, index=False)
-        st.download_button(
-            'Download filtered transactions (CSV)',
-            data=csv_buf.getvalue().encode('utf-8'),
-            file_name=f'filtered_transactions_{selected_month}.csv',
-            mime='text/csv',
-        )
+        # Transaction exports stream to a temp file on a worker, and only when asked for
+        from core.export import submit_export, available_formats, FORMATS as EXPORT_FORMATS
+        exp_cols = st.columns([1, 1.4, 1])
+        with exp_cols[0]:
+            exp_format = st.selectbox("Export format", available_formats(), key="tx_export_format")
+        with exp_cols[1]:
+            scopes = ["Current filters", "Full history"]
+            if user.get("is_admin"):
+                scopes.append("All users (full history)")
+            exp_scope = st.radio("Export scope", scopes, horizontal=True, key="tx_export_scope")
+        with exp_cols[2]:
+            if st.button("📤 Start export"):
+                st.session_state.tx_export = (exp_format, submit_export(
+                    exp_format, user["id"], is_admin=bool(user.get("is_admin")),
+                    # "Current filters" matches the listing, which spans all users for admins
+                    all_users=exp_scope.startswith("All users")
+                    or (exp_scope == "Current filters" and bool(user.get("is_admin"))),
+                    full_history=exp_scope != "Current filters",
+                    **{k: v for k, v in filters.items() if k not in ("user_id", "is_admin")},
+                ))
+        job = st.session_state.get("tx_export")
+        if job:
+            job_format, future = job
+            if not future.done():
+                st.info("Export running… it continues in the background.")
+                st.button("Check export")
+            elif future.exception():
+                st.warning(f"Export failed: {future.exception()}")
+            else:
+                path = future.result()
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        st.download_button(
+                            f"Download transactions ({job_format.upper()})",
+                            data=f,
+                            file_name=f"transactions_{selected_month}{EXPORT_FORMATS[job_format][1]}",
+                            mime=EXPORT_FORMATS[job_format][0],
+                        )
         summ_buf = io.StringIO()
         summary_df.to_csv(summ_buf, index=False)
         st.download_button(
@@ -385,32 +534,17 @@ def show_transactions_view(user):
             file_name=f'summary_{selected_month}.csv',
             mime='text/csv',
         )
-        can_image = True
-        try:
-            pio.to_image(px.line(), format='png')
-        except Exception:
-            can_image = False
-        if can_image and not tx_df.empty:
-            if not tx_df[tx_df['Type'] == 'Expense'].empty:
-                cat_sums = tx_df[tx_df['Type'] == 'Expense'].groupby('Category')['Amount'].sum().reset_index()
-                fig = px.pie(cat_sums, values='Amount', names='Category',
-                             title=f'Expenses by Category ({selected_month})', hole=0.4)
-                png = pio.to_image(fig, format='png', scale=2)
-                st.download_button(
-                    'Download Expense-by-Category (PNG)',
-                    data=png,
-                    file_name=f'expenses_by_category_{selected_month}.png',
-                    mime='image/png',
-                )
-            fig = px.bar(pd.DataFrame({'Type': ['Expense', 'Income'], 'Amount': [exp_total, inc_total]}),
-                         x='Type', y='Amount', text='Amount',
-                         title=f'Income vs Expense ({selected_month})')
-            png = pio.to_image(fig, format='png', scale=2)
-            st.download_button(
-                'Download Income-vs-Expense (PNG)',
-                data=png,
-                file_name=f'income_vs_expense_{selected_month}.png',
-                mime='image/png',
-            )
+        # PNGs are rendered only on request, then served from the shared cache
+        if pngs:
+            ready = [charts.cached_png(key) for _, key, _, _ in pngs]
+            if not all(ready) and st.button('🖼️ Prepare chart images (PNG)'):
+                if charts.kaleido_available():
+                    with st.spinner('Rendering charts…'):
+                        ready = [charts.render_png(key, fig) for _, key, fig, _ in pngs]
+                else:
+                    st.info('PNG export needs kaleido, which is not available here.')
+            for (label, _, _, file_name), png in zip(pngs, ready):
+                if png:
+                    st.download_button(label, data=png, file_name=file_name, mime='image/png')
     except Exception as e:
         st.warning(f"Download failed: {e}")